@@ -0,0 +1,242 @@
+"""Benchmarks the platform-wide analytics engine against per-user Python.
+
+By default no database is involved: ``--rows`` transactions (10 million)
+are generated in chunks with the seeder's skewed user distribution, and
+each chunk is fed both to the per-user Python path (a dict of per-user
+lists and running totals, as the per-user reports keep) and to the engine
+(reporting/analytics.py's ColumnBuilder). Loading and computing the
+daily-volume, top-users and percentiles reports are timed separately, and
+the results are checked against each other::
+
+    python analytics_bench.py
+    python analytics_bench.py --rows 1000000 --users 5000
+
+With ``--mongo-uri`` (or ``--mongo mongomock``) the stack is booted and
+seeded instead, and the analytics endpoints are timed against computing
+the same top-users report from ``/api/reports/transactions/<user_id>``
+for every user::
+
+    python analytics_bench.py --mongo-uri mongodb://localhost:27017/ --rows 10000000 --users 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from seed import seed, skewed_picker
+from stack import Stack, ROOT, SERVICES, _service_context
+
+CHUNK_ROWS = 100000
+DAYS = 90
+WINDOW = 7
+LIMIT = 10
+POINTS = (50.0, 90.0, 99.0)
+
+def _engine():
+    os.environ.setdefault("MONGODB_DB", "insta_pay_analytics")
+    with _service_context(os.path.join(ROOT, SERVICES["reporting"])):
+        from reporting import analytics
+    return analytics
+
+def chunks(rows, users, skew, seed_value):
+    """The same transactions on every call, as lists of documents"""
+    rng = random.Random(seed_value)
+    ids = [f"user-{i}" for i in range(users)]
+    pick = skewed_picker(ids, skew, rng)
+    start = datetime(2024, 1, 1)
+    step = DAYS * 86400000 / rows
+    made = 0
+    while made < rows:
+        size = min(CHUNK_ROWS, rows - made)
+        senders, receivers = pick(size), pick(size)
+        yield [{
+            "sender_id": senders[i],
+            "receiver_id": receivers[i],
+            "amount": float(rng.randint(1, 500)),
+            "timestamp": start + timedelta(milliseconds=int((made + i) * step))
+        } for i in range(size)]
+        made += size
+
+def _quantile(ordered, q):
+    """Linear interpolation, as Arrow's quantile does by default"""
+    position = q * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+class PythonReports:
+    """Per-user Python aggregation: one dict update per transaction"""
+
+    def __init__(self):
+        self.amounts = {}
+        self.days = {}
+        self.everything = []
+
+    def add(self, document):
+        amount = document["amount"]
+        self.amounts.setdefault(document["sender_id"], []).append(amount)
+        self.everything.append(amount)
+        day = self.days.setdefault(document["timestamp"].date(), [0, 0.0, set()])
+        day[0] += 1
+        day[1] += amount
+        day[2].add(document["sender_id"])
+
+    def daily_volume(self, window):
+        first, last = min(self.days), max(self.days)
+        rows, trailing = [], []
+        for index in range((last - first).days + 1):
+            date = first + timedelta(days=index)
+            count, volume, senders = self.days.get(date, (0, 0.0, ()))
+            trailing.append((count, volume))
+            trailing = trailing[-window:]
+            rows.append({
+                "date": date.isoformat(),
+                "transactions": count,
+                "volume": volume,
+                "senders": len(senders),
+                "rolling_transactions": sum(c for c, _ in trailing),
+                "rolling_volume": sum(v for _, v in trailing)
+            })
+        return rows
+
+    def top_users(self, limit):
+        totals = sorted(((-sum(amounts), user_id, len(amounts)) for user_id, amounts in self.amounts.items()))
+        return [{"user_id": user_id, "transactions": count, "volume": -volume}
+                for volume, user_id, count in totals[:limit]]
+
+    def percentiles(self, points, limit):
+        quantiles = [point / 100 for point in points]
+        ordered = sorted(self.everything)
+        platform = {"transactions": len(ordered)}
+        platform.update((f"p{point:g}", _quantile(ordered, q)) for point, q in zip(points, quantiles))
+        busiest = sorted(self.amounts.items(), key=lambda item: (-len(item[1]), item[0]))[:limit]
+        users = []
+        for user_id, amounts in busiest:
+            ordered = sorted(amounts)
+            row = {"user_id": user_id, "transactions": len(amounts)}
+            row.update((f"p{point:g}", _quantile(ordered, q)) for point, q in zip(points, quantiles))
+            users.append(row)
+        return {"platform": platform, "users": users}
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, round(time.perf_counter() - started, 3)
+
+def _close(a, b, tolerance):
+    return abs(a - b) <= tolerance * max(abs(a), abs(b), 1)
+
+def check(python, engine):
+    """Differences between the two sets of results"""
+    problems = []
+    if python["daily-volume"] != engine["daily-volume"]:
+        pairs = zip(python["daily-volume"], engine["daily-volume"])
+        if len(python["daily-volume"]) != len(engine["daily-volume"]) or any(
+            p["date"] != e["date"] or p["transactions"] != e["transactions"] or p["senders"] != e["senders"]
+            or not _close(p["volume"], e["volume"], 1e-9) or not _close(p["rolling_volume"], e["rolling_volume"], 1e-9)
+            for p, e in pairs
+        ):
+            problems.append("daily-volume differs")
+    if [u["user_id"] for u in python["top-users"]] != [u["user_id"] for u in engine["top-users"]]:
+        problems.append("top-users differs")
+    p, e = python["percentiles"], engine["percentiles"]
+    if any(not _close(p["platform"][k], e["platform"][k], 1e-9) for k in p["platform"]):
+        problems.append("platform percentiles differ")
+    if [u["user_id"] for u in p["users"]] != [u["user_id"] for u in e["users"]]:
+        problems.append("percentile users differ")
+    # Per-user percentiles come from t-digests, so they are approximate
+    worst = max((abs(pu[k] - eu[k]) / pu[k] for pu, eu in zip(p["users"], e["users"])
+                 for k in pu if k.startswith("p")), default=0.0)
+    return problems, worst
+
+def run_memory(args):
+    analytics = _engine()
+    python, builder = PythonReports(), analytics.ColumnBuilder(args.batch_rows)
+    python_load = engine_load = 0.0
+    for chunk in chunks(args.rows, args.users, args.skew, args.seed):
+        started = time.perf_counter()
+        for document in chunk:
+            python.add(document)
+        python_load += time.perf_counter() - started
+        started = time.perf_counter()
+        for document in chunk:
+            builder.add(document)
+        engine_load += time.perf_counter() - started
+    table, table_s = _timed(builder.table)
+
+    results = {"python": {}, "engine": {}}
+    timings = {
+        "load_s": {"python": round(python_load, 3), "engine": round(engine_load + table_s, 3)},
+        "python_s": {}, "engine_s": {}
+    }
+    for report, python_call, engine_call in (
+        ("daily-volume", lambda: python.daily_volume(WINDOW), lambda: analytics.daily_volume(table, WINDOW)),
+        ("top-users", lambda: python.top_users(LIMIT), lambda: analytics.top_users(table, "sent", LIMIT)),
+        ("percentiles", lambda: python.percentiles(POINTS, LIMIT),
+         lambda: analytics.percentiles(table, "sent", POINTS, limit=LIMIT))
+    ):
+        results["python"][report], timings["python_s"][report] = _timed(python_call)
+        results["engine"][report], timings["engine_s"][report] = _timed(engine_call)
+
+    problems, worst = check(results["python"], results["engine"])
+    timings["table_mb"] = round(table.nbytes / 2 ** 20, 1)
+    timings["tdigest_max_relative_error"] = round(worst, 6)
+    return timings, problems
+
+def run_service(args):
+    with Stack(args.mongo, args.mongo_uri, args.db) as stack:
+        users = [user["_id"] for user in seed(stack.db, args.users, args.rows, args.skew, days=DAYS)]
+        stack.run_tool("transactions", "compactor.py", "split")
+        session = requests.Session()
+        base = stack.url("reporting")
+        window = {"start_date": (datetime.utcnow() - timedelta(days=DAYS + 1)).isoformat()}
+        timings, bodies = {}, {}
+        for report in ("daily-volume", "top-users", "percentiles"):
+            started = time.perf_counter()
+            response = session.get(f"{base}/api/reports/analytics/{report}", params=window, timeout=None)
+            response.raise_for_status()
+            timings[report] = round(time.perf_counter() - started, 3)
+            bodies[report] = response.json()
+
+        # The same top-users report from every user's own transaction report
+        started = time.perf_counter()
+        sent = {}
+        for user_id in users:
+            report = session.get(f"{base}/api/reports/transactions/{user_id}", params=window, timeout=None).json()
+            sent[user_id] = sum(t["amount"] for t in report["transactions"] if t["sender_id"] == user_id)
+        per_user = sorted(sent, key=lambda user_id: (-sent[user_id], user_id))[:LIMIT]
+        timings["per_user_top_users"] = round(time.perf_counter() - started, 3)
+    problems = [] if per_user == [user["user_id"] for user in bodies["top-users"]["users"]] else ["top-users differs"]
+    return timings, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the analytics engine with per-user Python reports")
+    parser.add_argument("--mongo", choices=["memory", "mongod", "mongomock"], default="memory")
+    parser.add_argument("--mongo-uri", help="Benchmark through the services on this mongod")
+    parser.add_argument("--db", default="insta_pay_analytics", help="Database to seed (it is wiped)")
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-rows", type=int, default=50000, help="Rows per Arrow record batch (memory mode)")
+    args = parser.parse_args()
+    if args.mongo_uri and args.mongo == "memory":
+        args.mongo = "mongod"
+
+    if args.mongo == "memory":
+        timings, problems = run_memory(args)
+    else:
+        args.mongo_uri = args.mongo_uri or "mongodb://localhost:27017/"
+        timings, problems = run_service(args)
+    print(json.dumps({"mode": args.mongo, "rows": args.rows, "users": args.users, **timings}, indent=2))
+    for problem in problems:
+        print(f"MISMATCH: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
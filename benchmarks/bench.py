@@ -0,0 +1,451 @@
+"""Load-test the services and write the results as JSON.
+
+Boots the stack, seeds it, then runs each scenario for a fixed duration
+with a pool of client threads::
+
+    python bench.py --mongo mongomock --scenarios mix,transfer,report_summary
+    python bench.py --mongo-uri mongodb://localhost:27017/ --users 2000 --transactions 200000
+    python bench.py --mongo-uri mongodb://localhost:27017/ --server gunicorn
+    python bench.py --mongo-uri mongodb://localhost:27017/ --server gunicorn \
+        --scenarios hot_transfer,transfer --workers 1,2,4,8
+
+``--workers`` reruns the whole stack once per gunicorn worker count (results
+keyed ``hot_transfer/4w`` and so on), to see throughput as server workers
+scale rather than clients.
+
+``--server asgi`` serves the reporting service's async app (Quart and motor)
+on gunicorn's uvicorn workers instead of its Flask app; compare it with a
+``--server gunicorn`` run of the report scenarios::
+
+    python bench.py --mongo-uri mongodb://localhost:27017/ --server asgi \
+        --scenarios report_transactions,report_balance,report_summary,report_daily --scale 8,32
+
+``history_stream`` and ``history_buffered`` read one account's whole
+history, streamed as NDJSON and as a single JSON array, for an account
+seeded with each of ``--history-sizes`` transactions (results keyed
+``history_stream[10000]`` and so on), and also record time to first byte::
+
+    python bench.py --mongo-uri mongodb://localhost:27017/ --concurrency 1 \
+        --scenarios history_stream,history_buffered --history-sizes 10000,100000,1000000
+
+Every run writes ``results/<timestamp>-<commit>.json`` with p50/p95/p99
+latency, throughput, error counts, each service's peak RSS, Mongo op counts
+and calls between services per scenario; ``compare.py`` diffs two runs.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+
+from seed import seed, seed_history, skewed_picker, PASSWORD
+from stack import Stack, ROOT
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3) if values else 0.0,
+        "mean": round(sum(values) / len(values), 3) if values else 0.0
+    }
+
+class Recorder:
+    """Collects per-operation latencies from many client threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.first_byte = []
+
+    def record(self, operation, elapsed_ms, ok):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(elapsed_ms)
+            if not ok:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def timed(self, operation, session, method, url, ok_status=(200, 201), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=60, **kwargs)
+            ok = response.status_code in ok_status
+        except requests.RequestException:
+            response, ok = None, False
+        self.record(operation, (time.perf_counter() - start) * 1000, ok)
+        return response
+
+    def timed_stream(self, operation, session, url, **kwargs):
+        """Like timed(), reading the body in chunks and noting the first one"""
+        start = time.perf_counter()
+        first_byte = None
+        try:
+            with session.get(url, timeout=60, stream=True, **kwargs) as response:
+                for _ in response.iter_content(65536):
+                    if first_byte is None:
+                        first_byte = (time.perf_counter() - start) * 1000
+                ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        if first_byte is not None:
+            with self._lock:
+                self.first_byte.append(first_byte)
+        self.record(operation, (time.perf_counter() - start) * 1000, ok)
+
+class Workload:
+    """The seeded data plus one scenario function per operation mix"""
+
+    def __init__(self, stack, users, skew, window_days=30):
+        self.stack = stack
+        self.users = users
+        self.user_ids = [user["_id"] for user in users]
+        self.skew = skew
+        now = datetime.utcnow()
+        self.window = {
+            "start_date": (now - timedelta(days=window_days)).isoformat(),
+            "end_date": now.isoformat()
+        }
+        self.hot_user = self.user_ids[0]
+        # Set per run to one of the accounts seeded by seed_history
+        self.history_user = None
+
+    def picker(self, rng):
+        return skewed_picker(self.user_ids, self.skew, rng)
+
+    def signup(self, ctx):
+        ctx.recorder.timed("signup", ctx.session, "POST", self.stack.url("user") + "/api/signup/", json={
+            "name": "Bench Signup",
+            "email": f"signup-{uuid.uuid4().hex}@example.com",
+            "password": PASSWORD
+        })
+
+    def login(self, ctx):
+        user = ctx.rng.choice(self.users)
+        ctx.recorder.timed("login", ctx.session, "POST", self.stack.url("user") + "/api/login/",
+                           json={"email": user["email"], "password": PASSWORD})
+
+    def _pair(self, ctx):
+        sender, receiver = ctx.pick()[0], ctx.pick()[0]
+        while receiver == sender:
+            receiver = ctx.pick()[0]
+        return sender, receiver
+
+    def transfer(self, ctx):
+        sender, receiver = self._pair(ctx)
+        ctx.recorder.timed("transfer", ctx.session, "POST", self.stack.url("transactions") + "/api/transactions/",
+                           json={"sender_id": sender, "receiver_id": receiver, "amount": ctx.rng.randint(1, 5)})
+
+    def hot_transfer(self, ctx):
+        receiver = ctx.rng.choice(self.user_ids[1:])
+        ctx.recorder.timed("hot_transfer", ctx.session, "POST", self.stack.url("transactions") + "/api/transactions/",
+                           json={"sender_id": self.hot_user, "receiver_id": receiver, "amount": 1})
+
+    def transfer_batch(self, ctx, size=100):
+        transfers = []
+        for _ in range(size):
+            sender, receiver = self._pair(ctx)
+            transfers.append({"sender_id": sender, "receiver_id": receiver, "amount": ctx.rng.randint(1, 5)})
+        ctx.recorder.timed("transfer_batch", ctx.session, "POST",
+                           self.stack.url("transactions") + "/api/transactions/batch",
+                           ok_status=(200, 202), json={"transfers": transfers})
+
+    def async_transfer(self, ctx):
+        """Accept latency of a queued transfer, then its end-to-end latency"""
+        sender, receiver = self._pair(ctx)
+        start = time.perf_counter()
+        response = ctx.recorder.timed("async_accept", ctx.session, "POST",
+                                      self.stack.url("transactions") + "/api/transactions/",
+                                      ok_status=(202,), headers={"Prefer": "respond-async"},
+                                      json={"sender_id": sender, "receiver_id": receiver, "amount": 1})
+        if response is None or response.status_code != 202:
+            return
+        url = self.stack.url("transactions") + f"/api/transaction/{response.json()['_id']}"
+        status = "pending"
+        while status == "pending" and time.perf_counter() - start < 60:
+            time.sleep(0.01)
+            status = ctx.session.get(url, timeout=60).json().get("status")
+        ctx.recorder.record("async_end_to_end", (time.perf_counter() - start) * 1000, status == "completed")
+
+    def history(self, ctx):
+        user_id = ctx.pick()[0]
+        ctx.recorder.timed("history_page", ctx.session, "GET",
+                           self.stack.url("transactions") + f"/api/transactions/{user_id}/",
+                           params={"limit": 50})
+
+    def history_all(self, ctx):
+        user_id = ctx.pick()[0]
+        ctx.recorder.timed("history_all", ctx.session, "GET",
+                           self.stack.url("transactions") + f"/api/transactions/{user_id}/",
+                           params={"all": "true"})
+
+    def history_stream(self, ctx):
+        ctx.recorder.timed_stream("history_stream", ctx.session,
+                                  self.stack.url("transactions") + f"/api/transactions/{self.history_user}/",
+                                  params={"all": "true", "stream": "ndjson"})
+
+    def history_buffered(self, ctx):
+        ctx.recorder.timed_stream("history_buffered", ctx.session,
+                                  self.stack.url("transactions") + f"/api/transactions/{self.history_user}/",
+                                  params={"all": "true"})
+
+    def _report(self, ctx, kind):
+        user_id = ctx.pick()[0]
+        params = {} if kind == "summary" else self.window
+        ctx.recorder.timed(f"report_{kind}", ctx.session, "GET",
+                           self.stack.url("reporting") + f"/api/reports/{kind}/{user_id}", params=params)
+
+    def report_transactions(self, ctx):
+        self._report(ctx, "transactions")
+
+    def report_balance(self, ctx):
+        self._report(ctx, "balance")
+
+    def report_summary(self, ctx):
+        self._report(ctx, "summary")
+
+    def report_daily(self, ctx):
+        self._report(ctx, "daily")
+
+    MIX = (
+        ("login", 5),
+        ("transfer", 30),
+        ("history", 30),
+        ("report_summary", 15),
+        ("report_transactions", 10),
+        ("report_balance", 5),
+        ("report_daily", 5)
+    )
+
+    def mix(self, ctx):
+        names, weights = zip(*self.MIX)
+        getattr(self, ctx.rng.choices(names, weights=weights)[0])(ctx)
+
+SCENARIOS = (
+    "mix", "signup", "login", "transfer", "transfer_batch", "async_transfer",
+    "history", "history_all", "report_transactions", "report_balance",
+    "report_summary", "report_daily", "hot_transfer", "history_stream", "history_buffered"
+)
+
+# Scenarios run once per --history-sizes entry
+SIZED_SCENARIOS = ("history_stream", "history_buffered")
+
+class Context:
+    def __init__(self, workload, recorder, seed_value):
+        self.rng = random.Random(seed_value)
+        self.pick = workload.picker(self.rng)
+        self.session = requests.Session()
+        self.recorder = recorder
+
+def run_scenario(stack, workload, name, concurrency, duration):
+    recorder = Recorder()
+    operation = getattr(workload, name)
+    ops_before = stack.mongo_ops()
+    calls_before = stack.upstream_calls()
+    stack.reset_peak_rss()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        ctx = Context(workload, recorder, index)
+        while time.perf_counter() < deadline:
+            operation(ctx)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    peak_rss_kib = stack.peak_rss_kib()
+    ops_after = stack.mongo_ops()
+    calls_after = stack.upstream_calls()
+    upstream_calls = {
+        label: count - calls_before.get(label, 0)
+        for label, count in calls_after.items()
+        if count - calls_before.get(label, 0)
+    }
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    result = {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": len(all_latencies),
+        "errors": sum(recorder.errors.values()),
+        "throughput_rps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(all_latencies),
+        "operations": {
+            operation: {
+                "requests": len(values),
+                "errors": recorder.errors.get(operation, 0),
+                "latency_ms": summarize(values)
+            }
+            for operation, values in recorder.latencies.items()
+        },
+        "mongo_ops": {
+            op: ops_after.get(op, 0) - ops_before.get(op, 0)
+            for op in ops_after
+            if ops_after.get(op, 0) - ops_before.get(op, 0)
+        },
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_request": (
+            round(sum(upstream_calls.values()) / len(all_latencies), 3) if all_latencies else 0.0
+        ),
+        "peak_rss_kib": peak_rss_kib
+    }
+    if recorder.first_byte:
+        result["first_byte_ms"] = summarize(recorder.first_byte)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_stack(stack, args, scenarios, levels, history_sizes, results, suffix=""):
+    """Seed a started stack and run every scenario on it into ``results``"""
+    users = seed(stack.db, args.users, args.transactions, args.skew, legacy=args.legacy)
+    history_users = {size: seed_history(stack.db, size) for size in history_sizes}
+    if args.migrate:
+        stack.run_tool("transactions", "migrate.py", "run")
+    if not args.unsplit:
+        stack.run_tool("transactions", "compactor.py", "split")
+    if args.archive_after is not None:
+        stack.run_tool("transactions", "compactor.py", "archive",
+                       "--after-months", str(args.archive_after), "--grace", "0")
+    stack.run_tool("transactions", "stats.py", "rebuild")
+    stack.run_tool("transactions", "checkpoints.py", "compact")
+    workload = Workload(stack, users, args.skew)
+    runs = []
+    for name in scenarios:
+        if name in SIZED_SCENARIOS:
+            runs += [(f"{name}[{size}]", name, size) for size in history_sizes]
+        else:
+            runs.append((name, name, None))
+    for label, name, size in runs:
+        workload.history_user = history_users.get(size)
+        for level in levels:
+            key = (label if len(levels) == 1 else f"{label}@{level}") + suffix
+            results[key] = run_scenario(stack, workload, name, level, args.duration)
+            summary = results[key]
+            first_byte = f"  ttfb p50 {summary['first_byte_ms']['p50']:.1f} ms" if "first_byte_ms" in summary else ""
+            peak = summary["peak_rss_kib"].get("transactions")
+            print(f"{key:28} {summary['throughput_rps']:>9.1f} req/s  "
+                  f"p50 {summary['latency_ms']['p50']:>8.1f}  p95 {summary['latency_ms']['p95']:>8.1f}  "
+                  f"p99 {summary['latency_ms']['p99']:>8.1f} ms  errors {summary['errors']}  "
+                  f"calls/req {summary['upstream_calls_per_request']:.2f}"
+                  + first_byte + (f"  transactions rss {peak / 1024:.0f} MiB" if peak else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transfer, history and report paths")
+    parser.add_argument("--mongo", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--server", choices=["dev", "gunicorn", "asgi"], default="dev",
+                        help="Serve each app with app.run or gunicorn (needs a real mongod); "
+                             "asgi runs the reporting service's async app on uvicorn")
+    parser.add_argument("--db", default="insta_pay_bench", help="Database to seed (it is wiped)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for picking accounts")
+    parser.add_argument("--legacy", type=float, default=0.0,
+                        help="Fraction of transactions seeded with string timestamps and double amounts")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Run migrate.py after seeding, before the scenarios")
+    parser.add_argument("--unsplit", action="store_true",
+                        help="Leave the seeded history in the legacy collection instead of monthly partitions")
+    parser.add_argument("--archive-after", type=int, metavar="MONTHS",
+                        help="Archive seeded months older than this to Arrow files before the scenarios")
+    parser.add_argument("--scenarios", default="mix",
+                        help=f"Comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scale", default="",
+                        help="Comma-separated client counts; runs every scenario at each")
+    parser.add_argument("--workers", default="",
+                        help="Comma-separated gunicorn worker counts; reruns the stack with each (--server gunicorn)")
+    parser.add_argument("--history-sizes", default="10000,100000,1000000",
+                        help="Comma-separated history lengths for the history_stream and history_buffered scenarios")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra service settings, e.g. --env ASYNC_TRANSFERS=1")
+    parser.add_argument("--out", help="Result file (default: results/<timestamp>-<commit>.json)")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.scale.split(",") if level] or [args.concurrency]
+    history_sizes = [int(size) for size in args.history_sizes.split(",") if size]
+    if not set(scenarios) & set(SIZED_SCENARIOS):
+        history_sizes = []
+    service_env = dict(item.split("=", 1) for item in args.env)
+
+    if args.mongo == "mongomock" and args.server == "gunicorn":
+        parser.error("--server gunicorn needs a real mongod")
+
+    worker_counts = [int(count) for count in args.workers.split(",") if count]
+    if worker_counts and (args.server == "dev" or args.mongo == "mongomock"):
+        parser.error("--workers needs --server gunicorn or asgi and a real mongod")
+
+    results, startup = {}, {}
+    for workers in worker_counts or [None]:
+        env = dict(service_env)
+        suffix = ""
+        if workers:
+            env["GUNICORN_WORKERS"] = str(workers)
+            suffix = f"/{workers}w"
+        stack = Stack(args.mongo, args.mongo_uri, args.db, env=env, server=args.server)
+        with stack:
+            run_stack(stack, args, scenarios, levels, history_sizes, results, suffix)
+        startup[workers or args.server] = stack.startup_seconds
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": args.mongo,
+            "server": args.server,
+            "startup_s": startup if worker_counts else startup[args.server],
+            "workers": worker_counts,
+            "users": args.users,
+            "transactions": args.transactions,
+            "skew": args.skew,
+            "legacy": args.legacy,
+            "migrated": args.migrate,
+            "split": not args.unsplit,
+            "archive_after": args.archive_after,
+            "duration_s": args.duration,
+            "history_sizes": history_sizes,
+            "env": service_env
+        },
+        "scenarios": results
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{commit}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare two benchmark result files.
+
+    python compare.py results/before.json results/after.json [--threshold 10]
+
+Prints throughput and latency changes per scenario and exits non-zero when
+any shared scenario got slower (p95 or p99) or lost throughput by more than
+``--threshold`` percent.
+"""
+import argparse
+import json
+import sys
+
+def change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two benchmark runs")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Percent change that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)["scenarios"]
+    with open(args.after) as f:
+        after = json.load(f)["scenarios"]
+
+    regressions = []
+    print(f"{'scenario':28} {'req/s':>18} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'calls/req':>14}")
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        throughput = change(old["throughput_rps"], new["throughput_rps"])
+        cells = [f"{new['throughput_rps']:>9.1f} {throughput:>+7.1f}%"]
+        for metric in ("p50", "p95", "p99"):
+            delta = change(old["latency_ms"][metric], new["latency_ms"][metric])
+            cells.append(f"{new['latency_ms'][metric]:>9.1f} {delta:>+7.1f}%")
+            if metric != "p50" and delta > args.threshold:
+                regressions.append(f"{name} {metric} {delta:+.1f}%")
+        if throughput < -args.threshold:
+            regressions.append(f"{name} throughput {throughput:+.1f}%")
+        if "upstream_calls_per_request" in old and "upstream_calls_per_request" in new:
+            cells.append(f"{old['upstream_calls_per_request']:>6.2f} -> {new['upstream_calls_per_request']:.2f}")
+        print(f"{name:28} " + " ".join(cells))
+
+    for name in sorted(set(before) ^ set(after)):
+        print(f"{name:28} only in {'before' if name in before else 'after'}")
+
+    if regressions:
+        print("\nRegressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Checks the reporting service's live event feed end to end.
+
+Change streams need a replica set; a single-node one is enough::
+
+    docker run -d --name mongo-rs -p 27017:27017 mongo:7 --replSet rs0
+    docker exec mongo-rs mongosh --quiet --eval 'rs.initiate()'
+    python event_feed.py --mongo-uri "mongodb://localhost:27017/?replicaSet=rs0&directConnection=true"
+
+Opens one event stream per user, makes transfers between them and waits for
+each transfer's ``transaction`` event on both sides. Prints the delivery
+latency, from sending a transfer to its event, checks each user's last
+pushed balance against the stored one, and exits non-zero if anything is
+missing.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from bench import summarize
+from seed import seed
+from stack import Stack
+
+class EventReader(threading.Thread):
+    """Reads one user's SSE stream and timestamps every event"""
+
+    def __init__(self, url, user_id):
+        super().__init__(name=f"events-{user_id}", daemon=True)
+        self.url = url
+        self.user_id = user_id
+        self.ready = threading.Event()
+        self.transactions = {}
+        self.balance = None
+        self._response = None
+
+    def run(self):
+        self._response = requests.get(self.url, stream=True, timeout=(5, None))
+        self._response.raise_for_status()
+        event_type, data = None, []
+        for line in self._response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event_type = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].strip())
+            elif not line and event_type:
+                self._handle(event_type, json.loads("".join(data)))
+                event_type, data = None, []
+
+    def _handle(self, event_type, data):
+        if event_type == "transaction":
+            self.transactions[data["_id"]] = time.perf_counter()
+        elif event_type in ("balance", "snapshot"):
+            self.balance = data["balance"]
+        if event_type == "snapshot":
+            self.ready.set()
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify change-stream events reach SSE subscribers")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/?replicaSet=rs0&directConnection=true")
+    parser.add_argument("--db", default="insta_pay_events", help="Database to seed (it is wiped)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--transfers", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for the last events")
+    args = parser.parse_args()
+
+    env = {"EVENTS_MAX_THREAD_STREAMS": str(args.users)}
+    with Stack("mongod", args.mongo_uri, args.db, env=env) as stack:
+        users = [user["_id"] for user in seed(stack.db, args.users, 0)]
+        readers = [EventReader(stack.url("reporting") + f"/api/reports/events/{user_id}", user_id) for user_id in users]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            if not reader.ready.wait(30):
+                sys.exit(f"No snapshot on the stream for {reader.user_id}")
+        by_user = {reader.user_id: reader for reader in readers}
+
+        rng = random.Random(7)
+        session = requests.Session()
+        sent = []
+        for _ in range(args.transfers):
+            sender, receiver = rng.sample(users, 2)
+            started = time.perf_counter()
+            response = session.post(stack.url("transactions") + "/api/transactions/",
+                                    json={"sender_id": sender, "receiver_id": receiver, "amount": 1})
+            if response.status_code == 201:
+                sent.append((response.json()["_id"], sender, receiver, started))
+
+        deadline = time.time() + args.timeout
+        expected = [(tx_id, user_id, at) for tx_id, sender, receiver, at in sent for user_id in (sender, receiver)]
+        while time.time() < deadline and any(tx_id not in by_user[user_id].transactions for tx_id, user_id, _ in expected):
+            time.sleep(0.05)
+        # Balance events trail their transactions by a commit or two
+        time.sleep(1)
+
+        latencies = [
+            (by_user[user_id].transactions[tx_id] - at) * 1000
+            for tx_id, user_id, at in expected if tx_id in by_user[user_id].transactions
+        ]
+        missing = len(expected) - len(latencies)
+        stored = {user["_id"]: user["balance"] for user in stack.db.users.find({}, {"balance": 1})}
+        stale = [user_id for user_id in users if by_user[user_id].balance != stored[user_id]]
+        stats = requests.get(stack.url("reporting") + "/api/internal/event-stats").json()
+        for reader in readers:
+            reader.close()
+
+    print(f"transfers {len(sent)}  events expected {len(expected)}  missing {missing}  stale balances {len(stale)}")
+    print(f"delivery ms {summarize(latencies)}")
+    print(f"feed {stats}")
+    sys.exit(1 if missing or stale else 0)
+
+if __name__ == "__main__":
+    main()
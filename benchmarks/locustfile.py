@@ -0,0 +1,69 @@
+"""Locust version of the ``mix`` scenario, for a stack that is already running.
+
+    USER_SERVICE_URL=http://localhost:5000 \\
+    TRANSACTION_SERVICE_URL=http://localhost:5001 \\
+    REPORTING_SERVICE_URL=http://localhost:5002 \\
+    locust -f locustfile.py --headless -u 50 -r 10 -t 2m --csv results/locust
+
+Each simulated user signs up once, then logs in, transfers to the other
+simulated users, and reads its history and reports.
+"""
+import os
+import random
+import uuid
+
+from locust import HttpUser, task, between
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:5000")
+TRANSACTION_SERVICE_URL = os.getenv("TRANSACTION_SERVICE_URL", "http://localhost:5001")
+REPORTING_SERVICE_URL = os.getenv("REPORTING_SERVICE_URL", "http://localhost:5002")
+PASSWORD = "benchmark-password"
+
+account_ids = []
+
+class InstaPayUser(HttpUser):
+    host = USER_SERVICE_URL
+    wait_time = between(0.05, 0.5)
+
+    def on_start(self):
+        self.email = f"locust-{uuid.uuid4().hex}@example.com"
+        response = self.client.post("/api/signup/", name="signup",
+                                    json={"name": "Locust", "email": self.email, "password": PASSWORD})
+        self.user_id = response.json().get("_id")
+        if self.user_id:
+            account_ids.append(self.user_id)
+
+    @task(5)
+    def login(self):
+        self.client.post("/api/login/", name="login", json={"email": self.email, "password": PASSWORD})
+
+    @task(30)
+    def transfer(self):
+        others = [account for account in account_ids if account != self.user_id]
+        if not others:
+            return
+        self.client.post(f"{TRANSACTION_SERVICE_URL}/api/transactions/", name="transfer", json={
+            "sender_id": self.user_id,
+            "receiver_id": random.choice(others),
+            "amount": random.randint(1, 5)
+        })
+
+    @task(30)
+    def history(self):
+        self.client.get(f"{TRANSACTION_SERVICE_URL}/api/transactions/{self.user_id}/?limit=50", name="history_page")
+
+    @task(15)
+    def report_summary(self):
+        self.client.get(f"{REPORTING_SERVICE_URL}/api/reports/summary/{self.user_id}", name="report_summary")
+
+    @task(10)
+    def report_transactions(self):
+        self.client.get(f"{REPORTING_SERVICE_URL}/api/reports/transactions/{self.user_id}", name="report_transactions")
+
+    @task(5)
+    def report_balance(self):
+        self.client.get(f"{REPORTING_SERVICE_URL}/api/reports/balance/{self.user_id}", name="report_balance")
+
+    @task(5)
+    def report_daily(self):
+        self.client.get(f"{REPORTING_SERVICE_URL}/api/reports/daily/{self.user_id}", name="report_daily")
@@ -0,0 +1,141 @@
+"""Seeds a benchmark database with users and a skewed transaction history.
+
+Senders and receivers are drawn from a Zipf-like distribution, so a few
+accounts carry most of the traffic the way real payment data does, and
+timestamps are spread over the last ``days`` days. Balances are set so
+that they agree with the seeded history, which keeps balance reports and
+checkpoints consistent. A ``legacy`` fraction of the transactions is
+written the old way, with ISO-string timestamps and double amounts, as a
+database awaiting ``migrate.py`` would hold them. Everything is written to
+the legacy ``transactions`` collection, as before partitioning by month;
+``compactor.py split`` moves it into the monthly partitions.
+
+``seed_history`` adds one more account with a history of an exact size,
+for measuring responses that grow with it.
+"""
+import random
+import re
+import uuid
+from datetime import datetime, timedelta
+from bson.decimal128 import Decimal128
+from passlib.hash import pbkdf2_sha256
+
+PASSWORD = "benchmark-password"
+INITIAL_BALANCE = 1000000.0
+INSERT_BATCH = 5000
+PARTITION_NAME = re.compile(r"^transactions_\d{4}_\d{2}$")
+
+def skewed_picker(population, skew, rng):
+    """Return a function picking from population with weight 1 / rank ** skew"""
+    weights = [1.0 / (rank ** skew) for rank in range(1, len(population) + 1)]
+    def pick(k=1):
+        return rng.choices(population, weights=weights, k=k)
+    return pick
+
+def seed(db, users=200, transactions=5000, skew=1.1, days=90, seed_value=42, legacy=0.0):
+    """Replace the users and transactions collections with generated data.
+
+    Returns the seeded users as dicts with ``_id`` and ``email``; all share
+    ``PASSWORD``.
+    """
+    rng = random.Random(seed_value)
+    for name in ("users", "transactions", "user_stats", "user_daily_stats",
+                 "balance_checkpoints", "transfer_outbox", "idempotency_keys",
+                 "sessions", "applied_transfers", "migrations",
+                 "event_feed_checkpoints", "transaction_archives"):
+        db[name].delete_many({})
+    for name in db.list_collection_names():
+        if PARTITION_NAME.match(name):
+            db[name].drop()
+
+    password_hash = pbkdf2_sha256.hash(PASSWORD)
+    run = uuid.uuid4().hex[:8]
+    seeded = [{
+        "_id": uuid.uuid4().hex,
+        "name": f"Bench User {i}",
+        "email": f"bench-{run}-{i}@example.com",
+        "password": password_hash,
+        "balance": INITIAL_BALANCE
+    } for i in range(users)]
+    balances = {user["_id"]: INITIAL_BALANCE for user in seeded}
+    pick = skewed_picker([user["_id"] for user in seeded], skew, rng)
+
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    span = (now - start).total_seconds()
+    offsets = sorted(rng.random() * span for _ in range(transactions))
+    batch = []
+    for offset in offsets:
+        sender, receiver = pick()[0], pick()[0]
+        while receiver == sender:
+            receiver = pick()[0]
+        amount = float(rng.randint(1, 500))
+        balances[sender] -= amount
+        balances[receiver] += amount
+        timestamp = start + timedelta(milliseconds=int(offset * 1000))
+        if rng.random() < legacy:
+            timestamp, stored_amount = timestamp.isoformat(), amount
+        else:
+            stored_amount = Decimal128(str(amount))
+        batch.append({
+            "_id": uuid.uuid4().hex,
+            "sender_id": sender,
+            "receiver_id": receiver,
+            "amount": stored_amount,
+            "description": "benchmark",
+            "timestamp": timestamp,
+            "status": "completed"
+        })
+        if len(batch) >= INSERT_BATCH:
+            db.transactions.insert_many(batch)
+            batch = []
+    if batch:
+        db.transactions.insert_many(batch)
+
+    for user in seeded:
+        user["balance"] = balances[user["_id"]]
+    db.users.insert_many(seeded)
+    return [{"_id": user["_id"], "email": user["email"]} for user in seeded]
+
+def seed_history(db, size, days=90, seed_value=42):
+    """Add a user with exactly ``size`` transactions and return its ``_id``.
+
+    Its transfers go back and forth with one counterpart of its own, so the
+    other seeded balances are unaffected.
+    """
+    rng = random.Random(seed_value + size)
+    password_hash = pbkdf2_sha256.hash(PASSWORD)
+    pair = [{
+        "_id": uuid.uuid4().hex,
+        "name": f"Bench History {size} {role}",
+        "email": f"history-{uuid.uuid4().hex[:8]}-{role}@example.com",
+        "password": password_hash,
+        "balance": INITIAL_BALANCE
+    } for role in ("owner", "counterpart")]
+    owner, counterpart = pair[0]["_id"], pair[1]["_id"]
+
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    step = (now - start).total_seconds() * 1000 / size
+    batch = []
+    for index in range(size):
+        sender, receiver = (owner, counterpart) if index % 2 == 0 else (counterpart, owner)
+        amount = float(rng.randint(1, 500))
+        pair[0 if sender == owner else 1]["balance"] -= amount
+        pair[0 if receiver == owner else 1]["balance"] += amount
+        batch.append({
+            "_id": uuid.uuid4().hex,
+            "sender_id": sender,
+            "receiver_id": receiver,
+            "amount": Decimal128(str(amount)),
+            "description": "benchmark",
+            "timestamp": start + timedelta(milliseconds=int(index * step)),
+            "status": "completed"
+        })
+        if len(batch) >= INSERT_BATCH:
+            db.transactions.insert_many(batch)
+            batch = []
+    if batch:
+        db.transactions.insert_many(batch)
+    db.users.insert_many(pair)
+    return owner
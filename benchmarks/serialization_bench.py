@@ -0,0 +1,142 @@
+"""Measures CPU time and memory per request on the list endpoints.
+
+Boots the stack on mongomock, seeds it, then calls each list endpoint
+through its app's test client: the user list, a busy user's full
+transaction history and a history page, and that user's transaction
+report. One pass times CPU (``time.process_time``, so work done for the
+request in the other services counts too) and a second, under
+tracemalloc, records the peak bytes allocated while answering.
+
+Mongomock's own work dominates those numbers, so ``encode_only`` also
+measures just the part that changed on the busy user's history: the
+per-document fix-up and the stdlib encoder it replaced, against the
+serialization module's encoder on the documents as read::
+
+    python serialization_bench.py
+    python serialization_bench.py --providers orjson --users 5000 --transactions 50000
+
+Each ``JSON_PROVIDER`` runs in its own process, since it is read at import.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from seed import seed
+from stack import Stack, ROOT, SERVICES, _service_context
+
+PROVIDERS = ("stdlib", "orjson")
+
+def endpoints(busiest):
+    return {
+        "user_list": ("user", "/api/user/", {}),
+        "history_all": ("transactions", f"/api/transactions/{busiest}/", {"all": "true"}),
+        "history_ndjson": ("transactions", f"/api/transactions/{busiest}/", {"all": "true", "stream": "ndjson"}),
+        "history_page": ("transactions", f"/api/transactions/{busiest}/", {"limit": 100}),
+        "report_transactions": ("reporting", f"/api/reports/transactions/{busiest}", {})
+    }
+
+def _fixed_up(transaction):
+    """What every handler did to a transaction before serialization.py"""
+    transaction = dict(transaction)
+    transaction["_id"] = str(transaction["_id"])
+    if isinstance(transaction.get("timestamp"), datetime):
+        transaction["timestamp"] = transaction["timestamp"].isoformat()
+    transaction["amount"] = float(transaction["amount"].to_decimal())
+    return transaction
+
+def _encoder(provider):
+    if provider == "stdlib":
+        # Flask's default provider settings
+        return lambda documents: json.dumps([_fixed_up(t) for t in documents], sort_keys=True, separators=(",", ":")).encode()
+    with _service_context(os.path.join(ROOT, SERVICES["transactions"])):
+        import serialization
+    return serialization.dumps
+
+def _profile(call, requests):
+    """(CPU ms per call, mean peak KiB allocated per call)"""
+    started = time.process_time()
+    for _ in range(requests):
+        call()
+    cpu_ms = (time.process_time() - started) * 1000 / requests
+    peaks = []
+    tracemalloc.start()
+    for _ in range(max(1, requests // 5)):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return round(cpu_ms, 3), round(sum(peaks) / len(peaks) / 1024, 1)
+
+def measure(args):
+    with Stack("mongomock", env={"JSON_PROVIDER": args.provider}) as stack:
+        seed(stack.db, args.users, args.transactions, args.skew)
+        stack.run_tool("transactions", "compactor.py", "split")
+        apps = {name: server.app for name, server in zip(("user", "transactions", "reporting"), stack.servers)}
+        clients = {name: app.test_client() for name, app in apps.items()}
+        counts = {}
+        for name in stack.db.list_collection_names():
+            if name.startswith("transactions_"):
+                for document in stack.db[name].find({}, {"sender_id": 1}):
+                    counts[document["sender_id"]] = counts.get(document["sender_id"], 0) + 1
+        busiest = max(counts, key=counts.get)
+
+        results = {}
+        for label, (service, path, params) in endpoints(busiest).items():
+            client = clients[service]
+            def call():
+                response = client.get(path, query_string=params)
+                assert response.status_code == 200, (label, response.status_code)
+                return len(response.get_data())
+            size = call()
+            cpu_ms, peak_kib = _profile(call, args.requests)
+            results[label] = {"response_bytes": size, "cpu_ms_per_request": cpu_ms, "peak_alloc_kib": peak_kib}
+
+        documents = [document for name in stack.db.list_collection_names() if name.startswith("transactions_")
+                     for document in stack.db[name].find({"$or": [{"sender_id": busiest}, {"receiver_id": busiest}]})]
+        encode = _encoder(args.provider)
+        cpu_ms, peak_kib = _profile(lambda: encode(documents), args.requests)
+        results["encode_only"] = {
+            "response_bytes": len(encode(documents)), "cpu_ms_per_request": cpu_ms, "peak_alloc_kib": peak_kib
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU and allocation per request on the list endpoints")
+    parser.add_argument("--providers", default=",".join(PROVIDERS), help="JSON_PROVIDER values to compare")
+    parser.add_argument("--provider", help=argparse.SUPPRESS)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--requests", type=int, default=50, help="Timed requests per endpoint")
+    args = parser.parse_args()
+
+    if args.provider:
+        print(json.dumps(measure(args)))
+        return
+
+    passed = ["--users", str(args.users), "--transactions", str(args.transactions),
+              "--skew", str(args.skew), "--requests", str(args.requests)]
+    results = {}
+    for provider in args.providers.split(","):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--provider", provider, *passed],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[provider] = json.loads(output.strip().splitlines()[-1])
+
+    labels = next(iter(results.values()))
+    print(f"{'endpoint':22} {'provider':9} {'bytes':>10} {'cpu ms/req':>11} {'peak KiB':>10}")
+    for label in labels:
+        for provider, by_label in results.items():
+            row = by_label[label]
+            print(f"{label:22} {provider:9} {row['response_bytes']:>10} "
+                  f"{row['cpu_ms_per_request']:>11.3f} {row['peak_alloc_kib']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
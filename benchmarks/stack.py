@@ -0,0 +1,368 @@
+"""Boots the three Flask services locally for benchmarking.
+
+With a real mongod (``--mongo-uri``) each service runs as its own process,
+either ``python app.py`` (Flask's development server) or gunicorn with the
+service's ``gunicorn.conf.py``, and Mongo op counts come from the server's
+``opcounters``. ``asgi`` is gunicorn too, except that the reporting service
+runs its async app (``asgi:app``) on uvicorn workers, as its
+``gunicorn.conf.py`` describes. ``startup_seconds`` records how long each service took to
+answer ``/healthz``, and ``peak_rss_kib`` the high-water resident memory of
+its processes (Linux only).
+
+With ``--mongo mongomock`` all three apps run in this process on threaded
+werkzeug servers, sharing one in-memory database. Mongomock has no sessions,
+so the services take their standalone-mongod code paths, and op counts come
+from instrumenting its collection methods. With ``asgi`` the reporting app
+runs on an in-process uvicorn server instead, reading the same database
+through mongomock-motor. Numbers from this mode are only
+comparable with other mongomock runs, and every service's peak RSS is this
+process's.
+"""
+import collections
+import logging
+import os
+import runpy
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    "user": "user_service",
+    "transactions": "transactions_Service",
+    "reporting": "reporting_Service"
+}
+
+# Top-level module names the services share; each service gets its own copy.
+# metrics is left out on purpose: its collectors live in prometheus_client's
+# global registry, so the first service's copy is shared by all three.
+SERVICE_MODULES = (
+    "app", "config", "db", "models", "routes", "service_client", "streaming",
+    "stats", "checkpoints", "outbox", "idempotency", "lanes", "cache",
+    "sessions", "passwords", "tracing", "documents", "migrate", "partitions", "archive", "compactor",
+    "serialization",
+    "user", "user.models", "user.routes",
+    "reporting", "reporting.models", "reporting.routes",
+    "asgi", "reporting.async_models", "reporting.async_routes"
+)
+
+COUNTED_OPS = (
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "find_one_and_update",
+    "bulk_write", "aggregate", "count_documents", "create_index"
+)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for_health(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url + "/healthz", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"Service at {url} did not start")
+
+@contextmanager
+def _service_context(service_dir):
+    """Import a service's flat modules without clashing with the others"""
+    saved = {name: sys.modules.pop(name) for name in SERVICE_MODULES if name in sys.modules}
+    cwd = os.getcwd()
+    sys.path.insert(0, service_dir)
+    os.chdir(service_dir)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(service_dir)
+        for name in SERVICE_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+def _process_tree(pid):
+    """pid and its descendants (gunicorn's master and workers)"""
+    found, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        found.append(current)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending += [int(child) for child in f.read().split()]
+        except OSError:
+            pass
+    return found
+
+def _vm_hwm_kib(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+SERVER_COMMANDS = {
+    "dev": ["app.py"],
+    "gunicorn": ["-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+    "asgi": ["-m", "gunicorn", "-c", "gunicorn.conf.py", "asgi:app"]
+}
+
+# Services with an async app; under "asgi" the others run as under "gunicorn"
+ASGI_SERVICES = ("reporting",)
+ASGI_WORKER_CLASS = "uvicorn.workers.UvicornWorker"
+
+class Stack:
+    def __init__(self, mongo="mongod", mongo_uri="mongodb://localhost:27017/",
+                 db_name="insta_pay_bench", env=None, server="dev"):
+        if mongo == "mongomock" and server == "gunicorn":
+            raise ValueError("mongomock runs the apps in-process; use a real mongod to test gunicorn")
+        self.mongo = mongo
+        self.server = server
+        self.mongo_uri = mongo_uri
+        self.db_name = db_name
+        self.extra_env = env or {}
+        self.ports = {name: _free_port() for name in SERVICES}
+        self.processes = []
+        self.pids = {}
+        self.servers = []
+        self.asgi_servers = []
+        self.op_counts = collections.Counter()
+        self.startup_seconds = {}
+        self._client = None
+        # Archived transaction months, shared by the services like a volume
+        self.archive_dir = tempfile.mkdtemp(prefix="bench-archive-")
+
+    def url(self, service):
+        return f"http://127.0.0.1:{self.ports[service]}"
+
+    def _is_asgi(self, service):
+        return self.server == "asgi" and service in ASGI_SERVICES
+
+    def env(self, service=None):
+        env = dict(os.environ)
+        env.update({
+            "MONGODB_URI": self.mongo_uri,
+            "MONGODB_DB": self.db_name,
+            "USER_SERVICE_URL": self.url("user"),
+            "TRANSACTION_SERVICE_URL": self.url("transactions"),
+            "SECRET_KEY": env.get("SECRET_KEY", "benchmark"),
+            "FLASK_HOST": "127.0.0.1",
+            "FLASK_DEBUG": "0",
+            "ARCHIVE_DIR": self.archive_dir
+        })
+        if service:
+            env["FLASK_PORT"] = str(self.ports[service])
+        if self._is_asgi(service):
+            env["GUNICORN_WORKER_CLASS"] = ASGI_WORKER_CLASS
+        if self.mongo == "mongomock":
+            # Hash pool workers re-import the passwords module by name, which
+            # only resolves in a process that runs a single service
+            env.setdefault("PASSWORD_HASH_WORKERS", "0")
+        env.update(self.extra_env)
+        return env
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    @property
+    def client(self):
+        if self._client is None:
+            if self.mongo == "mongomock":
+                self._client = self._mongomock_client()
+            else:
+                from pymongo import MongoClient
+                self._client = MongoClient(self.mongo_uri)
+        return self._client
+
+    def _mongomock_client(self):
+        import mongomock
+        import pymongo
+        from pymongo.errors import OperationFailure
+
+        class StandaloneClient(mongomock.MongoClient):
+            def start_session(self, *args, **kwargs):
+                # What a standalone mongod answers; the services fall back
+                raise OperationFailure("Transaction numbers are only allowed on a replica set member or mongos", code=20)
+
+        # mongod adds Decimal128 with $inc; mongomock only knows Python numbers
+        from bson.decimal128 import Decimal128
+        inc = mongomock.collection._updaters["$inc"]
+        def decimal_inc(doc, field_name, value):
+            current = doc.get(field_name, 0) if isinstance(doc, dict) else None
+            if isinstance(value, Decimal128) or isinstance(current, Decimal128):
+                doc[field_name] = Decimal128(Decimal(str(current)) + Decimal(str(value)))
+                return
+            inc(doc, field_name, value)
+        mongomock.collection._updaters["$inc"] = decimal_inc
+
+        # Nor $toDouble and $toDate, which the analytics pipeline projects with
+        import mongomock.aggregate
+        mongomock.aggregate.type_convertion_operators.extend(["$toDouble", "$toDate"])
+        convert = mongomock.aggregate._Parser._handle_type_convertion_operator
+        def convert_more(parser, operator, values):
+            if operator not in ("$toDouble", "$toDate"):
+                return convert(parser, operator, values)
+            value = parser.parse(values)
+            if value is None:
+                return None
+            if operator == "$toDouble":
+                return float(str(value))
+            if isinstance(value, datetime):
+                return value
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return parsed.replace(tzinfo=None) - parsed.utcoffset() if parsed.tzinfo else parsed
+        mongomock.aggregate._Parser._handle_type_convertion_operator = convert_more
+
+        # $sum over a half-migrated collection mixes doubles and Decimal128
+        def decimal_sum(values):
+            values = list(values)
+            if any(isinstance(v, Decimal128) for v in values):
+                values = [Decimal128(str(v)) if isinstance(v, float) else v for v in values]
+            return sum_operation(values)
+        sum_operation = mongomock.aggregate._GROUPING_OPERATOR_MAP["$sum"]
+        mongomock.aggregate._GROUPING_OPERATOR_MAP["$sum"] = decimal_sum
+
+        counts = self.op_counts
+        for op in COUNTED_OPS:
+            original = getattr(mongomock.collection.Collection, op)
+            def counted(self, *args, _op=op, _original=original, **kwargs):
+                counts[_op] += 1
+                return _original(self, *args, **kwargs)
+            setattr(mongomock.collection.Collection, op, counted)
+
+        shared = StandaloneClient()
+        pymongo.MongoClient = lambda *args, **kwargs: shared
+        return shared
+
+    def start(self):
+        self.client
+        if self.mongo == "mongomock":
+            os.environ.update(self.env())
+        for name, directory in SERVICES.items():
+            started = time.perf_counter()
+            if self.mongo == "mongomock":
+                if self._is_asgi(name):
+                    self._serve_asgi_in_process(name, os.path.join(ROOT, directory))
+                else:
+                    self._serve_in_process(name, os.path.join(ROOT, directory))
+                self.pids[name] = os.getpid()
+            else:
+                server = self.server if self.server != "asgi" or self._is_asgi(name) else "gunicorn"
+                process = subprocess.Popen(
+                    [sys.executable, *SERVER_COMMANDS[server]],
+                    cwd=os.path.join(ROOT, directory),
+                    env=self.env(name),
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+                self.processes.append(process)
+                self.pids[name] = process.pid
+            _wait_for_health(self.url(name))
+            self.startup_seconds[name] = round(time.perf_counter() - started, 3)
+        return self
+
+    def _serve_in_process(self, name, service_dir):
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        os.environ["FLASK_PORT"] = str(self.ports[name])
+        with _service_context(service_dir):
+            app = __import__("app").app
+        server = make_server("127.0.0.1", self.ports[name], app, threaded=True)
+        threading.Thread(target=server.serve_forever, name=f"bench-{name}", daemon=True).start()
+        self.servers.append(server)
+
+    def _serve_asgi_in_process(self, name, service_dir):
+        import uvicorn
+        from mongomock_motor import AsyncMongoMockClient
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        with _service_context(service_dir):
+            asgi = __import__("asgi")
+        # The motor client reads and writes the same in-memory database
+        asgi.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient(mock_mongo_client=self.client)
+        server = uvicorn.Server(uvicorn.Config(asgi.app, host="127.0.0.1", port=self.ports[name],
+                                               log_level="warning", lifespan="on"))
+        threading.Thread(target=server.run, name=f"bench-{name}", daemon=True).start()
+        self.asgi_servers.append(server)
+
+    def run_tool(self, service, script, *argv):
+        """Run one of a service's maintenance scripts against the stack's database"""
+        service_dir = os.path.join(ROOT, SERVICES[service])
+        if self.mongo != "mongomock":
+            subprocess.run([sys.executable, script, *argv], cwd=service_dir, env=self.env(), check=True,
+                           stdout=subprocess.DEVNULL)
+            return
+        saved_argv = sys.argv
+        sys.argv = [script, *argv]
+        try:
+            with _service_context(service_dir):
+                runpy.run_path(script, run_name="__main__")
+        finally:
+            sys.argv = saved_argv
+
+    def mongo_ops(self):
+        """Cumulative Mongo operation counts, by operation"""
+        if self.mongo == "mongomock":
+            return dict(self.op_counts)
+        return dict(self.client.admin.command("serverStatus")["opcounters"])
+
+    def reset_peak_rss(self):
+        """Restart every service's peak RSS from its current RSS"""
+        for pid in self.pids.values():
+            for member in _process_tree(pid):
+                try:
+                    with open(f"/proc/{member}/clear_refs", "w") as f:
+                        f.write("5")
+                except OSError:
+                    pass
+
+    def peak_rss_kib(self):
+        """Largest peak RSS among each service's processes since the last reset"""
+        peaks = {}
+        for name, pid in self.pids.items():
+            values = [value for value in map(_vm_hwm_kib, _process_tree(pid)) if value is not None]
+            peaks[name] = max(values) if values else None
+        return peaks
+
+    def upstream_calls(self):
+        """Cumulative calls the services made to each other, by caller and endpoint"""
+        calls = collections.Counter()
+        for service in ("transactions", "reporting"):
+            for client in requests.get(self.url(service) + "/api/internal/client-stats", timeout=10).json():
+                for label, endpoint in client["endpoints"].items():
+                    calls[f"{service} {label}"] += endpoint["count"]
+        return dict(calls)
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+        for server in self.asgi_servers:
+            server.should_exit = True
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait(timeout=10)
+        self.servers, self.asgi_servers, self.processes, self.pids = [], [], [], {}
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { AuthAPI, TransactionAPI } from '../utils/axios';
+import { AuthAPI, TransactionAPI, ReportingAPI } from '../utils/axios';
 import { useAuth } from '../context/AuthContext';
 import { toast } from 'react-toastify';
 
@@ -43,12 +43,36 @@ const Dashboard = () => {
 
   useEffect(() => {
     fetchDashboardData();
-    
-    // Set up periodic balance refresh every 30 seconds
-    const balanceInterval = setInterval(fetchBalance, 30000);
-    
-    // Cleanup interval on component unmount
-    return () => clearInterval(balanceInterval);
+
+    // Balance and new transactions are pushed by the reporting service;
+    // poll every 30 seconds only if the event stream is unavailable
+    let balanceInterval = null;
+    const startPolling = () => {
+      if (!balanceInterval) {
+        balanceInterval = setInterval(fetchBalance, 30000);
+      }
+    };
+    const events = ReportingAPI.subscribeToEvents(user?._id, {
+      snapshot: (data) => setBalance(data.balance),
+      balance: (data) => setBalance(data.balance),
+      transaction: (data) => setRecentTransactions(
+        (current) => [data, ...current.filter((t) => t._id !== data._id)]
+      ),
+      closed: startPolling
+    });
+    if (!events) {
+      startPolling();
+    }
+
+    // Close the stream and any polling on unmount
+    return () => {
+      if (events) {
+        events.close();
+      }
+      if (balanceInterval) {
+        clearInterval(balanceInterval);
+      }
+    };
   }, [user?._id]);
 
   if (loading) {
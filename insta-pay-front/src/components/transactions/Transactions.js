@@ -4,11 +4,18 @@ import { transactionService } from '../../utils/axios';
 import { useAuth } from '../../context/AuthContext';
 import { toast } from 'react-toastify';
 
+// One page of a user's history, newest first; X-Next-Cursor points at the next page
+const fetchPage = (userId, cursor) => transactionService.get(`/api/transactions/${userId}/`, {
+  params: cursor ? { cursor } : {}
+});
+
 const Transactions = () => {
   const { user } = useAuth();
   const navigate = useNavigate();
   const [transactions, setTransactions] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     const fetchTransactions = async () => {
@@ -16,8 +23,9 @@ const Transactions = () => {
 
       try {
         setLoading(true);
-        const response = await transactionService.get(`/api/transactions/${user._id}/`);
+        const response = await fetchPage(user._id);
         setTransactions(response.data);
+        setNextCursor(response.headers['x-next-cursor'] || null);
       } catch (error) {
         console.error('Error fetching transactions:', error);
         toast.error('Failed to load transactions');
@@ -29,6 +37,20 @@ const Transactions = () => {
     fetchTransactions();
   }, [user?._id]);
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await fetchPage(user._id, nextCursor);
+      setTransactions((loaded) => [...loaded, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching transactions:', error);
+      toast.error('Failed to load more transactions');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <div className="container mt-5">
@@ -210,6 +232,25 @@ const Transactions = () => {
           </table>
         </div>
       </div>
+
+      {nextCursor && (
+        <div className="d-flex justify-content-center mt-4">
+          <button
+            style={{
+              backgroundColor: 'white',
+              color: '#6f42c1',
+              border: '2px solid #6f42c1',
+              borderRadius: '50px',
+              padding: '0.5rem 1.5rem',
+              fontWeight: '500'
+            }}
+            onClick={loadMore}
+            disabled={loadingMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -97,6 +97,26 @@ const ReportingAPI = {
   getSummaryReport: async (userId) => {
     console.log('Fetching summary report for user:', userId);
     return handleApiRequest(() => reportingApi.get(`/summary/${userId}`));
+  },
+  // Live balance and transaction events; returns the EventSource, or null
+  // when the browser has none so the caller can poll instead
+  subscribeToEvents: (userId, handlers) => {
+    if (!userId || typeof EventSource === 'undefined') {
+      return null;
+    }
+    const source = new EventSource(`${REPORTING_SERVICE_BASE}/events/${userId}`, { withCredentials: true });
+    ['snapshot', 'balance', 'transaction'].forEach((type) => {
+      if (handlers[type]) {
+        source.addEventListener(type, (event) => handlers[type](JSON.parse(event.data)));
+      }
+    });
+    // EventSource reconnects by itself unless the server refused the stream
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && handlers.closed) {
+        handlers.closed();
+      }
+    };
+    return source;
   }
 };
 
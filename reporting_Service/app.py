@@ -2,6 +2,10 @@ from flask import Flask
 from flask_cors import CORS
 from reporting import reporting_bp
 from config import Config
+import metrics
+import tracing
+import health
+import serialization
 
 app = Flask(__name__)
 CORS(app, 
@@ -12,6 +16,10 @@ CORS(app,
 app.secret_key = Config.SECRET_KEY
 
 app.register_blueprint(reporting_bp)
+metrics.init_app(app)
+tracing.init_app(app)
+health.init_app(app)
+serialization.init_app(app)
 
 if __name__ == '__main__':
     app.run(
@@ -0,0 +1,136 @@
+"""Arrow IPC files holding archived months of transactions.
+
+Each archived month is one file, ``transactions_YYYY_MM.arrow``, with the
+month's transactions sorted by (timestamp, _id): BSON dates become
+millisecond timestamps and Decimal128 amounts 38-digit decimals. Files are
+written once and memory-mapped by readers, so a report only pages in the
+columns and rows it touches, and every process mapping a file shares its
+pages. Filters run as vectorized Arrow compute kernels.
+"""
+import os
+from decimal import Context, Decimal
+from functools import lru_cache, reduce
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TIMESTAMP = pa.timestamp("ms")
+
+SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("sender_id", pa.string()),
+    ("receiver_id", pa.string()),
+    ("amount", pa.decimal128(38, 18)),
+    ("description", pa.string()),
+    ("timestamp", TIMESTAMP),
+    ("status", pa.string())
+])
+
+# Rows per record batch written
+BATCH_ROWS = 65536
+# Archive files each process keeps mapped
+OPEN_FILES = 64
+
+_AMOUNT_QUANTUM = Decimal("1e-18")
+_AMOUNT_CONTEXT = Context(prec=38)
+
+def _amount(value):
+    # str() reads Decimal128 and doubles alike without binary rounding
+    return Decimal(str(value)).quantize(_AMOUNT_QUANTUM, context=_AMOUNT_CONTEXT)
+
+def _record_batch(documents):
+    columns = {name: [document.get(name) for document in documents] for name in SCHEMA.names}
+    columns["_id"] = [str(value) for value in columns["_id"]]
+    columns["amount"] = [None if value is None else _amount(value) for value in columns["amount"]]
+    return pa.RecordBatch.from_pydict(columns, schema=SCHEMA)
+
+def write_month(path, documents):
+    """Write documents, already sorted by (timestamp, _id), to a new file.
+
+    Timestamps must be datetimes. The file is written beside ``path`` and
+    renamed into place once synced, so readers never see a partial one.
+    Returns the number of rows written.
+    """
+    partial = path + ".partial"
+    rows = 0
+    with open(partial, "wb") as sink:
+        with pa.ipc.new_file(sink, SCHEMA) as writer:
+            batch = []
+            for document in documents:
+                batch.append(document)
+                if len(batch) >= BATCH_ROWS:
+                    writer.write_batch(_record_batch(batch))
+                    rows += len(batch)
+                    batch = []
+            if batch:
+                writer.write_batch(_record_batch(batch))
+                rows += len(batch)
+        sink.flush()
+        os.fsync(sink.fileno())
+    os.replace(partial, path)
+    return rows
+
+def count_rows(path):
+    """Rows in a file, read afresh rather than from the mapped tables"""
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().num_rows
+
+@lru_cache(maxsize=OPEN_FILES)
+def open_month(path):
+    """The file's table, backed by a memory map rather than copied in"""
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def _beyond(table, key, newest_first):
+    """Mask of rows strictly past ``key`` = (timestamp, _id) in scan order"""
+    timestamp = pa.scalar(key[0], TIMESTAMP)
+    past = pc.less if newest_first else pc.greater
+    return pc.or_(
+        past(table["timestamp"], timestamp),
+        pc.and_(pc.equal(table["timestamp"], timestamp), past(table["_id"], key[1]))
+    )
+
+def scan(path, user_id=None, start=None, end=None, after=None, until=None, status=None, newest_first=False):
+    """The file's rows that pass the filters, as a table in (timestamp, _id) order.
+
+    Keeps transactions involving ``user_id`` within [start, end], strictly
+    past the ``after`` key and up to the ``until`` key (both (timestamp,
+    _id) in the order given by ``newest_first``).
+    """
+    table = open_month(path)
+    conditions = []
+    if user_id is not None:
+        conditions.append(pc.or_(pc.equal(table["sender_id"], user_id), pc.equal(table["receiver_id"], user_id)))
+    if start is not None:
+        conditions.append(pc.greater_equal(table["timestamp"], pa.scalar(start, TIMESTAMP)))
+    if end is not None:
+        conditions.append(pc.less_equal(table["timestamp"], pa.scalar(end, TIMESTAMP)))
+    if status is not None:
+        conditions.append(pc.equal(table["status"], status))
+    if after is not None:
+        conditions.append(_beyond(table, after, newest_first))
+    if until is not None:
+        conditions.append(pc.invert(_beyond(table, until, newest_first)))
+    if conditions:
+        table = table.filter(reduce(pc.and_, conditions))
+    return table
+
+def read(path, user_id=None, start=None, end=None, after=None, until=None, status=None,
+         newest_first=False, columns=None, limit=None):
+    """Rows of an archive file as dicts, newest first if ``newest_first``.
+
+    Filters as scan() does. ``columns`` picks the fields returned; ``_id``
+    is always included.
+    """
+    table = scan(path, user_id, start, end, after, until, status, newest_first)
+    if columns is not None:
+        table = table.select(["_id"] + [name for name in SCHEMA.names if name in columns and name != "_id"])
+    if limit is not None:
+        table = table.slice(max(table.num_rows - limit, 0)) if newest_first else table.slice(0, limit)
+    rows = table.to_pylist()
+    if newest_first:
+        rows.reverse()
+    return rows
+
+def find_id(path, transaction_id):
+    table = open_month(path)
+    rows = table.filter(pc.equal(table["_id"], transaction_id)).to_pylist()
+    return rows[0] if rows else None
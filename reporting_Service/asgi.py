@@ -0,0 +1,124 @@
+import os
+import time
+import httpx
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+from motor.motor_asyncio import AsyncIOMotorClient
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest, multiprocess
+from reporting.async_routes import async_reporting_bp
+from reporting.async_models import AsyncServiceClient, AsyncUserLookup
+from config import Config
+import metrics
+import tracing
+import serialization
+
+# Async (ASGI) variant of app.py, for running under an ASGI server:
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+# Dependencies are listed in requirements-async.txt.
+app = Quart(__name__)
+app = cors(app,
+           allow_origin="http://localhost:3000",
+           allow_credentials=True,
+           allow_headers=["Content-Type", "Authorization"],
+           allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"])
+app.secret_key = Config.SECRET_KEY
+serialization.init_app(app)
+
+app.register_blueprint(async_reporting_bp)
+
+# The Flask app's metrics.init_app and tracing.init_app, on Quart's hooks:
+# the same request metrics, /metrics, and a server span per request that
+# continues the caller's traceparent
+@app.before_request
+async def start_request():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_route = route
+    g.metrics_start = time.perf_counter()
+    metrics.IN_FLIGHT.labels(route).inc()
+    if request.path not in tracing.UNTRACED_PATHS:
+        g.trace_span, g.trace_token = tracing.start_span(
+            f"{request.method} {route}",
+            tracing.SPAN_KIND_SERVER,
+            {"http.method": request.method, "http.route": route, "http.target": request.path},
+            parent=tracing.parse_traceparent(request.headers.get("traceparent"))
+        )
+
+@app.after_request
+async def record_request(response):
+    start = g.get("metrics_start")
+    if start is not None:
+        metrics.REQUEST_LATENCY.labels(request.method, g.metrics_route, str(response.status_code)).observe(
+            time.perf_counter() - start
+        )
+    server_span = g.get("trace_span")
+    if server_span is not None:
+        server_span.set("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            server_span.error = f"HTTP {response.status_code}"
+        response.headers["traceparent"] = server_span.traceparent
+    return response
+
+@app.teardown_request
+async def finish_request(exc):
+    if g.get("metrics_start") is not None:
+        metrics.IN_FLIGHT.labels(g.metrics_route).dec()
+    server_span = g.pop("trace_span", None)
+    if server_span is not None:
+        tracing.finish_span(server_span, g.pop("trace_token"), exc)
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_view():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route('/healthz', methods=['GET'])
+async def liveness():
+    # Same liveness probe as health.py gives the Flask app
+    return jsonify({"status": "ok"}), 200
+
+@app.route('/api/internal/client-stats', methods=['GET'])
+async def get_client_stats():
+    """Per-endpoint latency for outbound calls, as the Flask app reports it"""
+    return jsonify([{**app.user_service.stats(), "user_lookup": app.user_lookup.stats()}])
+
+@app.before_serving
+async def open_clients():
+    # Created inside the server's event loop, shared by every request. Same
+    # pool and timeout settings, and command listeners, as db.py's client
+    app.mongo_client = AsyncIOMotorClient(
+        Config.MONGODB_URI,
+        maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS or None,
+        waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+        event_listeners=[metrics.MongoCommandMetrics(), tracing.MongoCommandTracing()]
+    )
+    app.user_service = AsyncServiceClient(httpx.AsyncClient(
+        base_url=Config.USER_SERVICE_URL or '',
+        timeout=httpx.Timeout(Config.HTTP_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=Config.HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=Config.HTTP_POOL_MAXSIZE
+        ),
+        transport=httpx.AsyncHTTPTransport(retries=Config.HTTP_MAX_RETRIES)
+    ))
+    app.user_lookup = AsyncUserLookup(app.user_service)
+
+@app.after_serving
+async def close_clients():
+    await app.user_service.aclose()
+    app.mongo_client.close()
+
+if __name__ == '__main__':
+    app.run(
+        host=Config.FLASK_HOST,
+        port=int(Config.FLASK_PORT),
+        debug=Config.FLASK_DEBUG == '1'
+    )
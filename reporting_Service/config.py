@@ -9,10 +9,85 @@ class Config:
     MONGODB_URI = os.getenv('MONGODB_URI')
     MONGODB_DB = os.getenv('MONGODB_DB')
     
+    # MongoDB client pool and timeouts
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    # 0 leaves socket reads unbounded, which long report aggregations need
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '0'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0'))
+
+    # Readiness probe caches its Mongo ping for this long
+    READINESS_CACHE_SECONDS = float(os.getenv('READINESS_CACHE_SECONDS', '2'))
+    # Set by gunicorn.conf.py: startup work then runs in each worker after fork
+    DEFER_STARTUP = os.getenv('DEFER_STARTUP', '0') == '1'
+    
     # Service URLs
     USER_SERVICE_URL = os.getenv('USER_SERVICE_URL')
     TRANSACTION_SERVICE_URL = os.getenv('TRANSACTION_SERVICE_URL')
     
+    # Inter-service HTTP client
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+    HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+    HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.1'))
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+    # User lookups: merge concurrent ones into POST /api/user/batch calls,
+    # with at most this many calls in flight and ids per call. A lookup
+    # with nothing to merge with is still sent as a single GET.
+    USER_LOOKUP_COALESCE = os.getenv('USER_LOOKUP_COALESCE', '1') == '1'
+    USER_LOOKUP_CONCURRENCY = int(os.getenv('USER_LOOKUP_CONCURRENCY', '4'))
+    USER_LOOKUP_MAX_BATCH = int(os.getenv('USER_LOOKUP_MAX_BATCH', '100'))
+    
+    # Log sampled stacks for requests slower than this (0 disables)
+    PROFILE_SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUEST_MS', '0'))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.01'))
+    
+    # Tracing: sampled spans are exported as OTLP/JSON to a file and/or collector
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'reporting-service')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+    TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', '')
+    TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL', '')
+    TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '2'))
+    TRACE_BATCH_SIZE = int(os.getenv('TRACE_BATCH_SIZE', '512'))
+    TRACE_MAX_QUEUE = int(os.getenv('TRACE_MAX_QUEUE', '10000'))
+    
+    # Live events: change-stream consumer and Server-Sent Events streams
+    EVENTS_ENABLED = os.getenv('EVENTS_ENABLED', '1') == '1'
+    EVENTS_CONSUMER_ID = os.getenv('EVENTS_CONSUMER_ID', 'reporting-events')
+    EVENTS_CHECKPOINT_INTERVAL = float(os.getenv('EVENTS_CHECKPOINT_INTERVAL', '5'))
+    # Older checkpoints are dropped and the feed starts from now
+    EVENTS_RESUME_MAX_AGE = float(os.getenv('EVENTS_RESUME_MAX_AGE', '300'))
+    # Inserts of older transactions are history moved by compactor.py split
+    EVENTS_MAX_TRANSACTION_AGE = float(os.getenv('EVENTS_MAX_TRANSACTION_AGE', '86400'))
+    EVENTS_REPLAY_BUFFER = int(os.getenv('EVENTS_REPLAY_BUFFER', '1000'))
+    EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+    EVENTS_RETRY_MAX_SECONDS = float(os.getenv('EVENTS_RETRY_MAX_SECONDS', '30'))
+    # Per process. Under gthread each stream holds a worker thread, so keep
+    # this below GUNICORN_THREADS; the ASGI app holds none
+    EVENTS_MAX_THREAD_STREAMS = int(os.getenv('EVENTS_MAX_THREAD_STREAMS', '4'))
+    EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '1000'))
+    
+    # Monthly transaction partitions and their Arrow archive (partitions.py)
+    PARTITION_CACHE_SECONDS = float(os.getenv('PARTITION_CACHE_SECONDS', '30'))
+    # Shared by every service that reads transactions
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+    ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '6'))
+    
+    # Platform-wide analytics (reporting/analytics.py)
+    ANALYTICS_BATCH_ROWS = int(os.getenv('ANALYTICS_BATCH_ROWS', '50000'))
+    # Range reported when the request has no start_date
+    ANALYTICS_DEFAULT_DAYS = int(os.getenv('ANALYTICS_DEFAULT_DAYS', '30'))
+    ANALYTICS_CACHE_SECONDS = float(os.getenv('ANALYTICS_CACHE_SECONDS', '60'))
+    ANALYTICS_MAX_LIMIT = int(os.getenv('ANALYTICS_MAX_LIMIT', '1000'))
+    
+    # Response encoding: orjson, or stdlib to compare against (serialization.py)
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+    
     # Flask Configuration
     FLASK_APP = os.getenv('FLASK_APP')
     FLASK_ENV = os.getenv('FLASK_ENV')
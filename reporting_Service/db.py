@@ -1,5 +1,20 @@
 from pymongo import MongoClient
 from config import Config
+from metrics import MongoCommandMetrics
+from tracing import MongoCommandTracing
 
-client = MongoClient(Config.MONGODB_URI)
+# connect=False defers connecting (and the driver's monitor threads) to the
+# first operation, so a client built before a pre-fork server forks is safe
+client = MongoClient(
+    Config.MONGODB_URI,
+    connect=False,
+    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS or None,
+    waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+    event_listeners=[MongoCommandMetrics(), MongoCommandTracing()]
+)
 db = client[Config.MONGODB_DB] 
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""BSON field types for transaction documents.
+
+Transactions store ``timestamp`` as a BSON date (millisecond precision, naive
+UTC) and ``amount`` as Decimal128, so range queries compare natively and
+sums are exact. Documents written earlier hold ISO strings and doubles
+until ``python migrate.py run`` converts them; readers accept both.
+"""
+from datetime import datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+
+def to_decimal(value):
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, Decimal):
+        return value
+    # str() keeps floats at their shortest repr: 0.1 -> Decimal('0.1')
+    return Decimal(str(value))
+
+def to_decimal128(value):
+    return Decimal128(to_decimal(value))
+
+def truncate_ms(value):
+    """Drop sub-millisecond precision, which BSON dates can't hold"""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+def utc_now():
+    return truncate_ms(datetime.utcnow())
+
+def to_datetime(value):
+    """BSON-ready datetime from a stored timestamp of either type"""
+    if isinstance(value, datetime):
+        return truncate_ms(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    return truncate_ms(parsed)
+
+def timestamp_range(start=None, end=None):
+    """Filter on ``timestamp`` within [start, end] for both stored types.
+
+    Range operators only match values of the same BSON type, so the range
+    is given once as dates and once as ISO strings; each branch is an index
+    range scan. The string branch matches nothing once migration is done.
+    """
+    date_range, string_range = {}, {}
+    if start is not None:
+        date_range["$gte"] = start
+        string_range["$gte"] = start.isoformat()
+    if end is not None:
+        date_range["$lte"] = end
+        string_range["$lte"] = end.isoformat()
+    return {"$or": [{"timestamp": date_range}, {"timestamp": string_range}]}
+
+def after_checkpoint(checkpoint):
+    """Filter for transactions ordered after a checkpoint's (timestamp, _id)"""
+    timestamp = checkpoint["timestamp"]
+    branches = [
+        {"timestamp": {"$gt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$gt": checkpoint["transaction_id"]}}
+    ]
+    # ISO-string timestamps predate every BSON date one
+    if not isinstance(timestamp, datetime):
+        branches.append({"timestamp": {"$type": "date"}})
+    return {"$or": branches}
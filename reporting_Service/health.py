@@ -0,0 +1,42 @@
+"""Liveness and readiness endpoints for the orchestrator.
+
+``/healthz`` only proves the process is serving requests. ``/readyz`` also
+pings Mongo, caching the answer for ``READINESS_CACHE_SECONDS`` so frequent
+probes never add load to the database.
+"""
+import threading
+import time
+from flask import jsonify
+from config import Config
+from db import client
+
+_lock = threading.Lock()
+_last_check = {"at": None, "error": None}
+
+def mongo_error():
+    """Return None if Mongo answered a ping recently, else the error text"""
+    now = time.monotonic()
+    with _lock:
+        if _last_check["at"] is not None and now - _last_check["at"] < Config.READINESS_CACHE_SECONDS:
+            return _last_check["error"]
+    try:
+        client.admin.command("ping")
+        error = None
+    except Exception as e:
+        error = str(e)
+    with _lock:
+        _last_check.update(at=now, error=error)
+    return error
+
+def liveness():
+    return jsonify({"status": "ok"}), 200
+
+def readiness():
+    error = mongo_error()
+    if error:
+        return jsonify({"status": "unavailable", "mongo": error}), 503
+    return jsonify({"status": "ready"}), 200
+
+def init_app(app):
+    app.add_url_rule("/healthz", "healthz", liveness)
+    app.add_url_rule("/readyz", "readyz", readiness)
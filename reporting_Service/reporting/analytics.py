@@ -0,0 +1,342 @@
+"""Platform-wide analytics over every user's transactions.
+
+The per-user reports walk one user's documents in Python. These reports
+cover all users at once, so they run on columns instead. The completed
+transactions in the requested range are loaded into Arrow tables: from
+MongoDB partitions in cursor batches of ``ANALYTICS_BATCH_ROWS`` (MongoDB
+converts amounts to doubles and timestamps to dates on the way out), and
+from archived months straight out of their memory-mapped files.
+Group-bys, rolling windows and percentiles then run as vectorized Arrow
+compute kernels.
+
+Results are cached per process for ``ANALYTICS_CACHE_SECONDS``.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+from db import db
+from config import Config
+import archive
+import partitions
+from documents import timestamp_range
+from reporting.models import parse_date
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = pa.schema([
+    ("sender_id", pa.string()),
+    ("receiver_id", pa.string()),
+    ("amount", pa.float64()),
+    ("timestamp", archive.TIMESTAMP)
+])
+
+# Which user a transaction counts for
+SIDES = {"sent": "sender_id", "received": "receiver_id"}
+
+REPORTS = ("daily-volume", "top-users", "percentiles")
+
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_LIMIT = 10
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0)
+
+def _pipeline(start, end):
+    match = {"status": "completed"}
+    if start is not None or end is not None:
+        match = {"$and": [match, timestamp_range(start, end)]}
+    return [
+        {"$match": match},
+        {"$project": {
+            "_id": 0,
+            "sender_id": 1,
+            "receiver_id": 1,
+            "amount": {"$toDouble": "$amount"},
+            "timestamp": {"$toDate": "$timestamp"}
+        }}
+    ]
+
+class ColumnBuilder:
+    """Collects documents into record batches of typed columns"""
+
+    def __init__(self, batch_rows=None):
+        self.batch_rows = batch_rows or Config.ANALYTICS_BATCH_ROWS
+        self._batches = []
+        self._pending = []
+
+    def add(self, document):
+        self._pending.append(document)
+        if len(self._pending) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            # Converted a column at a time; fields outside SCHEMA are ignored
+            self._batches.append(pa.RecordBatch.from_pylist(self._pending, schema=SCHEMA))
+            self._pending = []
+
+    def table(self):
+        self._flush()
+        return pa.Table.from_batches(self._batches, SCHEMA)
+
+def _archived(record, start, end):
+    table = archive.scan(partitions.archive_path(record), start=start, end=end, status="completed")
+    return table.select(SCHEMA.names).cast(SCHEMA)
+
+def _concat(tables):
+    return pa.concat_tables(tables) if tables else SCHEMA.empty_table()
+
+def load(start, end):
+    """Completed transactions in [start, end] as one table"""
+    tables = []
+    for source in partitions.sources(start, end):
+        if isinstance(source, dict):
+            tables.append(_archived(source, start, end))
+            continue
+        builder = ColumnBuilder()
+        for document in db[source].aggregate(_pipeline(start, end), batchSize=builder.batch_rows):
+            builder.add(document)
+        tables.append(builder.table())
+    return _concat(tables)
+
+async def load_async(motor_db, start, end):
+    """load() for the ASGI app, reading MongoDB through motor"""
+    tables = []
+    for source in await asyncio.to_thread(partitions.sources, start, end):
+        if isinstance(source, dict):
+            tables.append(await asyncio.to_thread(_archived, source, start, end))
+            continue
+        builder = ColumnBuilder()
+        async for document in motor_db[source].aggregate(_pipeline(start, end), batchSize=builder.batch_rows):
+            builder.add(document)
+        tables.append(builder.table())
+    return _concat(tables)
+
+def _rolling_sum(values, window):
+    """Sum over each trailing ``window`` entries (fewer at the start)"""
+    totals = pc.cumulative_sum(values)
+    lag = min(window, len(totals))
+    earlier = pa.concat_arrays([pa.array([0] * lag, totals.type), totals.slice(0, len(totals) - lag)])
+    return pc.subtract(totals, earlier)
+
+def daily_volume(table, window):
+    """Per-day count, volume and distinct senders, with trailing window sums"""
+    if table.num_rows == 0:
+        return []
+    by_day = pa.table({
+        "day": pc.cast(table["timestamp"], pa.date32()),
+        "amount": table["amount"],
+        "sender_id": table["sender_id"]
+    }).group_by("day").aggregate([
+        ("amount", "count"), ("amount", "sum"), ("sender_id", "count_distinct")
+    ]).sort_by("day")
+
+    # Days without transactions still count towards the windows
+    first = by_day["day"][0].as_py()
+    span = (by_day["day"][-1].as_py() - first).days + 1
+    counts, volumes, senders = [0] * span, [0.0] * span, [0] * span
+    for day, count, volume, distinct in zip(*(by_day[name].to_pylist() for name in (
+        "day", "amount_count", "amount_sum", "sender_id_count_distinct"
+    ))):
+        index = (day - first).days
+        counts[index], volumes[index], senders[index] = count, volume, distinct
+    rolling_counts = _rolling_sum(pa.array(counts, pa.int64()), window).to_pylist()
+    rolling_volumes = _rolling_sum(pa.array(volumes, pa.float64()), window).to_pylist()
+    return [
+        {
+            "date": (first + timedelta(days=index)).isoformat(),
+            "transactions": counts[index],
+            "volume": volumes[index],
+            "senders": senders[index],
+            "rolling_transactions": rolling_counts[index],
+            "rolling_volume": rolling_volumes[index]
+        }
+        for index in range(span)
+    ]
+
+def _per_user(table, side):
+    return pa.table({"user_id": table[SIDES[side]], "amount": table["amount"]})
+
+def top_users(table, side, limit):
+    """Users with the largest volume sent (or received)"""
+    totals = _per_user(table, side).group_by("user_id").aggregate([("amount", "count"), ("amount", "sum")])
+    top = totals.take(pc.select_k_unstable(totals, k=min(limit, totals.num_rows),
+                                           sort_keys=[("amount_sum", "descending")]))
+    top = top.sort_by([("amount_sum", "descending"), ("user_id", "ascending")])
+    return [
+        {"user_id": user_id, "transactions": count, "volume": volume}
+        for user_id, count, volume in zip(*(top[name].to_pylist() for name in ("user_id", "amount_count", "amount_sum")))
+    ]
+
+def _label(percentile):
+    return f"p{percentile:g}"
+
+def percentiles(table, side, points, user_ids=None, limit=DEFAULT_LIMIT):
+    """Amount percentiles platform-wide (exact) and per user (t-digest).
+
+    Per-user rows are for ``user_ids`` if given, otherwise for the
+    ``limit`` users with the most transactions.
+    """
+    quantiles = [point / 100 for point in points]
+    amounts = table["amount"]
+    platform = {"transactions": table.num_rows}
+    values = pc.quantile(amounts, q=quantiles).to_pylist() if table.num_rows else [None] * len(points)
+    platform.update(zip(map(_label, points), values))
+
+    per_user = _per_user(table, side)
+    if user_ids:
+        per_user = per_user.filter(pc.is_in(per_user["user_id"], value_set=pa.array(user_ids, pa.string())))
+    grouped = per_user.group_by("user_id").aggregate([
+        ("amount", "count"),
+        ("amount", "tdigest", pc.TDigestOptions(q=quantiles))
+    ])
+    if not user_ids:
+        grouped = grouped.take(pc.select_k_unstable(grouped, k=min(limit, grouped.num_rows),
+                                                    sort_keys=[("amount_count", "descending")]))
+    grouped = grouped.sort_by([("amount_count", "descending"), ("user_id", "ascending")])
+    users = [
+        {"user_id": user_id, "transactions": count, **dict(zip(map(_label, points), digest))}
+        for user_id, count, digest in zip(*(grouped[name].to_pylist() for name in (
+            "user_id", "amount_count", "amount_tdigest"
+        )))
+    ]
+    return {"platform": platform, "users": users}
+
+def _positive_int(args, name, default, maximum=None):
+    try:
+        value = int(args.get(name, default))
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+    if value <= 0:
+        raise ValueError(f"{name} must be positive")
+    return min(value, maximum) if maximum else value
+
+def _cache_bucket(moment):
+    """``moment`` rounded down to a multiple of ``ANALYTICS_CACHE_SECONDS``"""
+    bucket = int(Config.ANALYTICS_CACHE_SECONDS * 1000000)
+    if bucket <= 0:
+        return moment
+    elapsed = (moment - datetime.min) // timedelta(microseconds=1)
+    return moment - timedelta(microseconds=elapsed % bucket)
+
+def parse_query(report, args):
+    """(start, end, options) for a report from request args; ValueError if invalid"""
+    end = parse_date(args['end_date']) if args.get('end_date') else None
+    if args.get('start_date'):
+        start = parse_date(args['start_date'])
+    else:
+        # Rounded so that requests without dates share a cache entry
+        start = _cache_bucket(end or datetime.utcnow()) - timedelta(days=Config.ANALYTICS_DEFAULT_DAYS)
+    options = {}
+    if report == "daily-volume":
+        options["window"] = _positive_int(args, 'window', DEFAULT_WINDOW_DAYS)
+        return start, end, options
+
+    side = args.get('side', 'sent')
+    if side not in SIDES:
+        raise ValueError("side must be 'sent' or 'received'")
+    options["side"] = side
+    options["limit"] = _positive_int(args, 'limit', DEFAULT_LIMIT, Config.ANALYTICS_MAX_LIMIT)
+    if report == "percentiles":
+        try:
+            points = tuple(float(p) for p in args['percentiles'].split(',')) if args.get('percentiles') else DEFAULT_PERCENTILES
+        except ValueError:
+            raise ValueError("Invalid percentiles")
+        if not points or any(not 0 <= point <= 100 for point in points):
+            raise ValueError("percentiles must be between 0 and 100")
+        options["points"] = points
+        user_ids = tuple(args['user_ids'].split(',')) if args.get('user_ids') else ()
+        if len(user_ids) > Config.ANALYTICS_MAX_LIMIT:
+            raise ValueError(f"At most {Config.ANALYTICS_MAX_LIMIT} user_ids")
+        options["user_ids"] = user_ids
+    return start, end, options
+
+def compute(report, table, options):
+    if report == "daily-volume":
+        return {"window_days": options["window"], "days": daily_volume(table, options["window"])}
+    if report == "top-users":
+        return {"side": options["side"], "users": top_users(table, options["side"], options["limit"])}
+    return {
+        "side": options["side"],
+        **percentiles(table, options["side"], options["points"], options["user_ids"], options["limit"])
+    }
+
+class ResultCache:
+    """Recent report results, so dashboards polling the same report share one load"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def put(self, key, result):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + Config.ANALYTICS_CACHE_SECONDS, result)
+
+results = ResultCache()
+
+def _cache_key(report, start, end, options):
+    return report, start, end, tuple(sorted(options.items()))
+
+def _result(report, start, end, options, table):
+    return {
+        "report": report,
+        "start": start.isoformat(),
+        "end": end.isoformat() if end else None,
+        **compute(report, table, options)
+    }
+
+def run(report, start, end, options):
+    key = _cache_key(report, start, end, options)
+    result = results.get(key)
+    if result is None:
+        result = _result(report, start, end, options, load(start, end))
+        results.put(key, result)
+    return result
+
+async def run_async(motor_db, report, start, end, options):
+    key = _cache_key(report, start, end, options)
+    result = results.get(key)
+    if result is None:
+        table = await load_async(motor_db, start, end)
+        result = await asyncio.to_thread(_result, report, start, end, options, table)
+        results.put(key, result)
+    return result
+
+def handle(report, args):
+    """(response body, status) for a report request; the routes jsonify it"""
+    if report not in REPORTS:
+        return {"error": f"Unknown report: {report}"}, 404
+    try:
+        start, end, options = parse_query(report, args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        return run(report, start, end, options), 200
+    except Exception as e:
+        logger.exception("Analytics report %s failed", report)
+        return {"error": str(e)}, 500
+
+async def handle_async(motor_db, report, args):
+    if report not in REPORTS:
+        return {"error": f"Unknown report: {report}"}, 404
+    try:
+        start, end, options = parse_query(report, args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        return await run_async(motor_db, report, start, end, options), 200
+    except Exception as e:
+        logger.exception("Analytics report %s failed", report)
+        return {"error": str(e)}, 500
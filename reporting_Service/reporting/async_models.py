@@ -0,0 +1,298 @@
+import asyncio
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+from quart import jsonify, make_response
+from config import Config
+import metrics
+import tracing
+from reporting import events
+from reporting.models import (
+    parse_date, user_match, transaction_report_pipeline, REPORT_SORT, archived_report_part, build_transaction_report,
+    checkpoint_query, CHECKPOINT_SORT, checkpoint_history_scan,
+    current_history_scan, replay_from_checkpoint, replay_from_current,
+    build_balance_report, summary_fallback_pipeline, archived_summary, combine_summaries,
+    build_user_summary, daily_query, build_daily_report
+)
+import partitions
+
+class AsyncServiceClient:
+    """Async counterpart of service_client.ServiceClient over an httpx.AsyncClient.
+
+    Each call gets a client span with a forwarded ``traceparent``, the
+    upstream latency metric and per-endpoint stats, as the Flask app's
+    calls do.
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self.base_url = str(http.base_url).rstrip('/')
+        self.upstream = urlparse(self.base_url).netloc or self.base_url
+        self._endpoints = defaultdict(lambda: {
+            "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0
+        })
+
+    async def request(self, method, path, endpoint=None, **kwargs):
+        label = endpoint or f"{method} {path}"
+        client_span, token = tracing.start_span(label, tracing.SPAN_KIND_CLIENT, {
+            "http.method": method,
+            "http.url": f"{self.base_url}{path}",
+            "peer.service": self.upstream
+        })
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, traceparent=client_span.traceparent)
+        start = time.perf_counter()
+        failed = True
+        status = "error"
+        error = None
+        try:
+            response = await self.http.request(method, path, **kwargs)
+            failed = response.status_code >= 500
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            metrics.observe_upstream(self.upstream, label, status, elapsed / 1000)
+            client_span.set("http.status_code", status)
+            if failed and error is None:
+                error = f"HTTP {status}"
+            tracing.finish_span(client_span, token, error)
+            stats = self._endpoints[label]
+            stats["count"] += 1
+            stats["total_ms"] += elapsed
+            stats["max_ms"] = max(stats["max_ms"], elapsed)
+            if failed:
+                stats["errors"] += 1
+
+    async def get(self, path, endpoint=None, **kwargs):
+        return await self.request('GET', path, endpoint, **kwargs)
+
+    async def post(self, path, endpoint=None, **kwargs):
+        return await self.request('POST', path, endpoint, **kwargs)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    def stats(self):
+        endpoints = {
+            label: {
+                "count": s["count"],
+                "errors": s["errors"],
+                "avg_ms": round(s["total_ms"] / s["count"], 3) if s["count"] else 0,
+                "max_ms": round(s["max_ms"], 3)
+            }
+            for label, s in self._endpoints.items()
+        }
+        return {"base_url": self.base_url, "endpoints": endpoints}
+
+class AsyncUserLookup:
+    """Async counterpart of service_client.UserLookup, for the ASGI app.
+
+    Lookups share batches the same way, with the slots and open batches kept
+    on the server's event loop. One is created per app in asgi.py.
+    """
+
+    def __init__(self, user_service):
+        self.user_service = user_service
+        self._slots = asyncio.Semaphore(Config.USER_LOOKUP_CONCURRENCY)
+        self._open = {}
+        self.lookups = 0
+        self.calls = 0
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "calls": self.calls,
+            "lookups_per_call": round(self.lookups / self.calls, 3) if self.calls else 0
+        }
+
+    def _headers(self, fresh):
+        # fresh skips the user service's lookup cache for exact balances
+        return {"Cache-Control": "no-cache"} if fresh else None
+
+    async def get(self, user_id, fresh=False):
+        """The user's document, or None if there is no such user"""
+        self.lookups += 1
+        if not Config.USER_LOOKUP_COALESCE:
+            self.calls += 1
+            response = await self.user_service.get(f"/api/user/{user_id}/", "GET /api/user/<id>/",
+                                                   headers=self._headers(fresh))
+            return response.json() if response.status_code == 200 else None
+        batch = self._open.get(fresh)
+        if batch is None:
+            batch = self._open[fresh] = {"ids": {}}
+            batch["task"] = asyncio.ensure_future(self._send(batch, fresh))
+        batch["ids"][user_id] = None
+        if len(batch["ids"]) >= Config.USER_LOOKUP_MAX_BATCH and self._open.get(fresh) is batch:
+            del self._open[fresh]
+        # Shielded so one cancelled request doesn't fail the others waiting
+        users = await asyncio.shield(batch["task"])
+        return users.get(user_id)
+
+    async def _send(self, batch, fresh):
+        async with self._slots:
+            # Later lookups start the next batch
+            if self._open.get(fresh) is batch:
+                del self._open[fresh]
+            self.calls += 1
+            if len(batch["ids"]) == 1:
+                user_id, = batch["ids"]
+                response = await self.user_service.get(f"/api/user/{user_id}/", "GET /api/user/<id>/",
+                                                       headers=self._headers(fresh))
+                if response.status_code == 404:
+                    return {}
+                response.raise_for_status()
+                return {user_id: response.json()}
+            response = await self.user_service.post("/api/user/batch", "POST /api/user/batch",
+                                                    json={"ids": list(batch["ids"])}, headers=self._headers(fresh))
+            response.raise_for_status()
+            return {user["_id"]: user for user in response.json()["users"]}
+
+class AsyncReporting:
+    """Async counterpart of Reporting used by the ASGI app (asgi.py).
+
+    The user lookup and the Mongo reads do not depend on each other, so they
+    are awaited together instead of one after the other.
+    """
+
+    def __init__(self, db, users):
+        self.db = db
+        self.users = users
+
+    async def _get_user(self, user_id, fresh=False):
+        return await self.users.get(user_id, fresh)
+
+    async def _report_parts(self, user_id, start, end):
+        parts = []
+        for source in await asyncio.to_thread(partitions.sources, start, end):
+            if isinstance(source, dict):
+                parts.append(await asyncio.to_thread(archived_report_part, source, user_id, start, end))
+            else:
+                # Totals and rows separately, as in report_part()
+                collection = self.db[source]
+                totals, transactions = await asyncio.gather(
+                    collection.aggregate(transaction_report_pipeline(user_id, start, end)).to_list(None),
+                    collection.find(user_match(user_id, start, end)).sort(REPORT_SORT).to_list(None)
+                )
+                parts.append({"totals": totals, "transactions": transactions})
+        return parts
+
+    async def _summary_parts(self, user_id):
+        parts = []
+        for source in await asyncio.to_thread(partitions.sources):
+            if isinstance(source, dict):
+                parts.append(await asyncio.to_thread(archived_summary, source, user_id))
+            else:
+                parts += await self.db[source].aggregate(summary_fallback_pipeline(user_id)).to_list(1)
+        return parts
+
+    async def get_transaction_report(self, user_id, start_date=None, end_date=None):
+        """Generate transaction report for a user"""
+        try:
+            start = parse_date(start_date) if start_date else None
+            end = parse_date(end_date) if end_date else None
+
+            user_data, parts = await asyncio.gather(
+                self._get_user(user_id),
+                self._report_parts(user_id, start, end)
+            )
+            if user_data is None:
+                return jsonify({"error": "User not found"}), 404
+
+            return jsonify(build_transaction_report(user_id, parts))
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    async def get_balance_report(self, user_id, start_date=None, end_date=None):
+        """Generate balance history report for a user"""
+        try:
+            start = parse_date(start_date) if start_date else None
+            end = parse_date(end_date) if end_date else None
+
+            async def find_checkpoint():
+                if start is None:
+                    return None
+                return await self.db.balance_checkpoints.find_one(checkpoint_query(user_id, start), sort=CHECKPOINT_SORT)
+
+            user_data, checkpoint = await asyncio.gather(
+                self._get_user(user_id, fresh=True),
+                find_checkpoint()
+            )
+            if user_data is None:
+                return jsonify({"error": "User not found"}), 404
+
+            current_balance = float(user_data.get('balance', 0))
+            if checkpoint:
+                transactions = await partitions.find_async(self.db, **checkpoint_history_scan(user_id, checkpoint, end))
+                balance_history = replay_from_checkpoint(transactions, user_id, checkpoint, start)
+            else:
+                transactions = await partitions.find_async(self.db, **current_history_scan(user_id, start))
+                balance_history = replay_from_current(transactions, user_id, current_balance, end)
+
+            return jsonify(build_balance_report(user_id, current_balance, balance_history))
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    async def get_user_summary(self, user_id):
+        """Generate comprehensive user summary"""
+        try:
+            user_data, stats = await asyncio.gather(
+                self._get_user(user_id),
+                self.db.user_stats.find_one({"_id": user_id})
+            )
+            if user_data is None:
+                return jsonify({"error": "User not found"}), 404
+
+            if stats is None:
+                stats = combine_summaries(await self._summary_parts(user_id))
+
+            return jsonify(build_user_summary(user_id, user_data, stats))
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    async def get_daily_report(self, user_id, start_date=None, end_date=None):
+        """Per-day sent/received totals read from the materialized buckets"""
+        try:
+            user_data, buckets = await asyncio.gather(
+                self._get_user(user_id),
+                self.db.user_daily_stats.find(daily_query(user_id, start_date, end_date)).sort("date", 1).to_list(None)
+            )
+            if user_data is None:
+                return jsonify({"error": "User not found"}), 404
+
+            return jsonify(build_daily_report(user_id, buckets))
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    async def stream_events(self, user_id, last_event_id=None):
+        """Open a user's live event stream (Server-Sent Events)"""
+        if not Config.EVENTS_ENABLED:
+            return jsonify({"error": "Event feed is disabled"}), 404
+        subscription = events.AsyncSubscription(user_id, asyncio.get_running_loop())
+        try:
+            events.feed.subscribe(subscription, Config.EVENTS_MAX_STREAMS, last_event_id)
+        except events.TooManySubscribers:
+            return jsonify({"error": "Too many open event streams"}), 503, {"Retry-After": "5"}
+        try:
+            user_data = await self._get_user(user_id, fresh=True)
+        except Exception as e:
+            events.feed.unsubscribe(subscription)
+            return jsonify({"error": str(e)}), 500
+        if user_data is None:
+            events.feed.unsubscribe(subscription)
+            return jsonify({"error": "User not found"}), 404
+
+        snapshot = {"user_id": user_id, "balance": float(user_data.get('balance', 0))}
+        response = await make_response(
+            events.astream(subscription, snapshot),
+            {**events.SSE_HEADERS, "Content-Type": events.SSE_MIMETYPE}
+        )
+        # Streams stay open far longer than Quart's RESPONSE_TIMEOUT
+        response.timeout = None
+        return response
@@ -0,0 +1,46 @@
+from quart import Blueprint, current_app, jsonify, request
+from reporting.async_models import AsyncReporting
+from reporting import analytics
+from config import Config
+
+async_reporting_bp = Blueprint('async_reporting', __name__)
+
+def reporting():
+    return AsyncReporting(current_app.mongo_client[Config.MONGODB_DB], current_app.user_lookup)
+
+@async_reporting_bp.route('/api/reports/transactions/<user_id>', methods=['GET'])
+async def get_transaction_report(user_id):
+    """Get transaction summary for a user"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    return await reporting().get_transaction_report(user_id, start_date, end_date)
+
+@async_reporting_bp.route('/api/reports/balance/<user_id>', methods=['GET'])
+async def get_balance_report(user_id):
+    """Get balance history for a user"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    return await reporting().get_balance_report(user_id, start_date, end_date)
+
+@async_reporting_bp.route('/api/reports/summary/<user_id>', methods=['GET'])
+async def get_user_summary(user_id):
+    """Get comprehensive user summary"""
+    return await reporting().get_user_summary(user_id)
+
+@async_reporting_bp.route('/api/reports/daily/<user_id>', methods=['GET'])
+async def get_daily_report(user_id):
+    """Get per-day transaction totals for a user"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    return await reporting().get_daily_report(user_id, start_date, end_date)
+
+@async_reporting_bp.route('/api/reports/analytics/<report>', methods=['GET'])
+async def get_analytics_report(report):
+    """Platform-wide daily-volume, top-users or percentiles report"""
+    body, status = await analytics.handle_async(current_app.mongo_client[Config.MONGODB_DB], report, request.args)
+    return jsonify(body), status
+
+@async_reporting_bp.route('/api/reports/events/<user_id>', methods=['GET'])
+async def stream_user_events(user_id):
+    """Live balance and transaction events for a user, instead of polling"""
+    return await reporting().stream_events(user_id, request.headers.get('Last-Event-ID'))
@@ -0,0 +1,306 @@
+"""Live per-user events from MongoDB change streams.
+
+One consumer thread per process watches the database for new transactions
+and balance updates and hands each event to the subscribers of the users it
+concerns. Clients subscribe once, as Server-Sent Events, to
+``/api/reports/events/<user_id>`` instead of polling the reports and the
+balance endpoint. A stream opens with a ``snapshot`` of the balance, then
+carries ``transaction`` and ``balance`` events and a comment heartbeat
+every ``EVENTS_HEARTBEAT_SECONDS``.
+
+Event ids are change-stream resume tokens, which sort in commit order. The
+consumer saves its resume token to ``event_feed_checkpoints`` every
+``EVENTS_CHECKPOINT_INTERVAL`` seconds and resumes from it after a restart,
+and the last ``EVENTS_REPLAY_BUFFER`` events are kept in memory, so a client
+reconnecting with ``Last-Event-ID`` receives what it missed.
+
+Change streams need a replica set; a single-node one is enough::
+
+    mongod --replSet rs0
+    mongosh --eval 'rs.initiate()'
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import OperationFailure, PyMongoError
+from db import db
+from config import Config
+import serialization
+
+logger = logging.getLogger(__name__)
+
+SSE_MIMETYPE = "text/event-stream"
+# X-Accel-Buffering stops nginx from holding events back
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+HEARTBEAT = ": keepalive\n\n"
+RECONNECT_MS = 3000
+
+# Server error codes after which a saved resume token can't be used again
+RESUME_FAILED_CODES = frozenset([260, 280, 286])
+
+WATCH_PIPELINE = [
+    {"$match": {"$or": [
+        # The legacy collection and the monthly partitions (partitions.py)
+        {"ns.coll": {"$regex": r"^transactions(_\d{4}_\d{2})?$"}, "operationType": "insert"},
+        {
+            "ns.coll": "users",
+            "operationType": "update",
+            "updateDescription.updatedFields.balance": {"$exists": True}
+        }
+    ]}},
+    # Only what the events carry; user documents also hold password hashes
+    {"$project": {
+        "ns": 1,
+        "documentKey": 1,
+        "fullDocument": 1,
+        "updateDescription.updatedFields.balance": 1
+    }}
+]
+
+class TooManySubscribers(Exception):
+    """Raised when this process already holds its limit of open streams"""
+
+def _transaction_data(document):
+    timestamp = document.get("timestamp")
+    return {
+        "_id": str(document["_id"]),
+        "sender_id": document["sender_id"],
+        "receiver_id": document["receiver_id"],
+        "amount": float(str(document["amount"])),
+        "description": document.get("description"),
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "status": document.get("status")
+    }
+
+def change_events(change):
+    """(user_id, event type, data) for every user a change concerns"""
+    if change["ns"]["coll"] == "users":
+        user_id = change["documentKey"]["_id"]
+        balance = change["updateDescription"]["updatedFields"]["balance"]
+        return [(user_id, "balance", {"user_id": user_id, "balance": float(str(balance))})]
+    timestamp = change["fullDocument"].get("timestamp")
+    max_age = timedelta(seconds=Config.EVENTS_MAX_TRANSACTION_AGE)
+    if isinstance(timestamp, datetime) and datetime.utcnow() - timestamp > max_age:
+        # History being moved into its monthly partition, not a new transfer
+        return []
+    transaction = _transaction_data(change["fullDocument"])
+    user_ids = dict.fromkeys([transaction["sender_id"], transaction["receiver_id"]])
+    return [(user_id, "transaction", transaction) for user_id in user_ids]
+
+def format_event(event_type, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event_type}\ndata: {serialization.dumps(data).decode()}\n\n"
+
+class Subscription:
+    """One open stream's bounded queue of (event_id, type, data)"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(Config.EVENTS_QUEUE_SIZE)
+
+    def deliver(self, event):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client: it gets what was queued, then the stream ends
+            # and it resumes from the replay buffer with Last-Event-ID
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class AsyncSubscription(Subscription):
+    """Subscription read from an event loop (the ASGI app)"""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.overflowed = False
+        self._loop = loop
+        self._queue = asyncio.Queue(Config.EVENTS_QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Called from the consumer thread; asyncio queues aren't thread-safe
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class EventFeed:
+    """Change-stream consumer and per-user fan-out for this process"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._recent = []
+        self._lock = threading.Lock()
+        self._consumer_pid = None
+        self._token = None
+        self.connected = False
+        self.last_error = None
+        self.published = 0
+        self.overflowed = 0
+
+    def subscribe(self, subscription, max_subscribers, last_event_id=None):
+        """Register a stream, first queueing buffered events after last_event_id"""
+        self._ensure_consumer()
+        with self._lock:
+            if sum(len(subs) for subs in self._subscribers.values()) >= max_subscribers:
+                raise TooManySubscribers()
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+            if last_event_id:
+                for event_id, user_id, event_type, data in self._recent:
+                    if user_id == subscription.user_id and event_id > last_event_id:
+                        subscription.deliver((event_id, event_type, data))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+            if subscription.overflowed:
+                self.overflowed += 1
+
+    def publish(self, change):
+        event_id = change["_id"]["_data"]
+        events = change_events(change)
+        with self._lock:
+            for user_id, event_type, data in events:
+                self._recent.append((event_id, user_id, event_type, data))
+                for subscription in self._subscribers.get(user_id, ()):
+                    subscription.deliver((event_id, event_type, data))
+            if len(self._recent) > Config.EVENTS_REPLAY_BUFFER:
+                del self._recent[:len(self._recent) - Config.EVENTS_REPLAY_BUFFER]
+            self.published += len(events)
+
+    def _ensure_consumer(self):
+        # Threads don't survive fork(), so each worker process starts its own
+        if self._consumer_pid != os.getpid():
+            with self._lock:
+                if self._consumer_pid != os.getpid():
+                    threading.Thread(target=self._consume_forever, name="event-feed", daemon=True).start()
+                    self._consumer_pid = os.getpid()
+
+    def _saved_token(self):
+        saved = db.event_feed_checkpoints.find_one({"_id": Config.EVENTS_CONSUMER_ID})
+        if not saved:
+            return None
+        # Replaying a long-idle checkpoint would only fill the buffer with
+        # events no connected client is waiting for
+        if datetime.utcnow() - saved["updated_at"] > timedelta(seconds=Config.EVENTS_RESUME_MAX_AGE):
+            return None
+        return saved["resume_token"]
+
+    def _save_token(self):
+        db.event_feed_checkpoints.update_one(
+            {"_id": Config.EVENTS_CONSUMER_ID},
+            {"$set": {"resume_token": self._token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def _consume(self):
+        with db.watch(WATCH_PIPELINE, resume_after=self._token, max_await_time_ms=1000) as stream:
+            self.connected, self.last_error = True, None
+            saved_at = time.monotonic()
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self.publish(change)
+                # Advances while idle too, so a restart never rescans old history
+                self._token = stream.resume_token
+                if self._token and time.monotonic() - saved_at >= Config.EVENTS_CHECKPOINT_INTERVAL:
+                    self._save_token()
+                    saved_at = time.monotonic()
+
+    def _consume_forever(self):
+        delay = 1
+        loaded = False
+        while True:
+            try:
+                if not loaded:
+                    self._token = self._saved_token()
+                    loaded = True
+                self._consume()
+                delay = 1
+                continue
+            except OperationFailure as e:
+                if e.code in RESUME_FAILED_CODES and self._token is not None:
+                    logger.warning("Event feed can't resume from its checkpoint (%s); starting from now", e)
+                    self._token = None
+                    continue
+                error = e
+            except PyMongoError as e:
+                error = e
+            except Exception as e:
+                logger.exception("Event feed failed on a change")
+                error = e
+            if self.last_error is None:
+                logger.warning("Event feed disconnected: %s", error)
+            self.connected, self.last_error = False, str(error)
+            time.sleep(delay)
+            delay = min(delay * 2, Config.EVENTS_RETRY_MAX_SECONDS)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connected": self.connected,
+                "last_error": self.last_error,
+                "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+                "users": len(self._subscribers),
+                "published": self.published,
+                "overflowed": self.overflowed,
+                "buffered": len(self._recent)
+            }
+
+feed = EventFeed()
+
+def stream(subscription, snapshot):
+    """SSE body for a thread-served stream; ends when the client leaves"""
+    try:
+        yield f"retry: {RECONNECT_MS}\n\n" + format_event("snapshot", snapshot)
+        while True:
+            event = subscription.get(0 if subscription.overflowed else Config.EVENTS_HEARTBEAT_SECONDS)
+            if event is not None:
+                yield format_event(event[1], event[2], event[0])
+            elif subscription.overflowed:
+                break
+            else:
+                yield HEARTBEAT
+    finally:
+        feed.unsubscribe(subscription)
+
+async def astream(subscription, snapshot):
+    """SSE body for an event-loop-served stream"""
+    try:
+        yield f"retry: {RECONNECT_MS}\n\n" + format_event("snapshot", snapshot)
+        while True:
+            event = await subscription.get(0 if subscription.overflowed else Config.EVENTS_HEARTBEAT_SECONDS)
+            if event is not None:
+                yield format_event(event[1], event[2], event[0])
+            elif subscription.overflowed:
+                break
+            else:
+                yield HEARTBEAT
+    finally:
+        feed.unsubscribe(subscription)
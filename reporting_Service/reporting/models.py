@@ -1,52 +1,270 @@
-from flask import jsonify
-import requests
-from datetime import datetime
+from flask import Response, jsonify, stream_with_context
+from datetime import datetime, timezone
+from decimal import Decimal
 from dateutil import parser
 from db import db
 from config import Config
+from service_client import get_user_lookup
+from documents import to_datetime, to_decimal, timestamp_range, after_checkpoint
+import archive
+import partitions
+from reporting import events
+
+def parse_date(value):
+    """Parse a report date parameter into a naive UTC datetime"""
+    parsed = parser.parse(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def user_match(user_id, start=None, end=None):
+    """$match stage for a user's transactions, optionally within [start, end].
+
+    Each branch of the timestamp range uses the (sender_id|receiver_id,
+    timestamp) indexes.
+    """
+    match = {"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]}
+    if start is None and end is None:
+        return match
+    return {"$and": [match, timestamp_range(start, end)]}
+
+HISTORY_PROJECTION = {"sender_id": 1, "receiver_id": 1, "amount": 1, "timestamp": 1}
+
+def balance_delta(transaction, user_id):
+    """Change to user_id's balance caused by a transaction"""
+    amount = to_decimal(transaction["amount"])
+    delta = Decimal(0)
+    if transaction["receiver_id"] == user_id:
+        delta += amount
+    if transaction["sender_id"] == user_id:
+        delta -= amount
+    return delta
+
+def history_entry(transaction, balance):
+    """Balance history row: the balance just before the transaction"""
+    timestamp = transaction["timestamp"]
+    return {
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "balance": float(balance),
+        "transaction_id": str(transaction["_id"])
+    }
+
+def transaction_report_pipeline(user_id, start, end):
+    """One partition's totals for a transaction report"""
+    return [
+        {"$match": user_match(user_id, start, end)},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"}
+        }}
+    ]
+
+REPORT_SORT = [("timestamp", 1), ("_id", 1)]
+
+def report_part(collection, user_id, start, end):
+    """A partition's share of a transaction report.
+
+    The rows come from a cursor, in batches, rather than from the totals
+    aggregation: a busy account's month can outgrow the 16 MB limit on a
+    single aggregation result document.
+    """
+    return {
+        "totals": list(collection.aggregate(transaction_report_pipeline(user_id, start, end))),
+        "transactions": list(collection.find(user_match(user_id, start, end)).sort(REPORT_SORT))
+    }
+
+def archived_report_part(record, user_id, start, end):
+    """An archived month's share of a transaction report, shaped like report_part()"""
+    transactions = archive.read(partitions.archive_path(record), user_id=user_id, start=start, end=end)
+    totals = [{
+        "count": len(transactions),
+        "amount": sum((to_decimal(t["amount"]) for t in transactions), Decimal(0))
+    }] if transactions else []
+    return {"totals": totals, "transactions": transactions}
+
+def build_transaction_report(user_id, parts):
+    """Combine the per-partition results, oldest partition first"""
+    total_transactions = 0
+    total_amount = Decimal(0)
+    transactions = []
+    for part in parts:
+        for totals in part["totals"]:
+            total_transactions += totals["count"]
+            total_amount += to_decimal(totals["amount"])
+        transactions += part["transactions"]
+    total_amount = float(total_amount)
+    avg_transaction = total_amount / total_transactions if total_transactions > 0 else 0
+    return {
+        "user_id": user_id,
+        "total_transactions": total_transactions,
+        "total_amount": total_amount,
+        "average_transaction": avg_transaction,
+        "transactions": transactions
+    }
+
+def checkpoint_query(user_id, start):
+    """Nearest balance checkpoint strictly before the window start"""
+    return {"user_id": user_id, "$or": [
+        {"timestamp": {"$lt": start}},
+        {"timestamp": {"$lt": start.isoformat()}}
+    ]}
+
+CHECKPOINT_SORT = [("timestamp", -1), ("transaction_id", -1)]
+
+def checkpoint_history_scan(user_id, checkpoint, end):
+    """Completed transactions after a checkpoint up to end, oldest first"""
+    return {
+        "query": {"$and": [user_match(user_id, None, end), {"status": "completed"}, after_checkpoint(checkpoint)]},
+        "user_id": user_id,
+        "end": end,
+        "after": (checkpoint["timestamp"], checkpoint["transaction_id"]),
+        "status": "completed",
+        "projection": HISTORY_PROJECTION
+    }
+
+def current_history_scan(user_id, start):
+    """Completed transactions from start on, newest first"""
+    return {
+        "query": {"$and": [user_match(user_id, start, None), {"status": "completed"}]},
+        "user_id": user_id,
+        "start": start,
+        "status": "completed",
+        "newest_first": True,
+        "projection": HISTORY_PROJECTION
+    }
+
+def replay_from_checkpoint(transactions, user_id, checkpoint, start):
+    """Replay forward from a checkpoint; transactions sorted oldest first"""
+    balance_history = []
+    running_balance = to_decimal(checkpoint["balance"])
+    for t in transactions:
+        delta = balance_delta(t, user_id)
+        if to_datetime(t["timestamp"]) >= start:
+            balance_history.append(history_entry(t, running_balance))
+        running_balance += delta
+    balance_history.reverse()
+    return balance_history
+
+def replay_from_current(transactions, user_id, current_balance, end):
+    """Walk back from the current balance; transactions sorted newest first"""
+    balance_history = []
+    running_balance = to_decimal(current_balance)
+    for t in transactions:
+        running_balance -= balance_delta(t, user_id)
+        if end is None or to_datetime(t["timestamp"]) <= end:
+            balance_history.append(history_entry(t, running_balance))
+    return balance_history
+
+def build_balance_report(user_id, current_balance, balance_history):
+    return {
+        "user_id": user_id,
+        "current_balance": current_balance,
+        "balance_history": balance_history
+    }
+
+def summary_fallback_pipeline(user_id):
+    """One partition's summary totals, for users that have no materialized stats yet"""
+    return [
+        {"$match": {"$and": [user_match(user_id), {"status": "completed"}]}},
+        {"$group": {
+            "_id": None,
+            "total_transactions": {"$sum": 1},
+            "total_sent": {"$sum": {"$cond": [{"$eq": ["$sender_id", user_id]}, "$amount", 0]}},
+            "total_received": {"$sum": {"$cond": [{"$eq": ["$receiver_id", user_id]}, "$amount", 0]}}
+        }}
+    ]
+
+def archived_summary(record, user_id):
+    """An archived month's summary totals, summed from its rows"""
+    stats = {"total_transactions": 0, "total_sent": Decimal(0), "total_received": Decimal(0)}
+    transactions = archive.read(partitions.archive_path(record), user_id=user_id, status="completed",
+                                columns=HISTORY_PROJECTION)
+    for t in transactions:
+        amount = to_decimal(t["amount"])
+        stats["total_transactions"] += 1
+        if t["sender_id"] == user_id:
+            stats["total_sent"] += amount
+        if t["receiver_id"] == user_id:
+            stats["total_received"] += amount
+    return stats
+
+def combine_summaries(parts):
+    """Add up per-partition summary totals"""
+    stats = {"total_transactions": 0, "total_sent": Decimal(0), "total_received": Decimal(0)}
+    for part in parts:
+        stats["total_transactions"] += part.get("total_transactions", 0)
+        stats["total_sent"] += to_decimal(part.get("total_sent", 0))
+        stats["total_received"] += to_decimal(part.get("total_received", 0))
+    return stats
+
+def build_user_summary(user_id, user_data, stats):
+    total_sent = to_decimal(stats.get("total_sent", 0))
+    total_received = to_decimal(stats.get("total_received", 0))
+    return {
+        "user_id": user_id,
+        "name": user_data.get('name'),
+        "email": user_data.get('email'),
+        "current_balance": float(user_data.get('balance', 0)),
+        "total_transactions": stats.get("total_transactions", 0),
+        "total_amount_sent": float(total_sent),
+        "total_amount_received": float(total_received),
+        "net_balance_change": float(total_received - total_sent),
+        "first_transaction_at": stats.get("first_transaction_at"),
+        "last_transaction_at": stats.get("last_transaction_at")
+    }
+
+def daily_query(user_id, start_date=None, end_date=None):
+    query = {"user_id": user_id}
+    date_range = {}
+    if start_date:
+        date_range["$gte"] = parse_date(start_date).date().isoformat()
+    if end_date:
+        date_range["$lte"] = parse_date(end_date).date().isoformat()
+    if date_range:
+        query["date"] = date_range
+    return query
+
+def build_daily_report(user_id, buckets):
+    return {
+        "user_id": user_id,
+        "days": [
+            {
+                "date": bucket["date"],
+                "total_transactions": bucket.get("total_transactions", 0),
+                "total_amount_sent": float(str(bucket.get("total_sent", 0))),
+                "total_amount_received": float(str(bucket.get("total_received", 0)))
+            }
+            for bucket in buckets
+        ]
+    }
 
 class Reporting:
     def __init__(self):
-        self.transaction_service_url = Config.TRANSACTION_SERVICE_URL
-        self.user_service_url = Config.USER_SERVICE_URL
+        self.users = get_user_lookup(Config.USER_SERVICE_URL)
+
+    def _get_user(self, user_id, fresh=False):
+        # fresh skips the user service's lookup cache for exact balances
+        return self.users.get(user_id, fresh)
 
     def get_transaction_report(self, user_id, start_date=None, end_date=None):
         """Generate transaction report for a user"""
         try:
             # Get user details
-            user_response = requests.get(f"{self.user_service_url}/api/user/{user_id}/")
-            if user_response.status_code != 200:
+            if self._get_user(user_id) is None:
                 return jsonify({"error": "User not found"}), 404
-            
-            # Get transactions
-            transactions_response = requests.get(f"{self.transaction_service_url}/api/transactions/{user_id}/")
-            if transactions_response.status_code != 200:
-                return jsonify({"error": "Failed to fetch transactions"}), 500
-            
-            transactions = transactions_response.json()
-            
-            # Filter by date if provided
-            if start_date and end_date:
-                start = parser.parse(start_date).replace(tzinfo=None)
-                end = parser.parse(end_date).replace(tzinfo=None)
-                transactions = [
-                    t for t in transactions
-                    if start <= parser.parse(t['timestamp']).replace(tzinfo=None) <= end
-                ]
-            
-            # Calculate summary
-            total_transactions = len(transactions)
-            total_amount = sum(float(t['amount']) for t in transactions)
-            avg_transaction = total_amount / total_transactions if total_transactions > 0 else 0
-            
-            return jsonify({
-                "user_id": user_id,
-                "total_transactions": total_transactions,
-                "total_amount": total_amount,
-                "average_transaction": avg_transaction,
-                "transactions": transactions
-            })
-            
+
+            start = parse_date(start_date) if start_date else None
+            end = parse_date(end_date) if end_date else None
+
+            # Mongo totals each partition; only archived months are summed here
+            parts = [
+                archived_report_part(source, user_id, start, end) if isinstance(source, dict)
+                else report_part(db[source], user_id, start, end)
+                for source in partitions.sources(start, end)
+            ]
+            return jsonify(build_transaction_report(user_id, parts))
+
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -54,53 +272,29 @@ class Reporting:
         """Generate balance history report for a user"""
         try:
             # Get user details
-            user_response = requests.get(f"{self.user_service_url}/api/user/{user_id}/")
-            if user_response.status_code != 200:
+            user_data = self._get_user(user_id, fresh=True)
+            if user_data is None:
                 return jsonify({"error": "User not found"}), 404
-            
-            user_data = user_response.json()
+
             current_balance = float(user_data.get('balance', 0))
-            
-            # Get transactions
-            transactions_response = requests.get(f"{self.transaction_service_url}/api/transactions/{user_id}/")
-            if transactions_response.status_code != 200:
-                return jsonify({"error": "Failed to fetch transactions"}), 500
-            
-            transactions = transactions_response.json()
-            
-            # Filter by date if provided
-            if start_date and end_date:
-                start = parser.parse(start_date).replace(tzinfo=None)
-                end = parser.parse(end_date).replace(tzinfo=None)
-                transactions = [
-                    t for t in transactions
-                    if start <= parser.parse(t['timestamp']).replace(tzinfo=None) <= end
-                ]
-            
-            # Sort transactions by timestamp
-            transactions.sort(key=lambda x: parser.parse(x['timestamp']).replace(tzinfo=None))
-            
-            # Calculate balance history
-            balance_history = []
-            running_balance = current_balance
-            
-            for t in reversed(transactions):
-                if t['sender_id'] == user_id:
-                    running_balance += float(t['amount'])
-                else:
-                    running_balance -= float(t['amount'])
-                balance_history.append({
-                    "timestamp": t['timestamp'],
-                    "balance": running_balance,
-                    "transaction_id": t['_id']
-                })
-            
-            return jsonify({
-                "user_id": user_id,
-                "current_balance": current_balance,
-                "balance_history": balance_history
-            })
-            
+
+            start = parse_date(start_date) if start_date else None
+            end = parse_date(end_date) if end_date else None
+
+            # Start from the nearest checkpoint before the window when there
+            # is one, otherwise walk back from the current balance
+            checkpoint = None
+            if start is not None:
+                checkpoint = db.balance_checkpoints.find_one(checkpoint_query(user_id, start), sort=CHECKPOINT_SORT)
+            if checkpoint:
+                transactions = partitions.find(**checkpoint_history_scan(user_id, checkpoint, end))
+                balance_history = replay_from_checkpoint(transactions, user_id, checkpoint, start)
+            else:
+                transactions = partitions.find(**current_history_scan(user_id, start))
+                balance_history = replay_from_current(transactions, user_id, current_balance, end)
+
+            return jsonify(build_balance_report(user_id, current_balance, balance_history))
+
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -108,34 +302,59 @@ class Reporting:
         """Generate comprehensive user summary"""
         try:
             # Get user details
-            user_response = requests.get(f"{self.user_service_url}/api/user/{user_id}/")
-            if user_response.status_code != 200:
+            user_data = self._get_user(user_id)
+            if user_data is None:
                 return jsonify({"error": "User not found"}), 404
-            
-            user_data = user_response.json()
-            
-            # Get transactions
-            transactions_response = requests.get(f"{self.transaction_service_url}/api/transactions/{user_id}/")
-            if transactions_response.status_code != 200:
-                return jsonify({"error": "Failed to fetch transactions"}), 500
-            
-            transactions = transactions_response.json()
-            
-            # Calculate statistics
-            total_transactions = len(transactions)
-            total_sent = sum(float(t['amount']) for t in transactions if t['sender_id'] == user_id)
-            total_received = sum(float(t['amount']) for t in transactions if t['receiver_id'] == user_id)
-            
-            return jsonify({
-                "user_id": user_id,
-                "name": user_data.get('name'),
-                "email": user_data.get('email'),
-                "current_balance": float(user_data.get('balance', 0)),
-                "total_transactions": total_transactions,
-                "total_amount_sent": total_sent,
-                "total_amount_received": total_received,
-                "net_balance_change": total_received - total_sent
-            })
-            
+
+            # Read the materialized stats kept by the transactions service;
+            # only users with no stats document yet fall back to aggregation
+            stats = db.user_stats.find_one({"_id": user_id})
+            if stats is None:
+                stats = combine_summaries(
+                    archived_summary(source, user_id) if isinstance(source, dict)
+                    else next(db[source].aggregate(summary_fallback_pipeline(user_id)), {})
+                    for source in partitions.sources()
+                )
+
+            return jsonify(build_user_summary(user_id, user_data, stats))
+
         except Exception as e:
-            return jsonify({"error": str(e)}), 500 
\ No newline at end of file
+            return jsonify({"error": str(e)}), 500
+
+    def get_daily_report(self, user_id, start_date=None, end_date=None):
+        """Per-day sent/received totals read from the materialized buckets"""
+        try:
+            if self._get_user(user_id) is None:
+                return jsonify({"error": "User not found"}), 404
+
+            buckets = db.user_daily_stats.find(daily_query(user_id, start_date, end_date)).sort("date", 1)
+            return jsonify(build_daily_report(user_id, buckets))
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def stream_events(self, user_id, last_event_id=None):
+        """Open a user's live event stream (Server-Sent Events)"""
+        if not Config.EVENTS_ENABLED:
+            return jsonify({"error": "Event feed is disabled"}), 404
+        # Subscribe before the snapshot so no change falls between the two
+        subscription = events.Subscription(user_id)
+        try:
+            events.feed.subscribe(subscription, Config.EVENTS_MAX_THREAD_STREAMS, last_event_id)
+        except events.TooManySubscribers:
+            return jsonify({"error": "Too many open event streams"}), 503, {"Retry-After": "5"}
+        try:
+            user_data = self._get_user(user_id, fresh=True)
+        except Exception as e:
+            events.feed.unsubscribe(subscription)
+            return jsonify({"error": str(e)}), 500
+        if user_data is None:
+            events.feed.unsubscribe(subscription)
+            return jsonify({"error": "User not found"}), 404
+
+        snapshot = {"user_id": user_id, "balance": float(user_data.get('balance', 0))}
+        return Response(
+            stream_with_context(events.stream(subscription, snapshot)),
+            mimetype=events.SSE_MIMETYPE,
+            headers=events.SSE_HEADERS
+        )
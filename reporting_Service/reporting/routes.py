@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request
 from reporting.models import Reporting
+from reporting import analytics, events
+import service_client
 
 reporting_bp = Blueprint('reporting', __name__)
 
@@ -20,4 +22,32 @@ def get_balance_report(user_id):
 @reporting_bp.route('/api/reports/summary/<user_id>', methods=['GET'])
 def get_user_summary(user_id):
     """Get comprehensive user summary"""
-    return Reporting().get_user_summary(user_id) 
\ No newline at end of file
+    return Reporting().get_user_summary(user_id) 
+
+@reporting_bp.route('/api/reports/daily/<user_id>', methods=['GET'])
+def get_daily_report(user_id):
+    """Get per-day transaction totals for a user"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    return Reporting().get_daily_report(user_id, start_date, end_date)
+
+@reporting_bp.route('/api/reports/analytics/<report>', methods=['GET'])
+def get_analytics_report(report):
+    """Platform-wide daily-volume, top-users or percentiles report"""
+    body, status = analytics.handle(report, request.args)
+    return jsonify(body), status
+
+@reporting_bp.route('/api/reports/events/<user_id>', methods=['GET'])
+def stream_user_events(user_id):
+    """Live balance and transaction events for a user, instead of polling"""
+    return Reporting().stream_events(user_id, request.headers.get('Last-Event-ID'))
+
+@reporting_bp.route('/api/internal/event-stats', methods=['GET'])
+def get_event_stats():
+    """Change-stream consumer state and open event streams in this process"""
+    return jsonify(events.feed.stats())
+
+@reporting_bp.route('/api/internal/client-stats', methods=['GET'])
+def get_client_stats():
+    """Per-endpoint latency and connection pool counters for outbound calls"""
+    return jsonify(service_client.all_stats())
\ No newline at end of file
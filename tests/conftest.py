@@ -0,0 +1,41 @@
+"""Fixtures running the three services in-process against mongomock.
+
+The stack from ``benchmarks/stack.py`` is started once per session with the
+outbox worker off, so tests drive pending transfers themselves, and with no
+partition cache, so months created by a split are seen at once.
+"""
+import os
+import sys
+from decimal import Decimal
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from stack import Stack
+from seed import seed
+
+@pytest.fixture(scope="session")
+def stack():
+    stack = Stack("mongomock", db_name="insta_pay_test", env={
+        "OUTBOX_WORKER_ENABLED": "0",
+        "PARTITION_CACHE_SECONDS": "0"
+    }).start()
+    yield stack
+    stack.stop()
+
+@pytest.fixture
+def users(stack):
+    """Ids of freshly seeded users, with their history split into monthly partitions"""
+    seeded = seed(stack.db, users=10, transactions=300, days=90)
+    stack.run_tool("transactions", "compactor.py", "split")
+    return [user["_id"] for user in seeded]
+
+@pytest.fixture
+def transactions_url(stack):
+    return stack.url("transactions")
+
+def balance(db, user_id):
+    return Decimal(str(db.users.find_one({"_id": user_id})["balance"]))
+
+def total_balance(db):
+    return sum(Decimal(str(user["balance"])) for user in db.users.find())
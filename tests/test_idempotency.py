@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+import requests
+from conftest import balance
+
+def _transfer(url, body, key):
+    return requests.post(url + "/api/transactions/", json=body, headers={"Idempotency-Key": key})
+
+def test_replay_returns_first_response(stack, users, transactions_url):
+    body = {"sender_id": users[0], "receiver_id": users[1], "amount": 3}
+    before = balance(stack.db, users[0])
+
+    first = _transfer(transactions_url, body, "replay")
+    second = _transfer(transactions_url, body, "replay")
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert second.json()["_id"] == first.json()["_id"]
+    assert balance(stack.db, users[0]) == before - 3
+
+def test_key_reused_with_different_body(stack, users, transactions_url):
+    _transfer(transactions_url, {"sender_id": users[0], "receiver_id": users[1], "amount": 3}, "conflict")
+
+    response = _transfer(transactions_url, {"sender_id": users[0], "receiver_id": users[1], "amount": 4}, "conflict")
+
+    assert response.status_code == 422
+
+def test_key_in_progress_until_lease_lapses(stack, users, transactions_url):
+    body = {"sender_id": users[0], "receiver_id": users[1], "amount": 5}
+    first = _transfer(transactions_url, body, "crashed")
+    before = balance(stack.db, users[0])
+    # As if the request died after moving the money but before storing its response
+    stack.db.idempotency_keys.update_one({"_id": "crashed"}, {
+        "$set": {"state": "in_progress", "lease_expires_at": datetime.utcnow() + timedelta(seconds=60)},
+        "$unset": {"body": 1, "status": 1}
+    })
+
+    busy = _transfer(transactions_url, body, "crashed")
+    assert busy.status_code == 409
+    assert busy.headers.get("Retry-After")
+
+    stack.db.idempotency_keys.update_one({"_id": "crashed"},
+                                         {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+    retried = _transfer(transactions_url, body, "crashed")
+
+    assert retried.status_code == 201
+    assert retried.json()["_id"] == first.json()["_id"]
+    assert balance(stack.db, users[0]) == before
@@ -0,0 +1,61 @@
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+import requests
+from bson.decimal128 import Decimal128
+from conftest import balance
+
+def _expire_lease(db, transfer_id):
+    db.transfer_outbox.update_one({"_id": transfer_id}, {
+        "$set": {"state": "pending", "next_attempt_at": datetime.utcnow() - timedelta(seconds=1)},
+        "$unset": {"finished_at": 1}
+    })
+
+def _recorded(stack, transfer_id):
+    return requests.get(stack.url("transactions") + f"/api/transaction/{transfer_id}").json()
+
+def test_expired_lease_is_driven_once(stack, users):
+    sender, receiver = users[0], users[1]
+    before = balance(stack.db, sender), balance(stack.db, receiver)
+    transfer_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    # Left by a process that died after writing the entry
+    stack.db.transfer_outbox.insert_one({
+        "_id": transfer_id,
+        "transaction": {
+            "_id": transfer_id,
+            "sender_id": sender,
+            "receiver_id": receiver,
+            "amount": Decimal128("7"),
+            "description": "",
+            "timestamp": now,
+            "status": "pending"
+        },
+        "users": [sender, receiver],
+        "state": "pending",
+        "attempts": 1,
+        "created_at": now,
+        "next_attempt_at": now - timedelta(seconds=1)
+    })
+
+    stack.run_tool("transactions", "outbox.py", "once")
+    stack.run_tool("transactions", "outbox.py", "once")
+
+    assert stack.db.transfer_outbox.find_one({"_id": transfer_id})["state"] == "completed"
+    assert balance(stack.db, sender) == before[0] - Decimal("7")
+    assert balance(stack.db, receiver) == before[1] + Decimal("7")
+    assert _recorded(stack, transfer_id)["status"] == "completed"
+
+def test_recovery_does_not_repeat_applied_transfer(stack, users, transactions_url):
+    sender = users[0]
+    response = requests.post(transactions_url + "/api/transactions/",
+                             json={"sender_id": sender, "receiver_id": users[1], "amount": 9})
+    transfer_id = response.json()["_id"]
+    after = balance(stack.db, sender)
+    # As if the process died after the user service applied it
+    _expire_lease(stack.db, transfer_id)
+
+    stack.run_tool("transactions", "outbox.py", "once")
+
+    assert stack.db.transfer_outbox.find_one({"_id": transfer_id})["state"] == "completed"
+    assert balance(stack.db, sender) == after
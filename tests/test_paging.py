@@ -0,0 +1,34 @@
+import requests
+
+def _partitions(db):
+    return [name for name in db.list_collection_names() if name.startswith("transactions_")]
+
+def test_cursor_pages_cover_history_across_months(stack, users, transactions_url):
+    assert len(_partitions(stack.db)) > 1
+    user_id = users[0]
+    url = transactions_url + f"/api/transactions/{user_id}/"
+    everything = requests.get(url, params={"all": "true"}).json()
+
+    paged = []
+    cursor = None
+    while True:
+        params = {"limit": 7}
+        if cursor:
+            params["cursor"] = cursor
+        response = requests.get(url, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 7
+        paged += page
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    newest_first = sorted(everything, key=lambda t: (t["timestamp"], t["_id"]), reverse=True)
+    assert [t["_id"] for t in paged] == [t["_id"] for t in newest_first]
+    assert len({t["timestamp"][:7] for t in paged}) > 1
+
+def test_invalid_cursor(stack, users, transactions_url):
+    response = requests.get(transactions_url + f"/api/transactions/{users[0]}/", params={"cursor": "nope"})
+
+    assert response.status_code == 400
@@ -0,0 +1,63 @@
+import random
+import threading
+import requests
+from conftest import balance, total_balance
+
+def test_transfer_moves_amount(stack, users, transactions_url):
+    sender, receiver = users[0], users[1]
+    before = balance(stack.db, sender), balance(stack.db, receiver)
+
+    response = requests.post(transactions_url + "/api/transactions/",
+                             json={"sender_id": sender, "receiver_id": receiver, "amount": 25})
+
+    assert response.status_code == 201
+    assert balance(stack.db, sender) == before[0] - 25
+    assert balance(stack.db, receiver) == before[1] + 25
+
+def test_batch_applies_valid_transfers_only(stack, users, transactions_url):
+    total = total_balance(stack.db)
+    sender = users[0]
+    before = balance(stack.db, sender)
+
+    response = requests.post(transactions_url + "/api/transactions/batch", json={"transfers": [
+        {"sender_id": sender, "receiver_id": users[1], "amount": 10},
+        {"sender_id": sender, "receiver_id": "no-such-user", "amount": 10},
+        {"sender_id": users[2], "receiver_id": sender, "amount": 4}
+    ]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["status"] == "completed"
+    assert results[1]["status"] != "completed"
+    assert results[2]["status"] == "completed"
+    assert balance(stack.db, sender) == before - 10 + 4
+    assert total_balance(stack.db) == total
+
+def test_concurrent_transfers_and_batches_conserve_balances(stack, users, transactions_url):
+    total = total_balance(stack.db)
+    codes = []
+
+    def work(seed_value):
+        rng = random.Random(seed_value)
+        for i in range(9):
+            if i % 3 == 0:
+                transfers = []
+                for _ in range(10):
+                    sender, receiver = rng.sample(users, 2)
+                    transfers.append({"sender_id": sender, "receiver_id": receiver, "amount": 1})
+                response = requests.post(transactions_url + "/api/transactions/batch", json={"transfers": transfers})
+            else:
+                # Mostly out of one hot account
+                response = requests.post(transactions_url + "/api/transactions/", json={
+                    "sender_id": users[0], "receiver_id": rng.choice(users[1:]), "amount": 1
+                })
+            codes.append(response.status_code)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert set(codes) <= {200, 201, 503}
+    assert total_balance(stack.db) == total
@@ -2,6 +2,12 @@ from flask import Flask
 from flask_cors import CORS
 from routes import transaction_bp
 from config import Config
+from db import ensure_indexes
+import outbox
+import metrics
+import tracing
+import health
+import serialization
 
 # Create Flask app
 app = Flask(__name__)
@@ -9,12 +15,32 @@ app = Flask(__name__)
 CORS(app, 
      resources={r"/*": {"origins": ["http://localhost:3000", "http://localhost:80", "http://localhost"]}},
      supports_credentials=True,
-     allow_headers=["Content-Type", "Authorization"],
+     allow_headers=["Content-Type", "Authorization", "Idempotency-Key", "Prefer"],
+     expose_headers=["X-Next-Cursor"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"])
 
 # Register blueprint
 app.secret_key = Config.SECRET_KEY
 app.register_blueprint(transaction_bp)
+metrics.init_app(app)
+tracing.init_app(app)
+health.init_app(app)
+serialization.init_app(app)
+
+def startup():
+    """Create indexes and start background workers for this process"""
+    try:
+        ensure_indexes()
+    except Exception as e:
+        app.logger.warning("Could not create indexes: %s", e)
+
+    # Finish transfers left pending by timeouts or crashes, and queued ones
+    if Config.OUTBOX_WORKER_ENABLED or Config.ASYNC_TRANSFERS:
+        outbox.start_worker()
+
+# Under gunicorn this runs in each worker after fork (see gunicorn.conf.py)
+if not Config.DEFER_STARTUP:
+    startup()
 
 if __name__ == '__main__':
     app.run(
@@ -0,0 +1,157 @@
+"""Per-user balance checkpoints.
+
+A checkpoint records a user's balance right after one completed transaction
+(identified by its ``timestamp`` and ``_id``). Balance history for any window
+can then start from the nearest earlier checkpoint and replay only the
+transactions in between, instead of walking the whole history.
+
+Checkpoints are written by a compaction job and verified by a checker::
+
+    python checkpoints.py compact [--user USER_ID]
+    python checkpoints.py check [--user USER_ID]
+"""
+import argparse
+import sys
+from datetime import datetime
+from decimal import Decimal
+from db import db
+import partitions
+from config import Config
+from documents import to_decimal, to_decimal128, after_checkpoint
+
+# Balances are still doubles on the user service, so allow their rounding
+TOLERANCE = Decimal("0.000001")
+
+def _delta(transaction, user_id):
+    amount = to_decimal(transaction["amount"])
+    delta = Decimal(0)
+    if transaction["receiver_id"] == user_id:
+        delta += amount
+    if transaction["sender_id"] == user_id:
+        delta -= amount
+    return delta
+
+def _completed(user_id, *conditions):
+    return {"$and": [
+        {"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]},
+        {"status": "completed"},
+        *conditions
+    ]}
+
+def _key(checkpoint):
+    return checkpoint["timestamp"], checkpoint["transaction_id"]
+
+def _history(user_id, after=None, until=None, projection=None):
+    """Completed transactions after one checkpoint and up to another, oldest first"""
+    conditions = []
+    if after:
+        conditions.append(after_checkpoint(after))
+    if until:
+        conditions.append({"$nor": [after_checkpoint(until)]})
+    return partitions.find(
+        _completed(user_id, *conditions),
+        user_id=user_id,
+        status="completed",
+        after=_key(after) if after else None,
+        until=_key(until) if until else None,
+        projection=projection
+    )
+
+def latest_checkpoint(user_id):
+    return db.balance_checkpoints.find_one(
+        {"user_id": user_id},
+        sort=[("timestamp", -1), ("transaction_id", -1)]
+    )
+
+def _checkpoint(user_id, transaction, balance):
+    return {
+        "_id": f"{user_id}:{transaction['_id']}",
+        "user_id": user_id,
+        "timestamp": transaction["timestamp"],
+        "transaction_id": transaction["_id"],
+        "balance": to_decimal128(balance),
+        "created_at": datetime.utcnow()
+    }
+
+def compact_user(user_id, interval=None):
+    """Write checkpoints every ``interval`` transactions since the latest one"""
+    interval = interval or Config.CHECKPOINT_INTERVAL
+    last = latest_checkpoint(user_id)
+    if last:
+        balance = to_decimal(last["balance"])
+    else:
+        # First run: anchor on the current balance minus every logged change
+        user = db.users.find_one({"_id": user_id}, {"balance": 1})
+        if not user:
+            return 0
+        balance = to_decimal(user.get("balance", 0)) - sum(
+            _delta(t, user_id)
+            for t in _history(user_id, projection={"sender_id": 1, "receiver_id": 1, "amount": 1})
+        )
+
+    written = []
+    seen = 0
+    for transaction in _history(user_id, last):
+        balance += _delta(transaction, user_id)
+        seen += 1
+        if seen % interval == 0:
+            written.append(_checkpoint(user_id, transaction, balance))
+    if written:
+        db.balance_checkpoints.insert_many(written, ordered=False)
+    return len(written)
+
+def check_user(user_id):
+    """Replay the log between checkpoints and return any mismatches"""
+    problems = []
+    previous = None
+    for checkpoint in db.balance_checkpoints.find({"user_id": user_id}).sort([("timestamp", 1), ("transaction_id", 1)]):
+        if previous is not None:
+            expected = to_decimal(previous["balance"]) + sum(
+                _delta(t, user_id) for t in _history(user_id, previous, checkpoint)
+            )
+            stored = to_decimal(checkpoint["balance"])
+            if abs(expected - stored) > TOLERANCE:
+                problems.append({
+                    "checkpoint_id": checkpoint["_id"],
+                    "expected": str(expected),
+                    "stored": str(stored)
+                })
+        previous = checkpoint
+
+    if previous is not None:
+        user = db.users.find_one({"_id": user_id}, {"balance": 1})
+        if user:
+            expected = to_decimal(previous["balance"]) + sum(
+                _delta(t, user_id) for t in _history(user_id, previous)
+            )
+            current = to_decimal(user.get("balance", 0))
+            if abs(expected - current) > TOLERANCE:
+                problems.append({
+                    "checkpoint_id": "current_balance",
+                    "expected": str(expected),
+                    "stored": str(current)
+                })
+    return problems
+
+def _user_ids(user_id=None):
+    if user_id:
+        return [user_id]
+    return [user["_id"] for user in db.users.find({}, {"_id": 1})]
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Maintain balance checkpoints")
+    arg_parser.add_argument('command', choices=['compact', 'check'])
+    arg_parser.add_argument('--user', help="Only process this user id")
+    args = arg_parser.parse_args()
+
+    if args.command == 'compact':
+        total = sum(compact_user(user_id) for user_id in _user_ids(args.user))
+        print(f"Wrote {total} checkpoints")
+    else:
+        failed = False
+        for user_id in _user_ids(args.user):
+            for problem in check_user(user_id):
+                failed = True
+                print(f"{user_id}: {problem}")
+        print("Checkpoints inconsistent" if failed else "Checkpoints consistent")
+        sys.exit(1 if failed else 0)
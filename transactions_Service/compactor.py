@@ -0,0 +1,183 @@
+"""Moves transactions between storage tiers.
+
+``split`` moves the documents of the legacy ``transactions`` collection into
+their monthly partitions, in ``_id`` order and in batches, and drops the
+collection once it is empty. It first finishes the BSON type migration
+(migrate.py), so partitions and checkpoints only hold BSON dates. Run it
+after every process writes to partitions; it can be stopped and rerun at
+any time.
+
+``archive`` is the background compactor: every month older than
+``ARCHIVE_AFTER_MONTHS`` is written to an Arrow IPC file under
+``ARCHIVE_DIR``, checked, recorded in ``transaction_archives`` and, once
+every process has had ``--grace`` seconds to notice, dropped from MongoDB.
+Months that still have transfers pending in the outbox are left for a
+later run. With ``--interval`` it repeats, as a sidecar or scheduled job.
+
+    python compactor.py split [--batch-size N] [--throttle SECONDS]
+    python compactor.py archive [--after-months N] [--grace SECONDS] [--interval SECONDS]
+    python compactor.py status
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from db import db
+from config import Config
+import archive
+import migrate
+import outbox
+import partitions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DUPLICATE_KEY = 11000
+
+def _insert_moved(collection, documents):
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # Already moved by an earlier, interrupted run
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+
+def split(batch_size=DEFAULT_BATCH_SIZE, throttle=0):
+    """Move the legacy collection into monthly partitions; returns documents moved"""
+    migrate.run(batch_size, throttle)
+    legacy = db[partitions.LEGACY_COLLECTION]
+    moved = 0
+    while True:
+        batch = list(legacy.find().sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        by_month = {}
+        for document in batch:
+            by_month.setdefault(partitions.month_of(document["timestamp"]), []).append(document)
+        for documents in by_month.values():
+            _insert_moved(partitions.collection_for(documents[0]["timestamp"]), documents)
+        legacy.delete_many({"_id": {"$in": [document["_id"] for document in batch]}})
+        moved += len(batch)
+        if throttle:
+            time.sleep(throttle)
+    if partitions.LEGACY_COLLECTION in db.list_collection_names() and legacy.estimated_document_count() == 0:
+        legacy.drop()
+    return moved
+
+def _cutoff(after_months):
+    """The oldest month kept in MongoDB"""
+    now = datetime.utcnow()
+    month = (now.year, now.month)
+    for _ in range(max(after_months, 1)):
+        month = partitions.previous_month(month)
+    return month
+
+def _has_pending(month):
+    start, following = partitions.month_bounds(month)
+    return db.transfer_outbox.count_documents({"state": outbox.PENDING, "$or": [
+        {"transaction.timestamp": {"$gte": start, "$lt": following}},
+        {"transaction.timestamp": {"$gte": start.isoformat(), "$lt": following.isoformat()}}
+    ]}, limit=1) > 0
+
+def archive_month(month):
+    """Write a month to its Arrow file and record it; returns the row count"""
+    name = partitions.partition_name(month)
+    collection = db[name]
+    expected = collection.count_documents({})
+    record = {
+        "_id": name,
+        "year": month[0],
+        "month": month[1],
+        "file": f"{name}.arrow"
+    }
+    os.makedirs(Config.ARCHIVE_DIR, exist_ok=True)
+    path = partitions.archive_path(record)
+    # Partitions only hold BSON dates; sorting a whole month may spill to disk
+    rows = archive.write_month(
+        path,
+        collection.find().sort([("timestamp", 1), ("_id", 1)]).allow_disk_use(True)
+    )
+    if rows != expected or archive.count_rows(path) != expected:
+        os.remove(path)
+        raise RuntimeError(f"{name}: archived {rows} rows, expected {expected}")
+    record.update({"rows": rows, "archived_at": datetime.utcnow()})
+    db[partitions.ARCHIVES_COLLECTION].replace_one({"_id": name}, record, upsert=True)
+    return rows
+
+def archive_old(after_months=None, grace=None):
+    """Archive and drop every month older than ``after_months``; returns {month name: rows}"""
+    after_months = Config.ARCHIVE_AFTER_MONTHS if after_months is None else after_months
+    grace = 2 * Config.PARTITION_CACHE_SECONDS if grace is None else grace
+    partitions.catalog.refresh(force=True)
+    cutoff = _cutoff(after_months)
+    archived, to_drop = {}, []
+    for month in sorted(partitions.catalog.months):
+        if month >= cutoff:
+            continue
+        name = partitions.partition_name(month)
+        record = partitions.catalog.archived.get(month)
+        if record is None:
+            if _has_pending(month):
+                logger.warning("%s has transfers pending in the outbox; not archived yet", name)
+                continue
+            archived[name] = archive_month(month)
+        elif db[name].count_documents({}) != record["rows"]:
+            # Written to after it was archived: readers ignore the collection
+            logger.error("%s differs from its archive; not dropped", name)
+            continue
+        # Also finishes a run that stopped between recording and dropping
+        to_drop.append(name)
+    if to_drop:
+        # Processes go on reading the collections until their catalog expires
+        time.sleep(grace)
+        for name in to_drop:
+            db[name].drop()
+    return archived
+
+def status():
+    partitions.catalog.refresh(force=True)
+    catalog = partitions.catalog
+    report = {}
+    if catalog.legacy:
+        report[partitions.LEGACY_COLLECTION] = {
+            "tier": "mongo",
+            "documents": db[partitions.LEGACY_COLLECTION].estimated_document_count()
+        }
+    for month in sorted(catalog.months | set(catalog.archived)):
+        name = partitions.partition_name(month)
+        record = catalog.archived.get(month)
+        if record:
+            report[name] = {"tier": "archive", "documents": record["rows"], "file": partitions.archive_path(record)}
+        else:
+            report[name] = {"tier": "mongo", "documents": db[name].estimated_document_count()}
+    return report
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Partition and archive the transaction log")
+    arg_parser.add_argument('command', choices=['split', 'archive', 'status'])
+    arg_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    arg_parser.add_argument('--throttle', type=float, default=0,
+                            help="Seconds to sleep between split batches")
+    arg_parser.add_argument('--after-months', type=int,
+                            help="Archive months older than this many (default ARCHIVE_AFTER_MONTHS)")
+    arg_parser.add_argument('--grace', type=float,
+                            help="Seconds between archiving a month and dropping its collection")
+    arg_parser.add_argument('--interval', type=float, default=0,
+                            help="Repeat the archive run every this many seconds")
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'split':
+        print(f"Moved {split(args.batch_size, args.throttle)} transactions into monthly partitions")
+    elif args.command == 'archive':
+        while True:
+            for name, rows in archive_old(args.after_months, args.grace).items():
+                print(f"{name}: archived {rows} transactions")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    else:
+        for name, report in status().items():
+            print(f"{name}: {report}")
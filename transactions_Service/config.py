@@ -9,9 +9,94 @@ class Config:
     MONGODB_URI = os.getenv('MONGODB_URI')
     MONGODB_DB = os.getenv('MONGODB_DB')
     
+    # MongoDB client pool and timeouts
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    # 0 leaves socket reads unbounded, which long report aggregations need
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '0'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0'))
+
+    # Readiness probe caches its Mongo ping for this long
+    READINESS_CACHE_SECONDS = float(os.getenv('READINESS_CACHE_SECONDS', '2'))
+    # Set by gunicorn.conf.py: startup work then runs in each worker after fork
+    DEFER_STARTUP = os.getenv('DEFER_STARTUP', '0') == '1'
+    
     # Service URLs
     USER_SERVICE_URL = os.getenv('USER_SERVICE_URL')
     
+    # Inter-service HTTP client
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+    HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+    HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.1'))
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+    # User lookups: merge concurrent ones into POST /api/user/batch calls,
+    # with at most this many calls in flight and ids per call. A lookup
+    # with nothing to merge with is still sent as a single GET.
+    USER_LOOKUP_COALESCE = os.getenv('USER_LOOKUP_COALESCE', '1') == '1'
+    USER_LOOKUP_CONCURRENCY = int(os.getenv('USER_LOOKUP_CONCURRENCY', '4'))
+    USER_LOOKUP_MAX_BATCH = int(os.getenv('USER_LOOKUP_MAX_BATCH', '100'))
+    
+    # Largest accepted POST /api/transactions/batch body
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '5000'))
+    
+    # Transaction history paging
+    TRANSACTIONS_PAGE_SIZE = int(os.getenv('TRANSACTIONS_PAGE_SIZE', '50'))
+    TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv('TRANSACTIONS_MAX_PAGE_SIZE', '500'))
+    
+    # Documents per chunk for streamed (NDJSON / chunked JSON) responses
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+    
+    # Monthly transaction partitions and their Arrow archive (partitions.py)
+    PARTITION_CACHE_SECONDS = float(os.getenv('PARTITION_CACHE_SECONDS', '30'))
+    # Shared by every service that reads transactions
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+    ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '6'))
+    
+    # Transactions between balance checkpoints written by checkpoints.py
+    CHECKPOINT_INTERVAL = int(os.getenv('CHECKPOINT_INTERVAL', '100'))
+    
+    # Idempotency-Key responses are replayed for this many seconds
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+    # A key whose request died without finishing can be taken over by a
+    # retry after this long; keep it above GUNICORN_TIMEOUT
+    IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '120'))
+    
+    # Transfer outbox worker
+    OUTBOX_WORKER_ENABLED = os.getenv('OUTBOX_WORKER_ENABLED', '1') == '1'
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '1'))
+    OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '30'))
+    OUTBOX_MAX_BACKOFF = int(os.getenv('OUTBOX_MAX_BACKOFF', '60'))
+    OUTBOX_RETENTION = int(os.getenv('OUTBOX_RETENTION', '604800'))
+    OUTBOX_SCAN_LIMIT = int(os.getenv('OUTBOX_SCAN_LIMIT', '500'))
+    TRANSFER_WORKERS = int(os.getenv('TRANSFER_WORKERS', '4'))
+    # Queue every transfer and answer 202 instead of waiting for the user service
+    ASYNC_TRANSFERS = os.getenv('ASYNC_TRANSFERS', '0') == '1'
+
+    # Per-account serialization of transfers within a process
+    TRANSFER_LANES = int(os.getenv('TRANSFER_LANES', '64'))
+    TRANSFER_LANE_TIMEOUT = float(os.getenv('TRANSFER_LANE_TIMEOUT', '5'))
+    
+    # Log sampled stacks for requests slower than this (0 disables)
+    PROFILE_SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUEST_MS', '0'))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.01'))
+    
+    # Tracing: sampled spans are exported as OTLP/JSON to a file and/or collector
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'transactions-service')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+    TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', '')
+    TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL', '')
+    TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '2'))
+    TRACE_BATCH_SIZE = int(os.getenv('TRACE_BATCH_SIZE', '512'))
+    TRACE_MAX_QUEUE = int(os.getenv('TRACE_MAX_QUEUE', '10000'))
+    
+    # Response encoding: orjson, or stdlib to compare against (serialization.py)
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+    
     # Flask Configuration
     FLASK_APP = os.getenv('FLASK_APP')
     FLASK_ENV = os.getenv('FLASK_ENV')
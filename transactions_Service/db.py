@@ -1,6 +1,65 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from config import Config
+from metrics import MongoCommandMetrics
+from tracing import MongoCommandTracing
 
 # Setup MongoDB
-client = MongoClient(Config.MONGODB_URI)
-db = client[Config.MONGODB_DB]
\ No newline at end of file
+# connect=False defers connecting (and the driver's monitor threads) to the
+# first operation, so a client built before a pre-fork server forks is safe
+client = MongoClient(
+    Config.MONGODB_URI,
+    connect=False,
+    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS or None,
+    waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+    event_listeners=[MongoCommandMetrics(), MongoCommandTracing()]
+)
+db = client[Config.MONGODB_DB]
+
+def ensure_indexes():
+    """Create the indexes the history and stats queries rely on (no-op if present)"""
+    # Transaction partitions are indexed as they are created, by
+    # partitions.collection_for. The legacy collection is read until
+    # compactor.py split moves it out; once dropped it isn't recreated.
+    # Trailing _id keeps the keyset sort (timestamp, _id) on the index
+    if db.list_collection_names(filter={"name": "transactions"}):
+        db.transactions.create_index(
+            [("sender_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="sender_timestamp"
+        )
+        db.transactions.create_index(
+            [("receiver_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="receiver_timestamp"
+        )
+    db.user_daily_stats.create_index(
+        [("user_id", ASCENDING), ("date", ASCENDING)],
+        name="user_date"
+    )
+    db.balance_checkpoints.create_index(
+        [("user_id", ASCENDING), ("timestamp", DESCENDING), ("transaction_id", DESCENDING)],
+        name="user_timestamp"
+    )
+    db.idempotency_keys.create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=Config.IDEMPOTENCY_TTL,
+        name="created_at_ttl"
+    )
+    db.transfer_outbox.create_index(
+        [("state", ASCENDING), ("next_attempt_at", ASCENDING)],
+        name="state_next_attempt"
+    )
+    # Workers scan pending entries in acceptance order
+    db.transfer_outbox.create_index(
+        [("state", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+        name="state_created"
+    )
+    # Only finished entries have finished_at, so pending ones never expire
+    db.transfer_outbox.create_index(
+        [("finished_at", ASCENDING)],
+        expireAfterSeconds=Config.OUTBOX_RETENTION,
+        name="finished_at_ttl"
+    )
@@ -0,0 +1,57 @@
+"""Gunicorn settings for running the service in production::
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers default to the CPUs the container may use (its cgroup quota, not
+the host's core count), each with GUNICORN_THREADS threads since the
+service mostly waits on Mongo and other services. The app is preloaded in
+the master so workers share its memory and start fast; anything that opens
+connections or threads runs in each worker after fork.
+"""
+import math
+import os
+
+# Read by Config when app.py is imported below the fork
+os.environ.setdefault("DEFER_STARTUP", "1")
+
+def _cpu_limit():
+    """CPUs available to this container, from the cgroup quota if set"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return os.cpu_count() or 1
+
+bind = os.getenv("GUNICORN_BIND") or f"{os.getenv('FLASK_HOST') or '0.0.0.0'}:{os.getenv('FLASK_PORT') or '5000'}"
+workers = int(os.getenv("GUNICORN_WORKERS") or max(1, math.ceil(_cpu_limit())))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+def post_worker_init(worker):
+    import app
+    app.startup()
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,106 @@
+import hashlib
+import math
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, Response, g, has_request_context
+from pymongo.errors import DuplicateKeyError
+from db import db
+from config import Config
+
+def transfer_id(index=None):
+    """Id for a transfer started by the current request.
+
+    Under an Idempotency-Key the id is derived from the key and body (and
+    the transfer's ``index`` in a batch). A retry that takes over a key
+    whose first request died therefore reuses any ids already written to
+    the outbox, and the transfer is still applied only once.
+    """
+    claimed = g.get("idempotency") if has_request_context() else None
+    if claimed is None:
+        return uuid.uuid4().hex
+    raw = "\0".join(str(part) for part in (*claimed, index))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+def _take_over(key, owner, now):
+    """Claim an in-progress key whose lease has lapsed; True if we got it"""
+    lease = timedelta(seconds=Config.IDEMPOTENCY_LEASE_SECONDS)
+    return db.idempotency_keys.find_one_and_update(
+        {"_id": key, "state": "in_progress", "$or": [
+            {"lease_expires_at": {"$lte": now}},
+            # Written before leases existed
+            {"lease_expires_at": {"$exists": False}, "created_at": {"$lte": now - lease}}
+        ]},
+        {"$set": {"owner": owner, "lease_expires_at": now + lease}}
+    ) is not None
+
+def _still_running(existing, now):
+    lease_expires_at = existing.get("lease_expires_at") or (
+        existing["created_at"] + timedelta(seconds=Config.IDEMPOTENCY_LEASE_SECONDS))
+    retry_after = max(1, math.ceil((lease_expires_at - now).total_seconds()))
+    return (jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409,
+            {"Retry-After": str(retry_after)})
+
+def idempotent(view):
+    """Replay the stored response when a request repeats its Idempotency-Key.
+
+    The first request with a key runs the view and stores its response in
+    ``idempotency_keys``, which a TTL index expires. A repeat with the same
+    key and body gets the stored response back. While the first request is
+    still running, a repeat gets 409. Reusing a key with a different body
+    gets 422. 5xx responses are not stored, so the request can be retried.
+
+    The first request holds the key for ``IDEMPOTENCY_LEASE_SECONDS``. If it
+    dies without finishing, a repeat after that takes the key over and runs
+    the view again, with the same transfer ids (see transfer_id).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+
+        fingerprint = hashlib.sha256(request.path.encode() + b'\0' + request.get_data()).hexdigest()
+        now = datetime.utcnow()
+        # Only the request holding the key may finish or release it
+        owner = uuid.uuid4().hex
+        try:
+            db.idempotency_keys.insert_one({
+                "_id": key,
+                "fingerprint": fingerprint,
+                "state": "in_progress",
+                "owner": owner,
+                "created_at": now,
+                "lease_expires_at": now + timedelta(seconds=Config.IDEMPOTENCY_LEASE_SECONDS)
+            })
+        except DuplicateKeyError:
+            existing = db.idempotency_keys.find_one({"_id": key})
+            if existing is None:
+                return jsonify({"error": "Idempotency-Key expired, retry"}), 409
+            if existing["fingerprint"] != fingerprint:
+                return jsonify({"error": "Idempotency-Key was used with a different request"}), 422
+            if existing["state"] != "done":
+                if not _take_over(key, owner, now):
+                    return _still_running(existing, now)
+            else:
+                replay = Response(existing["body"], status=existing["status"], mimetype='application/json')
+                replay.headers['Idempotent-Replayed'] = 'true'
+                return replay
+
+        g.idempotency = (key, fingerprint)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.idempotency_keys.delete_one({"_id": key, "owner": owner})
+            raise
+
+        if response.status_code >= 500:
+            db.idempotency_keys.delete_one({"_id": key, "owner": owner})
+        else:
+            db.idempotency_keys.update_one({"_id": key, "owner": owner}, {"$set": {
+                "state": "done",
+                "status": response.status_code,
+                "body": response.get_data(as_text=True)
+            }})
+        return response
+    return wrapper
@@ -0,0 +1,111 @@
+"""One-time migration of stored transactions to native BSON types.
+
+Rewrites ISO-string ``timestamp`` values as BSON dates and double
+``amount`` values as Decimal128, in ``_id`` order and in batches, then does
+the same for ``balance_checkpoints``. Progress is saved in the
+``migrations`` collection after every batch, so an interrupted run picks up
+where it stopped. Each update is guarded on the value it read, so running
+alongside live traffic never overwrites a newer write.
+
+    python migrate.py run [--batch-size N] [--throttle SECONDS]
+    python migrate.py status
+
+Afterwards rebuild the derived data so its sums are Decimal128 as well::
+
+    python stats.py rebuild
+    python checkpoints.py check
+"""
+import argparse
+import time
+from datetime import datetime
+from bson.decimal128 import Decimal128
+from pymongo import UpdateOne
+from db import db
+from documents import to_datetime, to_decimal128
+
+MIGRATION_ID = "transactions_bson_types"
+DEFAULT_BATCH_SIZE = 1000
+
+# (collection, {field: converter}) in the order they are migrated
+TARGETS = (
+    ("transactions", {"timestamp": to_datetime, "amount": to_decimal128}),
+    ("balance_checkpoints", {"timestamp": to_datetime, "balance": to_decimal128})
+)
+
+def _needs_conversion(field, value):
+    if field == "timestamp":
+        return isinstance(value, str)
+    return value is not None and not isinstance(value, Decimal128)
+
+def _updates(documents, converters):
+    for document in documents:
+        old, new = {}, {}
+        for field, convert in converters.items():
+            value = document.get(field)
+            if _needs_conversion(field, value):
+                old[field] = value
+                new[field] = convert(value)
+        if new:
+            yield UpdateOne({"_id": document["_id"], **old}, {"$set": new})
+
+def _migrate_collection(name, converters, progress, batch_size, throttle):
+    state_id = f"{MIGRATION_ID}:{name}"
+    state = progress.find_one({"_id": state_id}) or {}
+    if state.get("completed_at"):
+        return 0
+    collection = db[name]
+    last_id = state.get("last_id")
+    converted = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(collection.find(query, {field: 1 for field in converters}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        updates = list(_updates(batch, converters))
+        modified = collection.bulk_write(updates, ordered=False).modified_count if updates else 0
+        last_id = batch[-1]["_id"]
+        converted += modified
+        progress.update_one(
+            {"_id": state_id},
+            {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}, "$inc": {"converted": modified}},
+            upsert=True
+        )
+        if throttle:
+            time.sleep(throttle)
+    progress.update_one({"_id": state_id}, {"$set": {"completed_at": datetime.utcnow()}}, upsert=True)
+    return converted
+
+def run(batch_size=DEFAULT_BATCH_SIZE, throttle=0):
+    """Migrate every target; returns {collection: documents converted}"""
+    return {
+        name: _migrate_collection(name, converters, db.migrations, batch_size, throttle)
+        for name, converters in TARGETS
+    }
+
+def status():
+    report = {}
+    for name, converters in TARGETS:
+        state = db.migrations.find_one({"_id": f"{MIGRATION_ID}:{name}"}) or {}
+        report[name] = {
+            "converted": state.get("converted", 0),
+            "last_id": state.get("last_id"),
+            "completed": bool(state.get("completed_at")),
+            "string_timestamps": db[name].count_documents({"timestamp": {"$type": "string"}})
+        }
+    return report
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Migrate transactions to BSON dates and Decimal128")
+    arg_parser.add_argument('command', choices=['run', 'status'])
+    arg_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    arg_parser.add_argument('--throttle', type=float, default=0,
+                            help="Seconds to sleep between batches")
+    args = arg_parser.parse_args()
+
+    if args.command == 'run':
+        for name, converted in run(args.batch_size, args.throttle).items():
+            print(f"{name}: converted {converted} documents")
+        print("Now run `python stats.py rebuild` and `python checkpoints.py check`")
+    else:
+        for name, report in status().items():
+            print(f"{name}: {report}")
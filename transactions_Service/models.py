@@ -1,109 +1,248 @@
 from flask import jsonify
 from datetime import datetime
-import uuid
-import requests
+import base64
+import json
 from db import db
 from config import Config
+from service_client import get_client, get_user_lookup
+from streaming import stream_format, stream_documents
+import outbox
+import partitions
+from lanes import account_lanes, LaneBusy
+from documents import to_decimal128, utc_now, timestamp_range
+from idempotency import transfer_id
+
+TRANSACTION_FIELDS = {"sender_id", "receiver_id", "amount", "description", "timestamp", "status"}
+
+def parse_date(value):
+    """Parse an ISO date/datetime query value into a naive UTC datetime"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    return parsed
+
+def encode_cursor(transaction):
+    timestamp = transaction["timestamp"]
+    if isinstance(timestamp, datetime):
+        raw = json.dumps([timestamp.isoformat(), transaction["_id"], "date"])
+    else:
+        raw = json.dumps([timestamp, transaction["_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    timestamp, transaction_id, *kind = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if kind == ["date"]:
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp, transaction_id
+
+def before_cursor(after):
+    """Filter for transactions sorting after ``after`` in newest-first order"""
+    timestamp, transaction_id = after
+    branches = [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$lt": transaction_id}}
+    ]
+    # Descending, every BSON date sorts ahead of the unmigrated ISO strings
+    if isinstance(timestamp, datetime):
+        branches.append({"timestamp": {"$type": "string"}})
+    return {"$or": branches}
 
 class Transaction:
     def __init__(self):
-        self.user_service_url = Config.USER_SERVICE_URL
+        self.user_service = get_client(Config.USER_SERVICE_URL)
+        self.users = get_user_lookup(Config.USER_SERVICE_URL)
 
-    def create_transaction(self, sender_id, receiver_id, amount, description=""):
+    def create_transaction(self, sender_id, receiver_id, amount, description="", queued=False):
         try:
-            # Get sender details
-            sender_response = requests.get(f"{self.user_service_url}/api/user/{sender_id}/")
-            if sender_response.status_code != 200:
-                return jsonify({"error": "Sender not found"}), 404
-            
-            # Get receiver details
-            receiver_response = requests.get(f"{self.user_service_url}/api/user/{receiver_id}/")
-            if receiver_response.status_code != 200:
-                return jsonify({"error": "Receiver not found"}), 404
-            
-            # Check sender's balance
-            sender_data = sender_response.json()
-            if float(sender_data.get('balance', 0)) < float(amount):
-                return jsonify({"error": "Insufficient balance"}), 400
-            
             # Create transaction
             transaction = {
-                "_id": uuid.uuid4().hex,
+                "_id": transfer_id(),
                 "sender_id": sender_id,
                 "receiver_id": receiver_id,
-                "amount": float(amount),
+                "amount": to_decimal128(amount),
                 "description": description,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": utc_now(),
                 "status": "pending"
             }
             
-            # Update sender's balance
-            update_sender = requests.patch(
-                f"{self.user_service_url}/api/user/{sender_id}/balance",
-                json={"amount": -float(amount)}
-            )
-            
-            if update_sender.status_code != 200:
-                transaction["status"] = "failed"
-                db.transactions.insert_one(transaction)
-                return jsonify({"error": "Failed to update sender's balance"}), 500
+            # Record the intent first so a crash or timeout can't lose or
+            # repeat the transfer; the outbox worker finishes what we don't
+            if queued:
+                entry = outbox.create_entry(transaction, queued=True)
+                return jsonify(entry["transaction"]), 202
             
-            # Update receiver's balance
-            update_receiver = requests.patch(
-                f"{self.user_service_url}/api/user/{receiver_id}/balance",
-                json={"amount": float(amount)}
-            )
+            # One transfer per account at a time in this process keeps a
+            # hot account from piling up write conflicts in the user service
+            with account_lanes.hold(sender_id, receiver_id):
+                entry = outbox.create_entry(transaction)
+                if entry["state"] == outbox.PENDING:
+                    state, transaction, error, status = outbox.drive(entry)
+                else:
+                    # A retry of a request that finished the transfer but
+                    # never answered
+                    state, transaction, error, status = outbox.settled(entry)
             
-            if update_receiver.status_code != 200:
-                # Rollback sender's balance
-                requests.patch(
-                    f"{self.user_service_url}/api/user/{sender_id}/balance",
-                    json={"amount": float(amount)}
-                )
-                transaction["status"] = "failed"
-                db.transactions.insert_one(transaction)
-                return jsonify({"error": "Failed to update receiver's balance"}), 500
+            if state == outbox.REJECTED:
+                return jsonify({"error": error}), status
             
-            transaction["status"] = "completed"
-            db.transactions.insert_one(transaction)
-            return jsonify(transaction), 201
+            return jsonify(transaction), status
             
+        except LaneBusy:
+            # Nothing was recorded yet, so the caller can safely retry
+            return jsonify({"error": "Account busy, please retry"}), 503, {"Retry-After": "1"}
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def create_transactions_batch(self, validated):
+        """Run many transfers with one user service call and one insert.
+
+        ``validated`` holds ``(transfer, error)`` pairs from route validation;
+        the response has one result per pair, in the same order. Transfers
+        go through the outbox like single ones, so any the call doesn't
+        settle are finished by the outbox worker and reported as pending.
+        """
+        try:
+            results = [None] * len(validated)
+            pending = []
+            for index, (transfer, error) in enumerate(validated):
+                if error:
+                    results[index] = {"index": index, "status": "failed", "error": error}
+                else:
+                    pending.append((index, transfer))
+
+            timestamp = utc_now()
+            transactions = [
+                {
+                    "_id": transfer_id(index),
+                    "sender_id": sender_id,
+                    "receiver_id": receiver_id,
+                    "amount": to_decimal128(amount),
+                    "description": description,
+                    "timestamp": timestamp,
+                    "status": "pending"
+                }
+                for index, (sender_id, receiver_id, amount, description) in pending
+            ]
+            # Same lanes as single transfers, so the batch keeps each
+            # account's order with them and is turned away when they're busy
+            accounts = {account for t in transactions for account in (t["sender_id"], t["receiver_id"])}
+            with account_lanes.hold(*accounts):
+                # Record every intent before any money moves
+                entries = outbox.create_entries(transactions)
+                due = [entry for entry in entries if entry["state"] == outbox.PENDING]
+                driven = dict(zip((entry["_id"] for entry in due), outbox.drive_batch(due) if due else []))
+            outcomes = [
+                driven[entry["_id"]] if entry["_id"] in driven else outbox.settled(entry)[:3]
+                for entry in entries
+            ]
+            for (index, _), (state, transaction, error) in zip(pending, outcomes):
+                if state == outbox.COMPLETED:
+                    results[index] = {"index": index, "status": "completed", "transaction_id": transaction["_id"]}
+                elif state == outbox.REJECTED:
+                    results[index] = {"index": index, "status": "failed", "error": error}
+                else:
+                    results[index] = {"index": index, "status": outbox.PENDING, "transaction_id": transaction["_id"]}
+
+            counts = {status: sum(1 for r in results if r["status"] == status)
+                      for status in ("completed", "failed", outbox.PENDING)}
+            return jsonify({**counts, "results": results}), 202 if counts[outbox.PENDING] else 200
+
+        except LaneBusy:
+            # Nothing was recorded yet, so the caller can safely retry
+            return jsonify({"error": "Accounts busy, please retry"}), 503, {"Retry-After": "1"}
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
     def get_user_transactions(self, user_id):
         try:
             # Get user details to verify user exists
-            user_response = requests.get(f"{self.user_service_url}/api/user/{user_id}/")
-            if user_response.status_code != 200:
+            if self.users.get(user_id) is None:
                 return jsonify({"error": "User not found"}), 404
             
             # Get all transactions where user is either sender or receiver
-            transactions = list(db.transactions.find({
+            query = {
                 "$or": [
                     {"sender_id": user_id},
                     {"receiver_id": user_id}
                 ]
-            }))
-            
-            # Convert ObjectId to string for JSON serialization
-            for transaction in transactions:
-                transaction["_id"] = str(transaction["_id"])
-            
-            return jsonify(transactions)
+            }
+            fmt = stream_format()
+            if fmt:
+                transactions = partitions.find(query, user_id=user_id, batch_size=Config.STREAM_BATCH_SIZE)
+                return stream_documents(transactions, fmt)
+            return jsonify(list(partitions.find(query, user_id=user_id)))
             
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    def get_user_transactions_page(self, user_id, limit, cursor=None, start_date=None, end_date=None, fields=None):
+        """Return one page of a user's history, newest first.
+
+        Pages are keyed on (timestamp, _id) so each one is an index range
+        scan; the cursor for the next page is sent in ``X-Next-Cursor``.
+        """
+        try:
+            try:
+                start = parse_date(start_date) if start_date else None
+                end = parse_date(end_date) if end_date else None
+                after = decode_cursor(cursor) if cursor else None
+            except (ValueError, TypeError):
+                return jsonify({"error": "Invalid cursor or date format"}), 400
+
+            projection = None
+            if fields:
+                unknown = set(fields) - TRANSACTION_FIELDS
+                if unknown:
+                    return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+                projection = {field: 1 for field in fields}
+                projection["timestamp"] = 1
+
+            if self.users.get(user_id) is None:
+                return jsonify({"error": "User not found"}), 404
+
+            conditions = [{"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]}]
+            if start or end:
+                conditions.append(timestamp_range(start, end))
+            if after:
+                conditions.append(before_cursor(after))
+
+            # Only the months between the cursor (or end) and start are read
+            transactions = list(partitions.find(
+                {"$and": conditions}, user_id=user_id, start=start, end=end, after=after,
+                newest_first=True, projection=projection, limit=limit + 1
+            ))
+
+            has_more = len(transactions) > limit
+            transactions = transactions[:limit]
+            next_cursor = encode_cursor(transactions[-1]) if has_more else None
+
+            response = jsonify(transactions)
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return response
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
     def get_transaction_by_id(self, transaction_id):
         try:
-            transaction = db.transactions.find_one({"_id": transaction_id})
+            transaction = partitions.find_by_id(transaction_id)
             if transaction:
-                transaction["_id"] = str(transaction["_id"])
-                # Handle both string and datetime timestamps
-                if isinstance(transaction["timestamp"], datetime):
-                    transaction["timestamp"] = transaction["timestamp"].isoformat()
                 return jsonify(transaction), 200
+            # Transfers still being driven by the outbox have no record yet
+            entry = db.transfer_outbox.find_one({"_id": transaction_id})
+            if entry and entry["state"] != outbox.COMPLETED:
+                transaction = dict(entry["transaction"])
+                transaction["status"] = "failed" if entry["state"] == outbox.REJECTED else outbox.PENDING
+                transaction["attempts"] = entry.get("attempts", 0)
+                if entry.get("error"):
+                    transaction["error"] = entry["error"]
+                return jsonify(transaction), 200
+            if entry:
+                # Completed between the two reads, so the record exists now
+                transaction = partitions.find_by_id(transaction_id)
+                if transaction:
+                    return jsonify(transaction), 200
             return jsonify({"error": "Transaction not found"}), 404
         except Exception as e:
             return jsonify({"error": "Failed to fetch transaction", "details": str(e)}), 500 
\ No newline at end of file
@@ -0,0 +1,334 @@
+"""Durable outbox that drives transfers to a final state.
+
+Every transfer is written to ``transfer_outbox`` before the user service is
+called. ``drive`` makes the call, records the transaction and marks the entry
+``completed`` or ``rejected``. If the call fails or the process dies, the
+entry stays ``pending`` and the worker retries it with backoff. Each retry
+reuses the transfer id, which the user service deduplicates, so a retry can
+never move money twice.
+
+In async mode (``ASYNC_TRANSFERS`` or a ``Prefer: respond-async`` header) the
+request only queues the entry and answers 202; the worker pool drives it.
+Workers take entries in acceptance order and never run two transfers that
+touch the same user at once, so each user's transfers apply in order.
+
+The workers run as ``TRANSFER_WORKERS`` threads inside the app
+(``OUTBOX_WORKER_ENABLED``) or on their own::
+
+    python outbox.py run
+"""
+import argparse
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from db import db
+from config import Config
+from service_client import get_client
+from lanes import account_lanes, LaneBusy
+from documents import to_decimal, to_decimal128, to_datetime
+import stats
+import partitions
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+COMPLETED = "completed"
+REJECTED = "rejected"
+
+DUPLICATE_KEY = 11000
+
+# Wakes idle in-process workers when a transfer is queued, so they don't
+# wait out the poll interval
+_wakeup = threading.Event()
+
+def _entry(transaction, now, queued):
+    return {
+        "_id": transaction["_id"],
+        "transaction": transaction,
+        "users": [transaction["sender_id"], transaction["receiver_id"]],
+        "state": PENDING,
+        "attempts": 0 if queued else 1,
+        "created_at": now,
+        "next_attempt_at": now if queued else now + timedelta(seconds=Config.OUTBOX_LEASE_SECONDS)
+    }
+
+def create_entry(transaction, queued=False):
+    """Record a transfer before any money moves.
+
+    Unless ``queued``, the entry is leased to the caller for
+    ``OUTBOX_LEASE_SECONDS`` so the worker leaves it alone while the request
+    drives it. Queued entries are due immediately.
+
+    If the transfer id is already in the outbox (a retried request resuming
+    its transfer, see idempotency.transfer_id) the stored entry is returned
+    instead; it may be pending or already finished.
+    """
+    entry = _entry(transaction, datetime.utcnow(), queued)
+    try:
+        db.transfer_outbox.insert_one(entry)
+    except DuplicateKeyError:
+        return db.transfer_outbox.find_one({"_id": entry["_id"]})
+    if queued:
+        _wakeup.set()
+    return entry
+
+def create_entries(transactions):
+    """create_entry() for many transfers in one insert, leased to the caller"""
+    now = datetime.utcnow()
+    entries = [_entry(transaction, now, queued=False) for transaction in transactions]
+    if not entries:
+        return entries
+    try:
+        db.transfer_outbox.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+        duplicates = [entries[error["index"]]["_id"] for error in e.details["writeErrors"]]
+        stored = {entry["_id"]: entry for entry in db.transfer_outbox.find({"_id": {"$in": duplicates}})}
+        entries = [stored.get(entry["_id"], entry) for entry in entries]
+    return entries
+
+def settled(entry):
+    """drive()'s result for an entry that has already finished"""
+    transaction = dict(entry["transaction"])
+    if entry["state"] == COMPLETED:
+        transaction["status"] = COMPLETED
+        return COMPLETED, _stored(transaction), None, 201
+    return REJECTED, transaction, entry.get("error"), entry.get("status", 400)
+
+def _finished(state, error=None, status=None):
+    update = {"state": state, "finished_at": datetime.utcnow()}
+    if error:
+        update["error"] = error
+    if status:
+        update["status"] = status
+    return {"$set": update}
+
+def _finish(entry, state, error=None, status=None):
+    db.transfer_outbox.update_one({"_id": entry["_id"]}, _finished(state, error, status))
+
+def _stored(transaction):
+    # Entries queued before the BSON type change hold ISO strings and doubles
+    transaction["timestamp"] = to_datetime(transaction["timestamp"])
+    transaction["amount"] = to_decimal128(transaction["amount"])
+    return transaction
+
+def _record_stats(transactions):
+    try:
+        stats.record_transactions(transactions)
+    except Exception as e:
+        # Repaired by `python stats.py rebuild`
+        logger.error("Failed to update user stats: %s", e)
+
+def _record(transaction):
+    """Write the completed transaction; safe to repeat"""
+    _stored(transaction)
+    try:
+        partitions.collection_for(transaction["timestamp"]).insert_one(transaction)
+    except DuplicateKeyError:
+        return
+    _record_stats([transaction])
+
+def _record_many(transactions):
+    """_record() for many transactions, one insert per partition"""
+    by_month = {}
+    for transaction in transactions:
+        _stored(transaction)
+        by_month.setdefault(partitions.month_of(transaction["timestamp"]), []).append(transaction)
+    inserted = []
+    for group in by_month.values():
+        try:
+            partitions.collection_for(group[0]["timestamp"]).insert_many(group, ordered=False)
+            inserted += group
+        except BulkWriteError as e:
+            # Already recorded by an earlier attempt; anything else is real
+            if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                raise
+            duplicates = {error["index"] for error in e.details["writeErrors"]}
+            inserted += [transaction for index, transaction in enumerate(group) if index not in duplicates]
+    if inserted:
+        _record_stats(inserted)
+
+def _backoff(attempts):
+    return min(Config.OUTBOX_MAX_BACKOFF, 2 ** attempts)
+
+def drive(entry):
+    """Advance one outbox entry; returns (state, transaction, error, status)"""
+    transaction = dict(entry["transaction"])
+    try:
+        response = get_client(Config.USER_SERVICE_URL).post(
+            "/api/user/transfer",
+            "POST /api/user/transfer",
+            json={
+                "transfer_id": transaction["_id"],
+                "sender_id": transaction["sender_id"],
+                "receiver_id": transaction["receiver_id"],
+                "amount": float(to_decimal(transaction["amount"]))
+            }
+        )
+        status_code = response.status_code
+        body = response.json() if status_code in (200, 400, 404) else None
+    except Exception as e:
+        status_code, body = None, None
+        logger.warning("Transfer %s failed: %s", transaction["_id"], e)
+
+    if status_code == 200:
+        transaction["status"] = COMPLETED
+        _record(transaction)
+        _finish(entry, COMPLETED)
+        return COMPLETED, transaction, None, 201
+
+    if status_code in (400, 404):
+        _finish(entry, REJECTED, body.get("error"), status_code)
+        return REJECTED, transaction, body.get("error"), status_code
+
+    # Unknown outcome: keep it pending and let the worker try again
+    db.transfer_outbox.update_one(
+        {"_id": entry["_id"]},
+        {"$set": {"next_attempt_at": datetime.utcnow() + timedelta(seconds=_backoff(entry.get("attempts", 1)))}}
+    )
+    return PENDING, transaction, None, 202
+
+def drive_batch(entries):
+    """drive() for many entries with one user service call.
+
+    Returns (state, transaction, error) per entry, in order. If the call
+    fails or is refused as a whole, every entry stays pending and the
+    worker retries them one at a time; the user service deduplicates the
+    transfer ids, so those already applied by the batch aren't repeated.
+    """
+    transactions = [dict(entry["transaction"]) for entry in entries]
+    try:
+        response = get_client(Config.USER_SERVICE_URL).post(
+            "/api/user/transfer/batch",
+            "POST /api/user/transfer/batch",
+            json={"transfers": [
+                {
+                    "transfer_id": transaction["_id"],
+                    "sender_id": transaction["sender_id"],
+                    "receiver_id": transaction["receiver_id"],
+                    "amount": float(to_decimal(transaction["amount"]))
+                }
+                for transaction in transactions
+            ]}
+        )
+        outcomes = response.json()["results"] if response.status_code == 200 else None
+        if outcomes is None:
+            logger.warning("Transfer batch refused with %s", response.status_code)
+    except Exception as e:
+        outcomes = None
+        logger.warning("Transfer batch failed: %s", e)
+
+    if outcomes is None:
+        db.transfer_outbox.update_many(
+            {"_id": {"$in": [entry["_id"] for entry in entries]}},
+            {"$set": {"next_attempt_at": datetime.utcnow() + timedelta(seconds=_backoff(1))}}
+        )
+        return [(PENDING, transaction, None) for transaction in transactions]
+
+    results, completed, finishes = [], [], []
+    for entry, transaction, outcome in zip(entries, transactions, outcomes):
+        if outcome["status"] == COMPLETED:
+            transaction["status"] = COMPLETED
+            completed.append(transaction)
+            results.append((COMPLETED, transaction, None))
+            finishes.append(UpdateOne({"_id": entry["_id"]}, _finished(COMPLETED)))
+        else:
+            results.append((REJECTED, transaction, outcome.get("error")))
+            finishes.append(UpdateOne({"_id": entry["_id"]},
+                                      _finished(REJECTED, outcome.get("error"), outcome.get("code"))))
+    _record_many(completed)
+    db.transfer_outbox.bulk_write(finishes, ordered=False)
+    return results
+
+def claim_next():
+    """Atomically lease the oldest runnable pending entry, or return None.
+
+    An entry is runnable when it is due and no older pending entry touches
+    either of its users. Leased entries stay pending with a future
+    ``next_attempt_at``, so they block their users too, across processes.
+    """
+    now = datetime.utcnow()
+    blocked = set()
+    pending = db.transfer_outbox.find(
+        {"state": PENDING},
+        {"users": 1, "next_attempt_at": 1}
+    ).sort([("created_at", 1), ("_id", 1)]).limit(Config.OUTBOX_SCAN_LIMIT)
+    for candidate in pending:
+        users = candidate.get("users", [])
+        if candidate["next_attempt_at"] <= now and not blocked.intersection(users):
+            entry = db.transfer_outbox.find_one_and_update(
+                {"_id": candidate["_id"], "state": PENDING, "next_attempt_at": {"$lte": now}},
+                {
+                    "$set": {"next_attempt_at": now + timedelta(seconds=Config.OUTBOX_LEASE_SECONDS)},
+                    "$inc": {"attempts": 1}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            if entry is not None:
+                return entry
+        # Leased by someone else, backing off, or lost the race: later
+        # transfers for these users wait their turn
+        blocked.update(users)
+    return None
+
+def run_once():
+    """Drive every entry that is currently due; returns how many ran"""
+    processed = 0
+    while True:
+        entry = claim_next()
+        if entry is None:
+            return processed
+        try:
+            with account_lanes.hold(*entry.get("users", [])):
+                drive(entry)
+        except LaneBusy:
+            # Left leased; it is claimed again once the lease runs out
+            pass
+        processed += 1
+
+def run_forever(stop_event=None):
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            run_once()
+        except Exception as e:
+            logger.error("Outbox worker error: %s", e)
+        if _wakeup.wait(Config.OUTBOX_POLL_INTERVAL):
+            _wakeup.clear()
+
+def start_worker(workers=None):
+    """Start the outbox worker pool as daemon threads in this process"""
+    threads = []
+    for i in range(workers or Config.TRANSFER_WORKERS):
+        worker = threading.Thread(target=run_forever, name=f"transfer-outbox-{i}", daemon=True)
+        worker.start()
+        threads.append(worker)
+    return threads
+
+def queue_stats():
+    """Pending depth, oldest pending age and per-state counts"""
+    counts = {
+        row["_id"]: row["count"]
+        for row in db.transfer_outbox.aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}])
+    }
+    oldest = db.transfer_outbox.find_one({"state": PENDING}, {"created_at": 1}, sort=[("created_at", 1)])
+    return {
+        "workers": Config.TRANSFER_WORKERS,
+        "pending": counts.get(PENDING, 0),
+        "completed": counts.get(COMPLETED, 0),
+        "rejected": counts.get(REJECTED, 0),
+        "oldest_pending_seconds": round((datetime.utcnow() - oldest["created_at"]).total_seconds(), 3) if oldest else 0
+    }
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    arg_parser = argparse.ArgumentParser(description="Drive pending transfers to completion")
+    arg_parser.add_argument('command', choices=['run', 'once'])
+    args = arg_parser.parse_args()
+    if args.command == 'once':
+        print(f"Processed {run_once()} outbox entries")
+    else:
+        run_forever()
@@ -0,0 +1,225 @@
+"""Monthly partitions of the transaction log.
+
+Transactions are written to one collection per UTC month of their
+timestamp, ``transactions_YYYY_MM``, so a read only touches the months its
+time range overlaps and whole months can leave MongoDB once they are old.
+Documents written before partitioning stay in ``transactions``, which is
+read as older than every month until ``python compactor.py split`` moves
+them out.
+
+Months moved out by ``python compactor.py archive`` are listed in
+``transaction_archives`` and read from their Arrow IPC file under
+``ARCHIVE_DIR`` (see archive.py), which must be the same shared volume in
+every service. Which months exist and which are archived is cached for
+``PARTITION_CACHE_SECONDS``; the current and previous months are always
+read, so new partitions are seen at once.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+from db import db
+from config import Config
+import archive
+
+LEGACY_COLLECTION = "transactions"
+ARCHIVES_COLLECTION = "transaction_archives"
+PARTITION_NAME = re.compile(r"^transactions_(\d{4})_(\d{2})$")
+
+# Trailing _id keeps the keyset sort (timestamp, _id) on the index
+PARTITION_INDEXES = (
+    ([("sender_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], "sender_timestamp"),
+    ([("receiver_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], "receiver_timestamp")
+)
+
+def to_moment(timestamp):
+    """Naive UTC datetime from a stored timestamp of either type"""
+    if isinstance(timestamp, datetime):
+        return timestamp
+    parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    return parsed
+
+def month_of(timestamp):
+    moment = to_moment(timestamp)
+    return moment.year, moment.month
+
+def previous_month(month):
+    year, number = month
+    return (year - 1, 12) if number == 1 else (year, number - 1)
+
+def month_bounds(month):
+    """[first instant, first instant of the next month) of a (year, month)"""
+    year, number = month
+    following = (year + 1, 1) if number == 12 else (year, number + 1)
+    return datetime(year, number, 1), datetime(following[0], following[1], 1)
+
+def partition_name(month):
+    return "transactions_%04d_%02d" % month
+
+def archive_path(record):
+    return os.path.join(Config.ARCHIVE_DIR, record["file"])
+
+class Catalog:
+    """Cached view of the monthly collections and the archived months"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self.months = frozenset()
+        self.archived = {}
+        self.legacy = False
+
+    def refresh(self, force=False):
+        loaded_at = self._loaded_at
+        if not force and loaded_at is not None and time.monotonic() - loaded_at < Config.PARTITION_CACHE_SECONDS:
+            return
+        months, legacy = set(), False
+        for name in db.list_collection_names():
+            match = PARTITION_NAME.match(name)
+            if match:
+                months.add((int(match.group(1)), int(match.group(2))))
+            legacy = legacy or name == LEGACY_COLLECTION
+        archived = {(record["year"], record["month"]): record for record in db[ARCHIVES_COLLECTION].find()}
+        with self._lock:
+            self.months, self.archived, self.legacy = frozenset(months), archived, legacy
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+catalog = Catalog()
+
+_indexed = set()
+_indexed_lock = threading.Lock()
+
+def ensure_indexes(name):
+    """Create a partition's indexes, once per process (no-op if present)"""
+    if name in _indexed:
+        return
+    with _indexed_lock:
+        if name not in _indexed:
+            for keys, index_name in PARTITION_INDEXES:
+                db[name].create_index(keys, name=index_name)
+            _indexed.add(name)
+
+def collection_for(timestamp):
+    """The partition a transaction with this timestamp is written to"""
+    name = partition_name(month_of(timestamp))
+    ensure_indexes(name)
+    return db[name]
+
+def _overlaps(month, start, end):
+    first, following = month_bounds(month)
+    return (start is None or following > start) and (end is None or first <= end)
+
+def sources(start=None, end=None, newest_first=False):
+    """Where transactions in [start, end] are kept, in time order.
+
+    Collection names for months still in MongoDB (the legacy collection
+    first) and ``transaction_archives`` records for archived months.
+    """
+    catalog.refresh()
+    now = datetime.utcnow()
+    recent = {(now.year, now.month), previous_month((now.year, now.month))}
+    months = sorted(
+        month for month in catalog.months | recent | set(catalog.archived)
+        if _overlaps(month, start, end)
+    )
+    found = [LEGACY_COLLECTION] if catalog.legacy else []
+    found += [catalog.archived.get(month) or partition_name(month) for month in months]
+    if newest_first:
+        found.reverse()
+    return found
+
+def _scan_range(start, end, after, until, newest_first):
+    """Narrow [start, end] to the keyset bounds, for picking partitions"""
+    low, high = start, end
+    for key, is_lower in ((after, not newest_first), (until, newest_first)):
+        if key is None:
+            continue
+        moment = to_moment(key[0])
+        if is_lower:
+            low = moment if low is None else max(low, moment)
+        else:
+            high = moment if high is None else min(high, moment)
+    return low, high
+
+def _archive_filters(user_id, start, end, after, until, status, newest_first, projection):
+    return {
+        "user_id": user_id,
+        "start": start,
+        "end": end,
+        "after": (to_moment(after[0]), after[1]) if after else None,
+        "until": (to_moment(until[0]), until[1]) if until else None,
+        "status": status,
+        "newest_first": newest_first,
+        "columns": set(projection) if projection else None
+    }
+
+def find(query, user_id=None, start=None, end=None, after=None, until=None, status=None,
+         newest_first=False, projection=None, limit=None, batch_size=None):
+    """Transactions matching ``query``, in (timestamp, _id) order.
+
+    Only the partitions overlapping [start, end] and the keyset bounds are
+    read. ``query`` must already express every restriction for MongoDB;
+    archived months can't run it, so they are filtered on the other
+    arguments instead: ``user_id`` as sender or receiver, ``status``, the
+    time range, and the (timestamp, _id) keys ``after`` (exclusive) and
+    ``until`` (inclusive) in scan order.
+    """
+    direction = DESCENDING if newest_first else ASCENDING
+    sort = [("timestamp", direction), ("_id", direction)]
+    filters = _archive_filters(user_id, start, end, after, until, status, newest_first, projection)
+    remaining = limit
+    for source in sources(*_scan_range(start, end, after, until, newest_first), newest_first=newest_first):
+        if isinstance(source, dict):
+            rows = archive.read(archive_path(source), limit=remaining, **filters)
+        else:
+            rows = db[source].find(query, projection).sort(sort)
+            if remaining is not None:
+                rows = rows.limit(remaining)
+            if batch_size:
+                rows = rows.batch_size(batch_size)
+        for row in rows:
+            yield row
+            if remaining is not None:
+                remaining -= 1
+        if remaining == 0:
+            return
+
+async def find_async(motor_db, query, user_id=None, start=None, end=None, after=None, until=None, status=None,
+                     newest_first=False, projection=None, limit=None):
+    """find() for the ASGI app: a list, read through motor and worker threads"""
+    direction = DESCENDING if newest_first else ASCENDING
+    sort = [("timestamp", direction), ("_id", direction)]
+    filters = _archive_filters(user_id, start, end, after, until, status, newest_first, projection)
+    low, high = _scan_range(start, end, after, until, newest_first)
+    found = []
+    for source in await asyncio.to_thread(sources, low, high, newest_first):
+        remaining = None if limit is None else limit - len(found)
+        if remaining == 0:
+            break
+        if isinstance(source, dict):
+            found += await asyncio.to_thread(archive.read, archive_path(source), limit=remaining, **filters)
+        else:
+            cursor = motor_db[source].find(query, projection).sort(sort)
+            if remaining is not None:
+                cursor = cursor.limit(remaining)
+            found += await cursor.to_list(None)
+    return found
+
+def find_by_id(transaction_id):
+    """A transaction by _id from any partition, most recent months first"""
+    for source in sources(newest_first=True):
+        if isinstance(source, dict):
+            transaction = archive.find_id(archive_path(source), transaction_id)
+        else:
+            transaction = db[source].find_one({"_id": transaction_id})
+        if transaction:
+            return transaction
+    return None
@@ -1,38 +1,96 @@
 from flask import Blueprint, request, jsonify
 from models import Transaction
+from config import Config
+from idempotency import idempotent
+import service_client
+import outbox
+from lanes import account_lanes
 
 transaction_bp = Blueprint('transaction', __name__)
 
+def validate_transfer(data):
+    """Return (sender_id, receiver_id, amount, description) or an error message"""
+    sender_id = data.get('sender_id')
+    receiver_id = data.get('receiver_id')
+    amount = data.get('amount')
+    description = data.get('description', '')
+
+    if not all([sender_id, receiver_id, amount]):
+        return None, "Missing required fields"
+
+    try:
+        amount = float(amount)
+        if amount <= 0:
+            return None, "Amount must be positive"
+    except (TypeError, ValueError):
+        return None, "Invalid amount format"
+
+    return (sender_id, receiver_id, amount, description), None
+
 @transaction_bp.route('/api/transactions/', methods=['POST'])
+@idempotent
 def create_transaction():
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
 
-        sender_id = data.get('sender_id')
-        receiver_id = data.get('receiver_id')
-        amount = data.get('amount')
-        description = data.get('description', '')
+        transfer, error = validate_transfer(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        if not all([sender_id, receiver_id, amount]):
-            return jsonify({"error": "Missing required fields"}), 400
+        queued = Config.ASYNC_TRANSFERS or 'respond-async' in request.headers.get('Prefer', '')
+        return Transaction().create_transaction(*transfer, queued=queued)
+    except Exception as e:
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
-        try:
-            amount = float(amount)
-            if amount <= 0:
-                return jsonify({"error": "Amount must be positive"}), 400
-        except ValueError:
-            return jsonify({"error": "Invalid amount format"}), 400
+@transaction_bp.route('/api/transactions/batch', methods=['POST'])
+@idempotent
+def create_transactions_batch():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('transfers'), list):
+            return jsonify({"error": "transfers list is required"}), 400
 
-        return Transaction().create_transaction(sender_id, receiver_id, amount, description)
+        transfers = data['transfers']
+        if len(transfers) > Config.BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Batch exceeds {Config.BATCH_MAX_ITEMS} transfers"}), 400
+
+        validated = []
+        for item in transfers:
+            if not isinstance(item, dict):
+                validated.append((None, "Invalid transfer format"))
+            else:
+                validated.append(validate_transfer(item))
+
+        return Transaction().create_transactions_batch(validated)
     except Exception as e:
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 @transaction_bp.route('/api/transactions/<user_id>/', methods=['GET'])
 def get_user_transactions(user_id):
     try:
-        return Transaction().get_user_transactions(user_id)
+        # The unbounded full-history dump is opt-in only
+        if request.args.get('all', '').lower() == 'true':
+            return Transaction().get_user_transactions(user_id)
+
+        try:
+            limit = int(request.args.get('limit', Config.TRANSACTIONS_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+        if limit <= 0:
+            return jsonify({"error": "Limit must be positive"}), 400
+        limit = min(limit, Config.TRANSACTIONS_MAX_PAGE_SIZE)
+
+        fields = request.args.get('fields')
+        return Transaction().get_user_transactions_page(
+            user_id,
+            limit,
+            cursor=request.args.get('cursor'),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date'),
+            fields=fields.split(',') if fields else None
+        )
     except Exception as e:
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
@@ -41,4 +99,22 @@ def get_transaction(transaction_id):
     try:
         return Transaction().get_transaction_by_id(transaction_id)
     except Exception as e:
-        return jsonify({"error": "Internal server error", "details": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500 
+
+@transaction_bp.route('/api/internal/client-stats', methods=['GET'])
+def get_client_stats():
+    """Per-endpoint latency and connection pool counters for outbound calls"""
+    return jsonify(service_client.all_stats())
+
+@transaction_bp.route('/api/internal/lane-stats', methods=['GET'])
+def get_lane_stats():
+    """How often transfers waited on a busy account, and for how long"""
+    return jsonify(account_lanes.stats())
+
+@transaction_bp.route('/api/internal/outbox-stats', methods=['GET'])
+def get_outbox_stats():
+    """Transfer queue depth and age of the oldest pending transfer"""
+    try:
+        return jsonify(outbox.queue_stats())
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch outbox stats", "details": str(e)}), 500
\ No newline at end of file
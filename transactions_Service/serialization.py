@@ -0,0 +1,70 @@
+"""JSON encoding for responses, streams and caches.
+
+Responses go through an orjson-backed Flask JSON provider, so handlers
+return MongoDB documents as they come back: Decimal128 and Decimal are
+written as numbers, ObjectId as strings, and datetimes (naive UTC) in ISO
+8601, without a per-document conversion loop. Sensitive or unneeded fields
+are left out with query projections rather than deleted afterwards.
+
+``JSON_PROVIDER=stdlib`` swaps in Flask's standard library encoder with
+the same type handling, to compare the two.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def default(value):
+    """JSON form of the BSON and Python types the encoders don't know"""
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    # orjson writes these itself; the stdlib encoder needs telling
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Bytes straight into the body, without a round trip through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=default, option=ORJSON_OPTIONS),
+            mimetype=self.mimetype
+        )
+
+class StdlibProvider(DefaultJSONProvider):
+    default = staticmethod(default)
+
+if Config.JSON_PROVIDER == "stdlib":
+    _encode = json.JSONEncoder(default=default, separators=(',', ':')).encode
+
+    def dumps(value):
+        """Compact JSON as UTF-8 bytes"""
+        return _encode(value).encode()
+
+    loads = json.loads
+else:
+    def dumps(value):
+        """Compact JSON as UTF-8 bytes"""
+        return orjson.dumps(value, default=default, option=ORJSON_OPTIONS)
+
+    loads = orjson.loads
+
+def init_app(app):
+    app.json = StdlibProvider(app) if Config.JSON_PROVIDER == "stdlib" else OrjsonProvider(app)
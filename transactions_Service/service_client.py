@@ -0,0 +1,280 @@
+import threading
+import time
+from collections import defaultdict
+import requests
+from flask import g, has_request_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from config import Config
+import metrics
+import tracing
+
+class ServiceClient:
+    """Pooled keep-alive HTTP client for calls to another service.
+
+    One instance is kept per base URL (see ``get_client``) so every request
+    from this process to that host reuses the same connection pool.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = (base_url or '').rstrip('/')
+        self.upstream = urlparse(self.base_url).netloc or self.base_url
+        self.timeout = (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+        # Only idempotent GETs are retried on a bad status or a read error;
+        # connection failures are retried for any method because the request
+        # never reached the server.
+        retry = Retry(
+            total=Config.HTTP_MAX_RETRIES,
+            connect=Config.HTTP_MAX_RETRIES,
+            read=Config.HTTP_MAX_RETRIES,
+            status=Config.HTTP_MAX_RETRIES,
+            backoff_factor=Config.HTTP_BACKOFF_FACTOR,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=Config.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(lambda: {
+            "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0
+        })
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        """Send a request and record its latency under ``endpoint``.
+
+        ``endpoint`` should be a low-cardinality label such as
+        ``"GET /api/user/<id>/"``; it defaults to the method and raw path.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        label = endpoint or f"{method} {path}"
+        client_span, token = tracing.start_span(label, tracing.SPAN_KIND_CLIENT, {
+            "http.method": method,
+            "http.url": f"{self.base_url}{path}",
+            "peer.service": self.upstream
+        })
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, traceparent=client_span.traceparent)
+        start = time.perf_counter()
+        failed = True
+        status = "error"
+        error = None
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            failed = response.status_code >= 500
+            status = str(response.status_code)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            metrics.observe_upstream(self.upstream, label, status, elapsed / 1000)
+            client_span.set("http.status_code", status)
+            if failed and error is None:
+                error = f"HTTP {status}"
+            tracing.finish_span(client_span, token, error)
+            with self._lock:
+                stats = self._endpoints[label]
+                stats["count"] += 1
+                stats["total_ms"] += elapsed
+                stats["max_ms"] = max(stats["max_ms"], elapsed)
+                if failed:
+                    stats["errors"] += 1
+
+    def get(self, path, endpoint=None, **kwargs):
+        return self.request('GET', path, endpoint, **kwargs)
+
+    def post(self, path, endpoint=None, **kwargs):
+        return self.request('POST', path, endpoint, **kwargs)
+
+    def patch(self, path, endpoint=None, **kwargs):
+        return self.request('PATCH', path, endpoint, **kwargs)
+
+    def pool_stats(self):
+        """Connection counters for every host pool opened by this client."""
+        pools = self.adapter.poolmanager.pools
+        result = []
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            result.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests_sent": pool.num_requests,
+                # The pool queue is pre-filled with None placeholders.
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                "max_size": Config.HTTP_POOL_MAXSIZE
+            })
+        return result
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                label: {
+                    "count": s["count"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 3) if s["count"] else 0,
+                    "max_ms": round(s["max_ms"], 3)
+                }
+                for label, s in self._endpoints.items()
+            }
+        return {"base_url": self.base_url, "endpoints": endpoints, "pools": self.pool_stats()}
+
+
+class _LookupBatch:
+    __slots__ = ("ids", "users", "error", "done")
+
+    def __init__(self):
+        self.ids = {}
+        self.users = {}
+        self.error = None
+        self.done = threading.Event()
+
+def _request_memo():
+    if not has_request_context():
+        return None
+    if "user_lookups" not in g:
+        g.user_lookups = {}
+    return g.user_lookups
+
+class UserLookup:
+    """Resolves users by id, merging concurrent lookups into batch calls.
+
+    A lookup is sent at once while fewer than ``USER_LOOKUP_CONCURRENCY``
+    calls to ``POST /api/user/batch`` are in flight. Past that it waits for
+    a free slot, and lookups arriving in the meantime join its batch, so
+    under load many lookups share one call while an idle service adds no
+    delay. A batch nobody joined goes out as the plain single-user GET, so
+    lookups that never overlap cost what they did before batching. Results
+    are also kept for the rest of the current request.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._slots = threading.BoundedSemaphore(Config.USER_LOOKUP_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._open = {}
+        self.lookups = 0
+        self.calls = 0
+
+    def get(self, user_id, fresh=False):
+        """The user's document, or None if there is no such user.
+
+        ``fresh`` skips the user service's cache, for exact balances.
+        """
+        memo = _request_memo()
+        if memo is not None and (user_id, fresh) in memo:
+            return memo[(user_id, fresh)]
+        if Config.USER_LOOKUP_COALESCE:
+            user = self._coalesced(user_id, fresh)
+        else:
+            user = self._single(user_id, fresh)
+        if memo is not None:
+            memo[(user_id, fresh)] = user
+        return user
+
+    def _headers(self, fresh):
+        return {"Cache-Control": "no-cache"} if fresh else None
+
+    def _single(self, user_id, fresh):
+        with self._lock:
+            self.lookups += 1
+            self.calls += 1
+        response = self.client.get(f"/api/user/{user_id}/", "GET /api/user/<id>/", headers=self._headers(fresh))
+        return response.json() if response.status_code == 200 else None
+
+    def _coalesced(self, user_id, fresh):
+        with self._lock:
+            self.lookups += 1
+            batch = self._open.get(fresh)
+            leader = batch is None
+            if leader:
+                batch = self._open[fresh] = _LookupBatch()
+            batch.ids[user_id] = None
+            if len(batch.ids) >= Config.USER_LOOKUP_MAX_BATCH:
+                del self._open[fresh]
+        if leader:
+            self._send(batch, fresh)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.users.get(user_id)
+
+    def _send(self, batch, fresh):
+        with self._slots:
+            with self._lock:
+                # Later lookups start the next batch
+                if self._open.get(fresh) is batch:
+                    del self._open[fresh]
+                self.calls += 1
+            try:
+                if len(batch.ids) == 1:
+                    user_id, = batch.ids
+                    response = self.client.get(f"/api/user/{user_id}/", "GET /api/user/<id>/",
+                                               headers=self._headers(fresh))
+                    if response.status_code != 404:
+                        response.raise_for_status()
+                        batch.users = {user_id: response.json()}
+                else:
+                    response = self.client.post("/api/user/batch", "POST /api/user/batch",
+                                                json={"ids": list(batch.ids)}, headers=self._headers(fresh))
+                    response.raise_for_status()
+                    batch.users = {user["_id"]: user for user in response.json()["users"]}
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "calls": self.calls,
+                "lookups_per_call": round(self.lookups / self.calls, 3) if self.calls else 0
+            }
+
+
+_clients = {}
+_lookups = {}
+_clients_lock = threading.Lock()
+
+def get_client(base_url):
+    """Return the process-wide client for ``base_url``, creating it on first use."""
+    client = _clients.get(base_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                client = ServiceClient(base_url)
+                _clients[base_url] = client
+    return client
+
+def get_user_lookup(base_url):
+    """Return the process-wide user lookup for the user service at ``base_url``."""
+    lookup = _lookups.get(base_url)
+    if lookup is None:
+        client = get_client(base_url)
+        with _clients_lock:
+            lookup = _lookups.get(base_url)
+            if lookup is None:
+                lookup = UserLookup(client)
+                _lookups[base_url] = lookup
+    return lookup
+
+def all_stats():
+    stats = []
+    for base_url, client in list(_clients.items()):
+        client_stats = client.stats()
+        if base_url in _lookups:
+            client_stats["user_lookup"] = _lookups[base_url].stats()
+        stats.append(client_stats)
+    return stats
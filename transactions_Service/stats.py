@@ -0,0 +1,112 @@
+"""Materialized per-user transaction statistics.
+
+``user_stats`` holds one document per user with running counts, sums and
+the first/last transaction time. ``user_daily_stats`` holds one document
+per user per UTC day. Both are updated with ``$inc`` upserts as transfers
+complete, so the reporting service can read them directly instead of
+scanning a user's history. Sums are kept as Decimal128.
+
+Rebuild from the transaction log with::
+
+    python stats.py rebuild
+"""
+import argparse
+from pymongo import UpdateOne
+from db import db
+import partitions
+from documents import to_decimal, to_decimal128, to_datetime
+
+REBUILD_BATCH_SIZE = 5000
+
+SUM_FIELDS = ("total_sent", "total_received")
+
+def _user_deltas(transaction):
+    """Yield (user_id, increments) for each side of a completed transfer"""
+    amount = to_decimal(transaction["amount"])
+    sender_id = transaction["sender_id"]
+    receiver_id = transaction["receiver_id"]
+    sent = {"total_transactions": 1, "sent_count": 1, "total_sent": amount}
+    received = {"total_transactions": 1, "received_count": 1, "total_received": amount}
+    if sender_id == receiver_id:
+        sent.update({"received_count": 1, "total_received": amount})
+        yield sender_id, sent
+    else:
+        yield sender_id, sent
+        yield receiver_id, received
+
+def _merge(target, increments):
+    for field, value in increments.items():
+        target[field] = target.get(field, 0) + value
+
+def _inc(increments):
+    return {
+        field: to_decimal128(value) if field in SUM_FIELDS else value
+        for field, value in increments.items()
+    }
+
+def record_transactions(transactions):
+    """Apply completed transactions to the materialized stats"""
+    users = {}
+    days = {}
+    for transaction in transactions:
+        # first/last stay ISO strings so $min/$max never compare mixed types
+        moment = to_datetime(transaction["timestamp"])
+        timestamp = moment.isoformat()
+        day = moment.date().isoformat()
+        for user_id, increments in _user_deltas(transaction):
+            user = users.setdefault(user_id, {"inc": {}, "first": timestamp, "last": timestamp})
+            _merge(user["inc"], increments)
+            user["first"] = min(user["first"], timestamp)
+            user["last"] = max(user["last"], timestamp)
+            _merge(days.setdefault((user_id, day), {}), increments)
+
+    if users:
+        db.user_stats.bulk_write([
+            UpdateOne(
+                {"_id": user_id},
+                {
+                    "$inc": _inc(user["inc"]),
+                    "$min": {"first_transaction_at": user["first"]},
+                    "$max": {"last_transaction_at": user["last"]}
+                },
+                upsert=True
+            )
+            for user_id, user in users.items()
+        ], ordered=False)
+    if days:
+        db.user_daily_stats.bulk_write([
+            UpdateOne(
+                {"_id": f"{user_id}:{day}"},
+                {"$inc": _inc(increments), "$setOnInsert": {"user_id": user_id, "date": day}},
+                upsert=True
+            )
+            for (user_id, day), increments in days.items()
+        ], ordered=False)
+
+def rebuild():
+    """Recompute all stats from the completed transactions, archived ones included.
+
+    Run it while no transfers are being written; a transfer that completes
+    mid-rebuild can be counted twice or missed.
+    """
+    db.user_stats.delete_many({})
+    db.user_daily_stats.delete_many({})
+    batch = []
+    total = 0
+    for transaction in partitions.find({"status": "completed"}, status="completed", batch_size=REBUILD_BATCH_SIZE):
+        batch.append(transaction)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            record_transactions(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        record_transactions(batch)
+        total += len(batch)
+    return total
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Maintain materialized user stats")
+    arg_parser.add_argument('command', choices=['rebuild'])
+    args = arg_parser.parse_args()
+    if args.command == 'rebuild':
+        print(f"Rebuilt stats from {rebuild()} transactions")
@@ -0,0 +1,53 @@
+from flask import Response, request, stream_with_context
+from config import Config
+import serialization
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def stream_format():
+    """Return 'ndjson' or 'json' if the caller asked for a streamed response.
+
+    Streaming is chosen with ``?stream=ndjson`` / ``?stream=json`` or an
+    ``Accept: application/x-ndjson`` header; otherwise None.
+    """
+    requested = request.args.get('stream', '').lower()
+    if requested in ('ndjson', 'json'):
+        return requested
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return None
+
+def _encode_chunk(lines, fmt, first):
+    if fmt == 'ndjson':
+        return b'\n'.join(lines) + b'\n'
+    return (b'' if first else b',') + b','.join(lines)
+
+def stream_documents(documents, fmt, transform=None):
+    """Stream documents as NDJSON or a chunked JSON array.
+
+    ``documents`` is read lazily (a Mongo cursor should fetch
+    ``STREAM_BATCH_SIZE`` at a time) and written one batch per chunk, so
+    memory stays flat however large the result is.
+    """
+    batch_size = Config.STREAM_BATCH_SIZE
+
+    def generate():
+        if fmt == 'json':
+            yield b'['
+        first = True
+        lines = []
+        for document in documents:
+            if transform:
+                document = transform(document)
+            lines.append(serialization.dumps(document))
+            if len(lines) >= batch_size:
+                yield _encode_chunk(lines, fmt, first)
+                first = False
+                lines = []
+        if lines:
+            yield _encode_chunk(lines, fmt, first)
+        if fmt == 'json':
+            yield b']'
+
+    mimetype = NDJSON_MIMETYPE if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
@@ -0,0 +1,269 @@
+"""Minimal distributed tracing with W3C ``traceparent`` propagation.
+
+``init_app`` opens a server span for every request, continuing the caller's
+trace when a ``traceparent`` header is present. ``ServiceClient`` opens a
+client span per outbound call and forwards the header, and
+``MongoCommandTracing`` (passed to ``MongoClient`` in ``db.py``) adds a span
+per Mongo command.
+
+Finished spans are batched and written as OTLP/JSON, one export request per
+line, to ``TRACE_EXPORT_PATH`` and/or POSTed to an OTLP/HTTP collector at
+``TRACE_EXPORT_URL``. With ``TRACE_SAMPLE_RATE=0`` (the default) nothing is
+recorded unless an incoming request arrives already sampled; unsampled
+requests only carry ids forward.
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from flask import g, request
+from pymongo import monitoring
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+# Probes and scrapes would only add noise to traces
+UNTRACED_PATHS = frozenset(["/healthz", "/readyz", "/metrics"])
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id, parent_id, sampled, name, kind, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns() if sampled else 0
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def end(self):
+        if self.sampled and not self.end_ns:
+            self.end_ns = time.time_ns()
+            exporter.add(self)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()]
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id, sampled), or None if malformed"""
+    parts = (header or "").strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+def current_span():
+    return _current.get()
+
+def start_span(name, kind=SPAN_KIND_INTERNAL, attributes=None, parent=None):
+    """Create a span under ``parent`` (a parsed traceparent) or the current span.
+
+    Returns the span and a token for ``finish_span``; prefer ``span()``.
+    """
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        active = _current.get()
+        if active is not None:
+            trace_id, parent_id, sampled = active.trace_id, active.span_id, active.sampled
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = Config.TRACE_SAMPLE_RATE > 0 and random.random() < Config.TRACE_SAMPLE_RATE
+    new_span = Span(trace_id, parent_id, sampled, name, kind, attributes)
+    return new_span, _current.set(new_span)
+
+def finish_span(new_span, token, error=None):
+    if error is not None:
+        new_span.error = str(error) or type(error).__name__
+    new_span.end()
+    _current.reset(token)
+
+@contextmanager
+def span(name, kind=SPAN_KIND_INTERNAL, attributes=None):
+    new_span, token = start_span(name, kind, attributes)
+    try:
+        yield new_span
+    except Exception as e:
+        finish_span(new_span, token, e)
+        raise
+    finish_span(new_span, token)
+
+class MongoCommandTracing(monitoring.CommandListener):
+    """One client span per Mongo command issued inside a sampled trace"""
+
+    def __init__(self):
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        active = _current.get()
+        if active is None or not active.sampled:
+            return
+        command_span = Span(active.trace_id, active.span_id, True, f"mongo {event.command_name}", SPAN_KIND_CLIENT, {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+            "db.mongodb.collection": event.command.get(event.command_name, "")
+        })
+        with self._lock:
+            self._spans[(event.connection_id, event.request_id)] = command_span
+
+    def _finish(self, event, error=None):
+        with self._lock:
+            command_span = self._spans.pop((event.connection_id, event.request_id), None)
+        if command_span is None:
+            return
+        # Use the driver's own timing rather than when the listener ran
+        command_span.end_ns = command_span.start_ns + event.duration_micros * 1000
+        command_span.error = error
+        exporter.add(command_span)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "failed")))
+
+class SpanExporter:
+    """Batches finished spans and writes them from a background thread"""
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker_pid = None
+        self.dropped = 0
+
+    def add(self, finished):
+        if not (Config.TRACE_EXPORT_PATH or Config.TRACE_EXPORT_URL):
+            return
+        with self._lock:
+            if len(self._spans) >= Config.TRACE_MAX_QUEUE:
+                self.dropped += 1
+                return
+            self._spans.append(finished)
+            full = len(self._spans) >= Config.TRACE_BATCH_SIZE
+        self._ensure_worker()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        # Threads don't survive fork(), so each worker process starts its own
+        if self._worker_pid != os.getpid():
+            with self._lock:
+                if self._worker_pid != os.getpid():
+                    threading.Thread(target=self._export_forever, name="span-exporter", daemon=True).start()
+                    self._worker_pid = os.getpid()
+
+    def _export_forever(self):
+        while True:
+            self._wakeup.wait(Config.TRACE_EXPORT_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Span export failed: %s", e)
+
+    def flush(self):
+        with self._lock:
+            batch, self._spans = self._spans, []
+        if not batch:
+            return
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", Config.TRACE_SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": "insta-pay.tracing"},
+                "spans": [finished.to_otlp() for finished in batch]
+            }]
+        }]}
+        if Config.TRACE_EXPORT_PATH:
+            with open(Config.TRACE_EXPORT_PATH, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+        if Config.TRACE_EXPORT_URL:
+            requests.post(Config.TRACE_EXPORT_URL, json=payload, timeout=5)
+
+exporter = SpanExporter()
+
+def init_app(app):
+    """Open a server span for every request on ``app``"""
+
+    @app.before_request
+    def start_server_span():
+        if request.path in UNTRACED_PATHS:
+            return
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.trace_span, g.trace_token = start_span(
+            f"{request.method} {route}",
+            SPAN_KIND_SERVER,
+            {"http.method": request.method, "http.route": route, "http.target": request.path},
+            parent=parse_traceparent(request.headers.get("traceparent"))
+        )
+
+    @app.after_request
+    def record_status(response):
+        server_span = g.get("trace_span")
+        if server_span is not None:
+            server_span.set("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                server_span.error = f"HTTP {response.status_code}"
+            response.headers["traceparent"] = server_span.traceparent
+        return response
+
+    @app.teardown_request
+    def end_server_span(exc):
+        server_span = g.pop("trace_span", None)
+        if server_span is not None:
+            finish_span(server_span, g.pop("trace_token"), exc)
@@ -2,6 +2,11 @@ from flask import Flask, render_template, session, redirect
 from functools import wraps
 from flask_cors import CORS
 from config import Config
+from db import ensure_indexes
+import metrics
+import tracing
+import health
+import serialization
 
 # Create Flask app
 app = Flask(__name__)
@@ -43,6 +48,21 @@ def dashboard():
 from user.routes import user_bp
 
 app.register_blueprint(user_bp)
+metrics.init_app(app)
+tracing.init_app(app)
+health.init_app(app)
+serialization.init_app(app)
+
+def startup():
+    """Create indexes for this process"""
+    try:
+        ensure_indexes()
+    except Exception as e:
+        app.logger.warning("Could not create indexes: %s", e)
+
+# Under gunicorn this runs in each worker after fork (see gunicorn.conf.py)
+if not Config.DEFER_STARTUP:
+    startup()
 
 if __name__ == '__main__':
     app.run(
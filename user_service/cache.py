@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+import serialization
+
+class LRUCache:
+    """In-process LRU cache whose entries expire after ``ttl`` seconds.
+
+    A ``max_size`` of 0 or less stores nothing, so every lookup misses.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_many(self, keys):
+        """Cached values for ``keys`` that are present, by key"""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "backend": "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl
+        }
+
+class RedisCache:
+    """Cache backed by any Redis-protocol server; entries expire via EX"""
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raw = self.client.get(key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return serialization.loads(raw)
+
+    def get_many(self, keys):
+        """Cached values for ``keys`` that are present, in one MGET"""
+        if not keys:
+            return {}
+        raws = self.client.mget(keys)
+        found = {key: serialization.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        self.client.set(key, serialization.dumps(value), ex=max(1, int(self.ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        evictions = None
+        try:
+            evictions = self.client.info('stats').get('evicted_keys')
+        except Exception:
+            pass
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": evictions,
+            "ttl": self.ttl
+        }
+
+def build_cache():
+    if Config.USER_CACHE_URL:
+        # redis is an optional dependency, only needed for a shared cache
+        import redis
+        return RedisCache(redis.Redis.from_url(Config.USER_CACHE_URL), Config.USER_CACHE_TTL)
+    return LRUCache(Config.USER_CACHE_MAX_SIZE, Config.USER_CACHE_TTL)
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+user_cache = build_cache()
@@ -9,9 +9,68 @@ if os.path.exists(env_file):
 class Config:
     MONGODB_URI = os.getenv('MONGODB_URI')
     MONGODB_DB = os.getenv('MONGODB_DB')
+
+    # MongoDB client pool and timeouts
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    # 0 leaves socket reads unbounded, which long report aggregations need
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '0'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0'))
+
+    # Readiness probe caches its Mongo ping for this long
+    READINESS_CACHE_SECONDS = float(os.getenv('READINESS_CACHE_SECONDS', '2'))
+    # Set by gunicorn.conf.py: startup work then runs in each worker after fork
+    DEFER_STARTUP = os.getenv('DEFER_STARTUP', '0') == '1'
+
     FLASK_APP = os.getenv('FLASK_APP')
     FLASK_ENV = os.getenv('FLASK_ENV')
     FLASK_DEBUG = os.getenv('FLASK_DEBUG')
     FLASK_HOST = os.getenv('FLASK_HOST')
     FLASK_PORT = os.getenv('FLASK_PORT')
     SECRET_KEY = os.getenv('SECRET_KEY')
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+    # User lookup cache. Leave USER_CACHE_URL empty for a per-process LRU;
+    # set it to a redis:// URL (needs the redis package) to share one cache
+    # across replicas. A process only invalidates its own LRU, so another
+    # gunicorn worker or replica can serve a user's old balance for up to
+    # USER_CACHE_TTL seconds after a transfer. gunicorn.conf.py therefore
+    # turns the LRU off (USER_CACHE_MAX_SIZE=0) when it runs more than one
+    # worker without USER_CACHE_URL; set USER_CACHE_MAX_SIZE to accept the
+    # staleness instead.
+    USER_CACHE_URL = os.getenv('USER_CACHE_URL')
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '5'))
+    USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', '10000'))
+    # Bearer-token sessions: lifetime, and how long a verified token is
+    # trusted from the in-process cache before Mongo is asked again
+    SESSION_TTL = int(os.getenv('SESSION_TTL', '86400'))
+    SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', '30'))
+    SESSION_CACHE_MAX_SIZE = int(os.getenv('SESSION_CACHE_MAX_SIZE', '10000'))
+    # Password hashing: pbkdf2 rounds for new hashes (older hashes are
+    # upgraded on login), hash worker processes per app process (0 runs
+    # inline), and how many hash jobs may wait before requests are turned
+    # away with a 503. Every gunicorn worker has its own pool, so
+    # gunicorn.conf.py splits the container's CPUs between them.
+    PASSWORD_HASH_ROUNDS = int(os.getenv('PASSWORD_HASH_ROUNDS', '29000'))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '1'))
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', '64'))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '2'))
+    # How long applied transfer ids are kept to deduplicate retried transfers
+    APPLIED_TRANSFER_RETENTION = int(os.getenv('APPLIED_TRANSFER_RETENTION', '604800'))
+    # Log sampled stacks for requests slower than this (0 disables)
+    PROFILE_SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUEST_MS', '0'))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.01'))
+    # Tracing: sampled spans are exported as OTLP/JSON to a file and/or collector
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'user-service')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+    TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', '')
+    TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL', '')
+    TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '2'))
+    TRACE_BATCH_SIZE = int(os.getenv('TRACE_BATCH_SIZE', '512'))
+    TRACE_MAX_QUEUE = int(os.getenv('TRACE_MAX_QUEUE', '10000'))
+    # Batch user lookups (POST /api/user/batch): most ids per call
+    USER_BATCH_MAX_IDS = int(os.getenv('USER_BATCH_MAX_IDS', '500'))
+    # Response encoding: orjson, or stdlib to compare against (serialization.py)
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
@@ -1,6 +1,57 @@
-from pymongo import MongoClient
+import logging
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import ConnectionFailure, PyMongoError
 from config import Config
+from metrics import MongoCommandMetrics
+from tracing import MongoCommandTracing
 
 # Setup MongoDB
-client = MongoClient(Config.MONGODB_URI)
-db = client[Config.MONGODB_DB] 
\ No newline at end of file
+# connect=False defers connecting (and the driver's monitor threads) to the
+# first operation, so a client built before a pre-fork server forks is safe
+client = MongoClient(
+    Config.MONGODB_URI,
+    connect=False,
+    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS or None,
+    waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+    event_listeners=[MongoCommandMetrics(), MongoCommandTracing()]
+)
+db = client[Config.MONGODB_DB]
+
+logger = logging.getLogger(__name__)
+
+def _create_index(collection, keys, **options):
+    """Create one index, logging rather than raising if Mongo refuses it.
+
+    A bad index, such as a unique one over duplicate legacy data, would
+    otherwise stop the TTL indexes after it from being created. Losing the
+    connection still raises, once, to the caller.
+    """
+    try:
+        collection.create_index(keys, **options)
+    except ConnectionFailure:
+        raise
+    except PyMongoError as e:
+        logger.error("Could not create index %s on %s: %s", options.get("name"), collection.name, e)
+
+def ensure_indexes():
+    """Create the indexes the auth and lookup paths rely on (no-op if present)"""
+    _create_index(db.users, [("email", ASCENDING)], unique=True, name="email_unique")
+    # Only string tokens: sparse would still index every explicit null, and
+    # two users with token: null would then break the unique index. An
+    # older sparse token_unique has to be dropped for this one to replace it.
+    _create_index(db.users, [("token", ASCENDING)], unique=True,
+                  partialFilterExpression={"token": {"$type": "string"}}, name="token_unique")
+    # Mongo's TTL monitor removes sessions once expires_at has passed
+    _create_index(db.sessions, [("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+    _create_index(db.sessions, [("user_id", ASCENDING)], name="user_id")
+    _create_index(
+        db.applied_transfers,
+        [("applied_at", ASCENDING)],
+        expireAfterSeconds=Config.APPLIED_TRANSFER_RETENTION,
+        name="applied_at_ttl"
+    )
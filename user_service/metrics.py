@@ -0,0 +1,164 @@
+"""Prometheus metrics shared by the services.
+
+``init_app`` times every request and serves the registry at ``/metrics``.
+Outbound calls are timed by ``service_client`` and Mongo commands by the
+``MongoCommandMetrics`` listener that ``db.py`` passes to ``MongoClient``.
+
+Under a multi-process server, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory so ``/metrics`` aggregates every worker.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter as PromCounter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess
+)
+from pymongo import monitoring
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent serving a request",
+    ["method", "route", "status"]
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served",
+    ["route"], multiprocess_mode="livesum"
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Time spent on calls to other services",
+    ["upstream", "endpoint", "status"]
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "Time spent on Mongo commands",
+    ["command", "outcome"], buckets=FAST_BUCKETS
+)
+SLOW_REQUESTS = PromCounter(
+    "http_slow_requests_total", "Requests slower than PROFILE_SLOW_REQUEST_MS",
+    ["route"]
+)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the server round trip of every Mongo command"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.labels(event.command_name, "success").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_LATENCY.labels(event.command_name, "failure").observe(event.duration_micros / 1e6)
+
+def observe_upstream(upstream, endpoint, status, elapsed_seconds):
+    UPSTREAM_LATENCY.labels(upstream, endpoint, status).observe(elapsed_seconds)
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests and logs the slow ones.
+
+    A single background thread looks at every request thread each
+    ``interval`` seconds; when a request ends after ``threshold_ms`` its
+    most frequent stacks are logged. Cost is one ``sys._current_frames``
+    call per interval, whatever the load.
+    """
+
+    def __init__(self, threshold_ms, interval, depth=12, top=5):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.depth = depth
+        self.top = top
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler_pid = None
+
+    def _ensure_sampler(self):
+        # Threads don't survive fork(), so each worker starts its own
+        if self._sampler_pid != os.getpid():
+            with self._lock:
+                if self._sampler_pid != os.getpid():
+                    threading.Thread(target=self._sample_forever, name="slow-request-profiler", daemon=True).start()
+                    self._sampler_pid = os.getpid()
+
+    def _stack(self, frame):
+        lines = []
+        while frame is not None and len(lines) < self.depth:
+            code = frame.f_code
+            lines.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+            frame = frame.f_back
+        return " <- ".join(lines)
+
+    def _sample_forever(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[self._stack(frame)] += 1
+
+    def start_request(self):
+        self._ensure_sampler()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end_request(self, route, elapsed_ms):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if elapsed_ms < self.threshold_ms:
+            return
+        SLOW_REQUESTS.labels(route).inc()
+        hottest = "\n".join(f"  {count:>4} x {stack}" for stack, count in (samples or Counter()).most_common(self.top))
+        logger.warning("Slow request %s %s took %.1f ms; sampled stacks:\n%s",
+                       request.method, route, elapsed_ms, hottest or "  (no samples)")
+
+def metrics_view():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def init_app(app):
+    """Time every request on ``app`` and expose ``/metrics``"""
+    profiler = None
+    if Config.PROFILE_SLOW_REQUEST_MS > 0:
+        profiler = SlowRequestProfiler(Config.PROFILE_SLOW_REQUEST_MS, Config.PROFILE_SAMPLE_INTERVAL)
+
+    @app.before_request
+    def start_request_timer():
+        # The matched rule, not the raw path, keeps label cardinality bounded
+        g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.metrics_start = time.perf_counter()
+        IN_FLIGHT.labels(g.metrics_route).inc()
+        if profiler:
+            profiler.start_request()
+
+    @app.after_request
+    def record_request_latency(response):
+        start = g.get("metrics_start")
+        if start is not None:
+            REQUEST_LATENCY.labels(request.method, g.metrics_route, str(response.status_code)).observe(
+                time.perf_counter() - start
+            )
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        start = g.get("metrics_start")
+        if start is None:
+            return
+        IN_FLIGHT.labels(g.metrics_route).dec()
+        if profiler:
+            profiler.end_request(g.metrics_route, (time.perf_counter() - start) * 1000)
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
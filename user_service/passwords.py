@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from passlib.hash import pbkdf2_sha256
+from config import Config
+
+class HashPoolBusy(Exception):
+    """Raised when too many hash jobs are already queued"""
+
+def _hash(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+def _verify(password, stored_hash, rounds):
+    """Return (matches, new_hash); new_hash is set when the stored hash
+    uses outdated parameters and should be replaced"""
+    hasher = pbkdf2_sha256.using(rounds=rounds)
+    if not hasher.verify(password, stored_hash):
+        return False, None
+    if hasher.needs_update(stored_hash):
+        return True, hasher.hash(password)
+    return True, None
+
+class PasswordHasher:
+    """Runs pbkdf2 hashing on a bounded process pool.
+
+    Request threads only wait on a future, so a burst of logins keeps the
+    CPU work off the Flask workers. At most ``PASSWORD_HASH_QUEUE_LIMIT`` jobs
+    may be queued or running; beyond that callers get HashPoolBusy instead
+    of piling up. With ``PASSWORD_HASH_WORKERS=0`` hashing runs inline.
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(Config.PASSWORD_HASH_QUEUE_LIMIT)
+        self.in_flight = 0
+        self.rejected = 0
+        self._timings = {}
+
+    def _executor(self):
+        # A pool inherited across fork() is unusable, so each process
+        # creates its own on first use
+        if Config.PASSWORD_HASH_WORKERS <= 0:
+            return None
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy()
+        start = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            executor = self._executor()
+            if executor is None:
+                return fn(*args)
+            return executor.submit(fn, *args).result()
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.in_flight -= 1
+                timing = self._timings.setdefault(operation, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                timing["count"] += 1
+                timing["total_ms"] += elapsed
+                timing["max_ms"] = max(timing["max_ms"], elapsed)
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run("hash", _hash, password, Config.PASSWORD_HASH_ROUNDS)
+
+    def verify(self, password, stored_hash):
+        return self._run("verify", _verify, password, stored_hash, Config.PASSWORD_HASH_ROUNDS)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": Config.PASSWORD_HASH_WORKERS,
+                "rounds": Config.PASSWORD_HASH_ROUNDS,
+                "queue_depth": self.in_flight,
+                "queue_limit": Config.PASSWORD_HASH_QUEUE_LIMIT,
+                "rejected": self.rejected,
+                "operations": {
+                    operation: {
+                        "count": t["count"],
+                        "avg_ms": round(t["total_ms"] / t["count"], 3) if t["count"] else 0,
+                        "max_ms": round(t["max_ms"], 3)
+                    }
+                    for operation, t in self._timings.items()
+                }
+            }
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,54 @@
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from cache import LRUCache
+from config import Config
+from db import db
+
+def _token_id(token):
+    # Only a digest is stored, so the sessions collection never holds a
+    # usable bearer token
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionStore:
+    """Bearer-token sessions in Mongo with TTL expiry.
+
+    ``verify`` answers from an in-process cache when it can, so most
+    authenticated requests cost no database round trip at all. A revoked
+    token can stay valid on other processes for up to ``SESSION_CACHE_TTL``.
+    """
+
+    def __init__(self):
+        self.verified = LRUCache(Config.SESSION_CACHE_MAX_SIZE, Config.SESSION_CACHE_TTL)
+
+    def create(self, user_id):
+        token = secrets.token_urlsafe(32)
+        now = datetime.utcnow()
+        db.sessions.insert_one({
+            "_id": _token_id(token),
+            "user_id": user_id,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=Config.SESSION_TTL)
+        })
+        return token
+
+    def verify(self, token):
+        """Return the user id for a live token, or None"""
+        token_id = _token_id(token)
+        now = datetime.utcnow()
+        cached = self.verified.get(token_id)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        session = db.sessions.find_one({"_id": token_id, "expires_at": {"$gt": now}})
+        if not session:
+            return None
+        self.verified.set(token_id, (session["user_id"], session["expires_at"]))
+        return session["user_id"]
+
+    def revoke(self, token):
+        token_id = _token_id(token)
+        self.verified.delete(token_id)
+        db.sessions.delete_one({"_id": token_id})
+
+session_store = SessionStore()
@@ -1,7 +1,27 @@
 from flask import Flask, jsonify, request, session, redirect
-from passlib.hash import pbkdf2_sha256
-from db import db
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, DuplicateKeyError, BulkWriteError
+from db import db, client
+from streaming import stream_format, stream_documents
+from cache import user_key
+from sessions import session_store
+from passwords import password_hasher, HashPoolBusy
+import cache
 import uuid
+from datetime import datetime
+
+# Never sent to clients or cached: the password hash, and the bearer
+# token older user documents still carry
+USER_PROJECTION = {"password": 0, "token": 0}
+
+class TransferError(Exception):
+  def __init__(self, message, status):
+    super().__init__(message)
+    self.message = message
+    self.status = status
+
+class BatchConflict(Exception):
+  """Balances changed between planning and writing a transfer batch"""
 
 class User:
 
@@ -9,7 +29,7 @@ class User:
     del user['password']
     session['logged_in'] = True
     session['user'] = user
-    return jsonify(user), 200
+    return jsonify({**user, "token": session_store.create(user['_id'])}), 200
 
   def signup(self):
     data = request.get_json()    
@@ -22,19 +42,33 @@ class User:
       "balance": 1000.0  # Initialize balance to 0
     }
 
+    # Check for existing email address before paying for the hash
+    if db.users.find_one({ "email": user['email'] }):
+      return jsonify({ "error": "Email address already in use" }), 400
+
     # Encrypt the password
-    user['password'] = pbkdf2_sha256.encrypt(user['password'])
+    try:
+      user['password'] = password_hasher.hash(user['password'])
+    except HashPoolBusy:
+      return jsonify({ "error": "Server busy, please retry" }), 503
 
-    # Check for existing email address
-    if db.users.find_one({ "email": user['email'] }):
+    # The unique email index settles signups racing past the check above
+    try:
+      inserted = db.users.insert_one(user)
+    except DuplicateKeyError:
       return jsonify({ "error": "Email address already in use" }), 400
 
-    if db.users.insert_one(user):
-      return self.start_session(user)
+    if inserted:
+      response = self.start_session(user)
+      cache.user_cache.set(user_key(user['_id']), user)
+      return response
 
     return jsonify({ "error": "Signup failed" }), 400
   
   def signout(self):
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+      session_store.revoke(token.split(' ')[1])
     session.clear()
     return redirect('/')
   
@@ -44,29 +78,62 @@ class User:
       "email": data.get('email')
     })
 
-    if user and pbkdf2_sha256.verify(data.get('password'), user['password']):
-      return self.start_session(user)
+    if user:
+      try:
+        valid, new_hash = password_hasher.verify(data.get('password'), user['password'])
+      except HashPoolBusy:
+        return jsonify({ "error": "Server busy, please retry" }), 503
+      if valid:
+        # Upgrade hashes made with older parameters while we have the password
+        if new_hash:
+          db.users.update_one({"_id": user['_id']}, {"$set": {"password": new_hash}})
+        return self.start_session(user)
     
     return jsonify({ "error": "Invalid login credentials" }), 401
   
   def get_users(self):
-    users = list(db.users.find())
-    # Convert ObjectId to string and remove password for security
-    for user in users:
-      user["_id"] = str(user["_id"])
-      if "password" in user:
-        del user["password"]
-    return jsonify(users)
-
-  def get_user_id(self, user_id):
-    user = db.users.find_one({"_id": user_id})
+    fmt = stream_format()
+    if fmt:
+      return stream_documents(db.users.find({}, USER_PROJECTION), fmt)
+    return jsonify(list(db.users.find({}, USER_PROJECTION)))
+
+  def get_user_id(self, user_id, bypass_cache=False):
+    if not bypass_cache:
+      cached = cache.user_cache.get(user_key(user_id))
+      if cached is not None:
+        return jsonify(cached), 200
+    user = db.users.find_one({"_id": user_id}, USER_PROJECTION)
     if user:
-      user["_id"] = str(user["_id"])
-      if "password" in user:
-        del user["password"]
+      cache.user_cache.set(user_key(user_id), user)
       return jsonify(user), 200
     return jsonify({"error": "User not found"}), 404
 
+  def get_users_batch(self, user_ids, fields=None, bypass_cache=False):
+    """Look up many users in one call: cache first, then one $in query"""
+    user_ids = list(dict.fromkeys(user_ids))
+    found = {}
+    if not bypass_cache:
+      cached = cache.user_cache.get_many([user_key(user_id) for user_id in user_ids])
+      found = {user_id: cached[user_key(user_id)] for user_id in user_ids if user_key(user_id) in cached}
+    misses = [user_id for user_id in user_ids if user_id not in found]
+    if misses:
+      for user in db.users.find({"_id": {"$in": misses}}, USER_PROJECTION):
+        cache.user_cache.set(user_key(user["_id"]), user)
+        found[user["_id"]] = user
+
+    users = []
+    for user_id in user_ids:
+      user = found.get(user_id)
+      if user is None:
+        continue
+      if fields:
+        user = {"_id": user["_id"], **{field: user[field] for field in fields if field in user}}
+      users.append(user)
+    return jsonify({
+      "users": users,
+      "missing": [user_id for user_id in user_ids if user_id not in found]
+    }), 200
+
   def update_balance(self, user_id, amount):
     try:
       result = db.users.update_one(
@@ -74,7 +141,255 @@ class User:
         {"$inc": {"balance": float(amount)}}
       )
       if result.modified_count > 0:
+        cache.user_cache.delete(user_key(user_id))
         return jsonify({"message": "Balance updated successfully"}), 200
       return jsonify({"error": "User not found"}), 404
     except Exception as e:
-      return jsonify({"error": "Failed to update balance", "details": str(e)}), 500
\ No newline at end of file
+      return jsonify({"error": "Failed to update balance", "details": str(e)}), 500
+
+  def transfer(self, sender_id, receiver_id, amount, transfer_id=None):
+    """Move amount from sender to receiver in a single server-side operation.
+
+    When a transfer_id is given the transfer is applied at most once; a
+    repeat returns 200 without moving money again.
+    """
+    try:
+      amount = float(amount)
+      message = "Transfer completed"
+      try:
+        with client.start_session() as mongo_session:
+          balances = mongo_session.with_transaction(
+            lambda s: self._apply_transfer(sender_id, receiver_id, amount, s, transfer_id)
+          )
+      except DuplicateKeyError:
+        message = "Transfer already applied"
+        balances = self._current_balances(sender_id, receiver_id)
+      except OperationFailure as e:
+        # Standalone mongod has no transactions (code 20); the guarded $inc
+        # still prevents overdrafts, the credit is just compensated by hand.
+        if e.code != 20:
+          raise
+        message, balances = self._transfer_standalone(sender_id, receiver_id, amount, transfer_id)
+      cache.user_cache.delete(user_key(sender_id), user_key(receiver_id))
+      return jsonify({
+        "message": message,
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "amount": amount,
+        "sender_balance": balances[0],
+        "receiver_balance": balances[1]
+      }), 200
+    except TransferError as e:
+      return jsonify({"error": e.message}), e.status
+    except Exception as e:
+      return jsonify({"error": "Failed to transfer", "details": str(e)}), 500
+
+  def _transfer_standalone(self, sender_id, receiver_id, amount, transfer_id=None):
+    """(message, balances) for a transfer without a Mongo transaction.
+
+    The transfer_id marker is inserted before any money moves, so of two
+    concurrent or retried calls only the one whose insert succeeds applies
+    the transfer. The marker is removed again if the transfer fails.
+    """
+    if transfer_id:
+      try:
+        self._mark_applied(transfer_id, sender_id, receiver_id, amount)
+      except DuplicateKeyError:
+        return "Transfer already applied", self._current_balances(sender_id, receiver_id)
+    try:
+      return "Transfer completed", self._apply_transfer(sender_id, receiver_id, amount)
+    except Exception:
+      if transfer_id:
+        db.applied_transfers.delete_one({"_id": transfer_id})
+      raise
+
+  def _applied_marker(self, transfer_id, sender_id, receiver_id, amount):
+    return {
+      "_id": transfer_id,
+      "sender_id": sender_id,
+      "receiver_id": receiver_id,
+      "amount": amount,
+      "applied_at": datetime.utcnow()
+    }
+
+  def _mark_applied(self, transfer_id, sender_id, receiver_id, amount, mongo_session=None):
+    """Record transfer_id as applied; DuplicateKeyError if it already is"""
+    db.applied_transfers.insert_one(
+      self._applied_marker(transfer_id, sender_id, receiver_id, amount), session=mongo_session
+    )
+
+  def _release(self, markers):
+    if markers:
+      db.applied_transfers.delete_many({"_id": {"$in": [marker["_id"] for marker in markers]}})
+
+  def _current_balances(self, sender_id, receiver_id):
+    balances = {
+      user["_id"]: user.get("balance", 0)
+      for user in db.users.find({"_id": {"$in": [sender_id, receiver_id]}}, {"balance": 1})
+    }
+    return balances.get(sender_id), balances.get(receiver_id)
+
+  def _apply_transfer(self, sender_id, receiver_id, amount, mongo_session=None, transfer_id=None):
+    if transfer_id and mongo_session is not None:
+      # Inserted in the same transaction as the balance changes, so the
+      # marker exists exactly when the money has moved
+      self._mark_applied(transfer_id, sender_id, receiver_id, amount, mongo_session)
+
+    sender = db.users.find_one_and_update(
+      {"_id": sender_id, "balance": {"$gte": amount}},
+      {"$inc": {"balance": -amount}},
+      projection={"balance": 1},
+      return_document=ReturnDocument.AFTER,
+      session=mongo_session
+    )
+    if not sender:
+      if db.users.count_documents({"_id": sender_id}, limit=1, session=mongo_session):
+        raise TransferError("Insufficient balance", 400)
+      raise TransferError("Sender not found", 404)
+
+    receiver = db.users.find_one_and_update(
+      {"_id": receiver_id},
+      {"$inc": {"balance": amount}},
+      projection={"balance": 1},
+      return_document=ReturnDocument.AFTER,
+      session=mongo_session
+    )
+    if not receiver:
+      if mongo_session is None:
+        db.users.update_one({"_id": sender_id}, {"$inc": {"balance": amount}})
+      raise TransferError("Receiver not found", 404)
+
+    if sender_id == receiver_id:
+      return receiver["balance"], receiver["balance"]
+    return sender["balance"], receiver["balance"]
+
+  def transfer_batch(self, items, max_attempts=3):
+    """Apply many transfers with one user lookup and one bulk write.
+
+    Items are checked in order against an in-memory copy of the balances,
+    so an item fails exactly as it would have if sent on its own. Balance
+    changes are netted per user before being written. Items with a
+    transfer_id are applied at most once, as with transfer().
+    """
+    try:
+      for attempt in range(max_attempts):
+        try:
+          try:
+            with client.start_session() as mongo_session:
+              results = mongo_session.with_transaction(
+                lambda s: self._apply_batch(items, s)
+              )
+          except OperationFailure as e:
+            if e.code != 20:
+              raise
+            results = self._apply_batch(items)
+          cache.user_cache.delete(*{
+            user_key(user_id) for item in items for user_id in (item["sender_id"], item["receiver_id"])
+          })
+          return jsonify({"results": results}), 200
+        except BatchConflict:
+          continue
+      return jsonify({"error": "Balances changed during batch, retry"}), 409
+    except Exception as e:
+      return jsonify({"error": "Failed to transfer batch", "details": str(e)}), 500
+
+  def _plan_batch(self, items, balances, applied_ids=()):
+    """(results, deltas, claimed): claimed are the items with a transfer_id to mark applied"""
+    results = []
+    deltas = {}
+    claimed = []
+    applied_ids = set(applied_ids)
+    for item in items:
+      sender_id = item["sender_id"]
+      receiver_id = item["receiver_id"]
+      amount = float(item["amount"])
+      transfer_id = item.get("transfer_id")
+      if transfer_id and transfer_id in applied_ids:
+        results.append({"status": "completed", "message": "Transfer already applied"})
+      elif sender_id not in balances:
+        results.append({"status": "failed", "error": "Sender not found", "code": 404})
+      elif receiver_id not in balances:
+        results.append({"status": "failed", "error": "Receiver not found", "code": 404})
+      elif balances[sender_id] < amount:
+        results.append({"status": "failed", "error": "Insufficient balance", "code": 400})
+      else:
+        balances[sender_id] -= amount
+        balances[receiver_id] += amount
+        deltas[sender_id] = deltas.get(sender_id, 0.0) - amount
+        deltas[receiver_id] = deltas.get(receiver_id, 0.0) + amount
+        results.append({"status": "completed"})
+        if transfer_id:
+          applied_ids.add(transfer_id)
+          claimed.append(item)
+    return results, {user_id: delta for user_id, delta in deltas.items() if delta != 0}, claimed
+
+  def _apply_batch(self, items, mongo_session=None):
+    user_ids = list({item["sender_id"] for item in items} | {item["receiver_id"] for item in items})
+    balances = {
+      user["_id"]: float(user.get("balance", 0))
+      for user in db.users.find({"_id": {"$in": user_ids}}, {"balance": 1}, session=mongo_session)
+    }
+    transfer_ids = [item["transfer_id"] for item in items if item.get("transfer_id")]
+    applied_ids = [
+      marker["_id"]
+      for marker in db.applied_transfers.find({"_id": {"$in": transfer_ids}}, {"_id": 1}, session=mongo_session)
+    ] if transfer_ids else []
+    results, deltas, claimed = self._plan_batch(items, balances, applied_ids)
+    debits = {user_id: delta for user_id, delta in deltas.items() if delta < 0}
+    credits = {user_id: delta for user_id, delta in deltas.items() if delta > 0}
+    markers = [
+      self._applied_marker(item["transfer_id"], item["sender_id"], item["receiver_id"], float(item["amount"]))
+      for item in claimed
+    ]
+
+    if mongo_session is not None:
+      if markers:
+        try:
+          db.applied_transfers.insert_many(markers, session=mongo_session)
+        except BulkWriteError:
+          # Applied by a concurrent call since we looked
+          raise BatchConflict()
+      ops = [
+        UpdateOne({"_id": user_id, "balance": {"$gte": -delta}}, {"$inc": {"balance": delta}})
+        for user_id, delta in debits.items()
+      ] + [
+        UpdateOne({"_id": user_id}, {"$inc": {"balance": delta}})
+        for user_id, delta in credits.items()
+      ]
+      if ops:
+        result = db.users.bulk_write(ops, ordered=False, session=mongo_session)
+        if result.matched_count != len(ops):
+          raise BatchConflict()
+      return results
+
+    # Without transactions the transfer ids are claimed before any money
+    # moves (as in _transfer_standalone), and each guarded debit is checked
+    # on its own so a lost race can be undone before any receiver is credited.
+    if markers:
+      try:
+        db.applied_transfers.insert_many(markers, ordered=False)
+      except BulkWriteError as e:
+        taken = {error["index"] for error in e.details["writeErrors"]}
+        self._release([marker for index, marker in enumerate(markers) if index not in taken])
+        raise BatchConflict()
+    applied = []
+    for user_id, delta in debits.items():
+      result = db.users.update_one(
+        {"_id": user_id, "balance": {"$gte": -delta}},
+        {"$inc": {"balance": delta}}
+      )
+      if result.matched_count == 0:
+        if applied:
+          db.users.bulk_write([
+            UpdateOne({"_id": applied_id}, {"$inc": {"balance": -applied_delta}})
+            for applied_id, applied_delta in applied
+          ], ordered=False)
+        self._release(markers)
+        raise BatchConflict()
+      applied.append((user_id, delta))
+    if credits:
+      db.users.bulk_write([
+        UpdateOne({"_id": user_id}, {"$inc": {"balance": delta}})
+        for user_id, delta in credits.items()
+      ], ordered=False)
+    return results
\ No newline at end of file
@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify, session, redirect
-from user.models import User
-from passlib.hash import pbkdf2_sha256
+from user.models import User, USER_PROJECTION
 from db import db
 import uuid
+import cache
+from cache import user_key
+from sessions import session_store
+from passwords import password_hasher
+from config import Config
 
 user_bp = Blueprint('user', __name__)
 
+USER_FIELDS = {"name", "email", "balance"}
+
 @user_bp.route('/api/signup/', methods=['POST'])
 def signup():
     return User().signup()
@@ -26,7 +32,28 @@ def get_users():
 
 @user_bp.route("/api/user/<user_id>/", methods=["GET"])
 def get_user_id(user_id):
-    return User().get_user_id(user_id)
+    # Balance-sensitive callers send "Cache-Control: no-cache" to read Mongo
+    bypass_cache = 'no-cache' in request.headers.get('Cache-Control', '')
+    return User().get_user_id(user_id, bypass_cache)
+
+@user_bp.route("/api/user/batch", methods=["POST"])
+def get_users_batch():
+    """Resolve many user ids in one call instead of one GET per id"""
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('ids')
+    if not isinstance(user_ids, list) or not all(isinstance(user_id, str) for user_id in user_ids):
+        return jsonify({"error": "ids must be a list of user ids"}), 400
+    if len(user_ids) > Config.USER_BATCH_MAX_IDS:
+        return jsonify({"error": f"At most {Config.USER_BATCH_MAX_IDS} ids per call"}), 400
+    fields = data.get('fields')
+    if fields is not None:
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            return jsonify({"error": "fields must be a list of field names"}), 400
+        unknown = set(fields) - USER_FIELDS
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    bypass_cache = 'no-cache' in request.headers.get('Cache-Control', '')
+    return User().get_users_batch(user_ids, fields, bypass_cache)
 
 @user_bp.route("/api/user/me", methods=["GET"])
 def get_current_user():
@@ -35,22 +62,24 @@ def get_current_user():
         return jsonify({"error": "Unauthorized"}), 401
     
     token = token.split(' ')[1]
-    user = db.users.find_one({"token": token})
+    user_id = session_store.verify(token)
+    if user_id:
+        user = cache.user_cache.get(user_key(user_id))
+        if user is None:
+            user = db.users.find_one({"_id": user_id}, USER_PROJECTION)
+            if user:
+                cache.user_cache.set(user_key(user_id), user)
+    else:
+        # Tokens stored on the user document predate the session store
+        user = db.users.find_one({"token": token}, USER_PROJECTION)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    # Convert ObjectId to string and remove sensitive data
-    user["_id"] = str(user["_id"])
-    if "password" in user:
-        del user["password"]
-    if "token" in user:
-        del user["token"]
-    
     return jsonify(user)
 
 @user_bp.route("/api/user/<user_id>/balance", methods=["GET"])
 def get_user_balance(user_id):
-    user = db.users.find_one({"_id": user_id})
+    user = db.users.find_one({"_id": user_id}, {"balance": 1})
     if not user:
         return jsonify({"error": "User not found"}), 404
     
@@ -65,4 +94,46 @@ def update_balance(user_id):
     amount = data.get('amount')
     if amount is None:
         return jsonify({"error": "Amount is required"}), 400
-    return User().update_balance(user_id, amount)
\ No newline at end of file
+    return User().update_balance(user_id, amount)
+
+@user_bp.route("/api/user/transfer", methods=["POST"])
+def transfer():
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    sender_id = data.get('sender_id')
+    receiver_id = data.get('receiver_id')
+    amount = data.get('amount')
+    if not all([sender_id, receiver_id, amount]):
+        return jsonify({"error": "Missing required fields"}), 400
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid amount format"}), 400
+    if amount <= 0:
+        return jsonify({"error": "Amount must be positive"}), 400
+    return User().transfer(sender_id, receiver_id, amount, data.get('transfer_id'))
+
+@user_bp.route("/api/user/transfer/batch", methods=["POST"])
+def transfer_batch():
+    data = request.get_json()
+    if not data or not isinstance(data.get('transfers'), list):
+        return jsonify({"error": "transfers list is required"}), 400
+    transfers = data['transfers']
+    for item in transfers:
+        if not isinstance(item, dict) or not all([item.get('sender_id'), item.get('receiver_id'), item.get('amount')]):
+            return jsonify({"error": "Each transfer needs sender_id, receiver_id and amount"}), 400
+        try:
+            if float(item['amount']) <= 0:
+                return jsonify({"error": "Amount must be positive"}), 400
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid amount format"}), 400
+    return User().transfer_batch(transfers)
+
+@user_bp.route("/api/internal/cache-stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify(cache.user_cache.stats())
+
+@user_bp.route("/api/internal/hash-stats", methods=["GET"])
+def get_hash_stats():
+    return jsonify(password_hasher.stats())
\ No newline at end of file